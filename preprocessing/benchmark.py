@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+import sys
+import json
+import time
+import random
+import unicodedata
+import logging
+import argparse
+from typing import Callable, List
+
+from jamo import j2hcj
+from normalizer import Normalizer, SYMBOL_REPLACEMENTS
+from tokenizer import Tokenizer
+
+"""
+Benchmark the preprocessing hot paths against their reference
+implementations, and check that both produce identical output
+
+Example:
+
+$ python3 benchmark.py symbols --sentences 200000
+$ python3 benchmark.py symbols pipeline --input /data/news/bucket_000.json
+"""
+
+# realistic news article fragments (Korean and English) mixed with the
+# kinds of quotes, brackets and spaces that show up in crawled text
+SAMPLE_FRAGMENTS = [
+    '다 522 정통 ‘모피아’(재무부+마피아 합성어)다.',
+    '정부는 “내년 상반기까지 기준금리를 동결하겠다”고 밝혔다.',
+    '《조선일보》에 따르면 【속보】 서울 아파트값이 3주 연속 올랐다.',
+    '한국은행（총재 이주열）은 12일 금융통화위원회를 열고',
+    'The Bank of Korea said on Thursday that “growth will slow”.',
+    'Shares of Samsung Electronics rose 2.1% 〔KRX〕 in early trade.',
+    'hello (this is a test) string and I\'ve run this program thirty-three '
+    'times...',
+    '「국민의 뜻」을 받들어　개혁을 추진하겠다',
+    '‹ EU › officials met in Brussels — again.',
+    '❛기자❜ ❨사진❩ ⟦단독⟧ ❴부록❵',
+    '서울=연합뉴스) 홍길동 기자 = 전국에 비가 내리겠다.​',
+    '｢반도체 수출｣ ＂사상 최대＂ 〈전망〉',
+]
+
+"""
+Original normalize_symbols(): one str.replace() pass for every character in
+every symbol table
+"""
+
+
+def reference_normalize_symbols(s: str) -> str:
+    for symbols, replacement in SYMBOL_REPLACEMENTS:
+        for c in symbols:
+            s = s.replace(c, replacement)
+
+    s = ' '.join(s.strip().split())
+
+    return s
+
+
+def load_sentences(input_fn: str) -> List[str]:
+    """
+    Load sentences from a json bucket file (same format as preprocess.py
+    input) or from a plain UTF-8 text file with one sentence per line
+    """
+    with open(input_fn, 'r', encoding='utf-8') as fd:
+        if input_fn.endswith('.json'):
+            sentences = []
+            for json_entry in json.load(fd):
+                sentences.extend(json_entry['subtitles'])
+                sentences.extend(json_entry['body'].split('\n'))
+        else:
+            sentences = fd.read().split('\n')
+    return [ln for ln in sentences if ln.strip()]
+
+
+def generate_sentences(count: int, seed: int = 0) -> List[str]:
+    rnd = random.Random(seed)
+    sentences = []
+    for _ in range(count):
+        fragments = rnd.sample(SAMPLE_FRAGMENTS, rnd.randint(1, 4))
+        sentences.append(' '.join(fragments))
+    return sentences
+
+
+def time_function(fn: Callable[[str], object], sentences: List[str],
+                  repeat: int) -> (float, list):
+    best = None
+    out = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = [fn(s) for s in sentences]
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, out
+
+
+def compare(name: str, reference: Callable[[str], object],
+            candidate: Callable[[str], object], sentences: List[str],
+            repeat: int, total_chars: int = None, unit: str = 'sentences'):
+    if total_chars is None:
+        total_chars = sum(len(s) for s in sentences)
+    ref_time, ref_out = time_function(reference, sentences, repeat)
+    new_time, new_out = time_function(candidate, sentences, repeat)
+
+    mismatches = sum(1 for a, b in zip(ref_out, new_out) if a != b)
+
+    print('%s: %d %s, %.2f MB of text' %
+          (name, len(sentences), unit, total_chars / 1048576.0))
+    print('  reference: %8.3fs (%8.2f MB/s)' %
+          (ref_time, total_chars / 1048576.0 / ref_time))
+    print('  optimized: %8.3fs (%8.2f MB/s)' %
+          (new_time, total_chars / 1048576.0 / new_time))
+    print('  speedup:   %8.2fx' % (ref_time / new_time))
+    print('  mismatches: %d' % mismatches)
+
+    return mismatches
+
+
+def bench_symbols(sentences: List[str], repeat: int) -> int:
+    return compare('normalize_symbols', reference_normalize_symbols,
+                   Normalizer.normalize_symbols, sentences, repeat)
+
+
+"""
+Original Tokenizer.tokenize(): unicodedata.category() and a token buffer
+grown one character at a time
+"""
+
+
+def reference_tokenize(input_str: str, keep_punctuation: bool = True,
+                       keep_symbols: bool = True) -> List[str]:
+    tokens = []
+    last_str = ''
+    for c in input_str:
+        cat = unicodedata.category(c)
+        if cat.startswith('Z'):
+            if last_str:
+                tokens.append(last_str)
+            last_str = ''
+        elif cat.startswith('P') or cat.startswith('S'):
+            if last_str:
+                tokens.append(last_str)
+            if (keep_punctuation and cat.startswith('P')) or \
+                    (keep_symbols and cat.startswith('S')):
+                tokens.append(c)
+            last_str = ''
+        else:
+            last_str += c
+    if last_str:
+        tokens.append(last_str)
+    return tokens
+
+
+def bench_tokenize(sentences: List[str], repeat: int) -> int:
+    failed = 0
+    for keep_punctuation in (True, False):
+        for keep_symbols in (True, False):
+            failed += compare(
+                'tokenize(keep_punctuation=%s, keep_symbols=%s)' %
+                (keep_punctuation, keep_symbols),
+                lambda s: reference_tokenize(s, keep_punctuation,
+                                             keep_symbols),
+                lambda s: Tokenizer.tokenize(s, keep_punctuation,
+                                             keep_symbols),
+                sentences, repeat)
+    return failed
+
+
+"""
+Original normalize_to_compatibility_jamo(): output built one character at a
+time
+"""
+
+
+def reference_compatibility_jamo(s: str) -> str:
+    out = ''
+    for c in s:
+        if Normalizer.is_non_compatibility_jamo(c):
+            out += j2hcj(c)
+        else:
+            out += c
+    assert len(s) == len(out)
+    return out
+
+
+def bench_jamo(sentences: List[str], repeat: int) -> int:
+    # NFD spells every Hangul syllable with conjoining Jamo
+    hangul = [unicodedata.normalize('NFD', s) for s in sentences]
+    ascii_only = [s.encode('ascii', 'ignore').decode('ascii')
+                  for s in sentences]
+
+    failed = 0
+    for name, inputs in (('Hangul-heavy', hangul), ('mixed', sentences),
+                         ('pure ASCII', ascii_only)):
+        failed += compare('normalize_to_compatibility_jamo (%s)' % name,
+                          reference_compatibility_jamo,
+                          Normalizer.normalize_to_compatibility_jamo,
+                          inputs, repeat)
+    return failed
+
+
+"""
+Normalize -> tokenize -> join chain that get_tagged_outputs() feeds to Komoran
+"""
+
+
+def reference_pipeline(s: str) -> str:
+    return ' '.join(Tokenizer.tokenize(Normalizer.normalize(s),
+                                       keep_punctuation=False,
+                                       keep_symbols=False))
+
+
+def fused_pipeline(s: str) -> str:
+    return ' '.join(Normalizer.normalize_and_tokenize(s,
+                                                      keep_punctuation=False,
+                                                      keep_symbols=False))
+
+
+def bench_pipeline(sentences: List[str], repeat: int) -> int:
+    return compare('normalize+tokenize', reference_pipeline, fused_pipeline,
+                   sentences, repeat)
+
+
+"""
+The same chain over a whole article at a time, as get_tagged_outputs() runs it
+"""
+
+BATCH_SENTENCES = 20
+
+
+def reference_batch_pipeline(batch: List[str]) -> List[str]:
+    return [reference_pipeline(s) for s in batch]
+
+
+def fused_batch_pipeline(batch: List[str]) -> List[str]:
+    return [' '.join(tokens) for tokens in
+            Normalizer.normalize_and_tokenize_batch(batch,
+                                                    keep_punctuation=False,
+                                                    keep_symbols=False)]
+
+
+def bench_batch(sentences: List[str], repeat: int) -> int:
+    batches = [sentences[i:i + BATCH_SENTENCES]
+               for i in range(0, len(sentences), BATCH_SENTENCES)]
+    return compare('normalize+tokenize (batches of %d sentences)' %
+                   BATCH_SENTENCES, reference_batch_pipeline,
+                   fused_batch_pipeline, batches, repeat,
+                   total_chars=sum(len(s) for s in sentences), unit='batches')
+
+
+BENCHMARKS = {
+    'batch': bench_batch,
+    'jamo': bench_jamo,
+    'symbols': bench_symbols,
+    'pipeline': bench_pipeline,
+    'tokenize': bench_tokenize,
+}
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s',
+                        level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Benchmark preprocessing '
+                                                 'against reference '
+                                                 'implementations')
+    parser.add_argument('benchmark', type=str, choices=sorted(BENCHMARKS),
+                        nargs='+', help='Benchmark(s) to run')
+    parser.add_argument('--input', type=str, default=None,
+                        help='Json bucket file or text file with one '
+                             'sentence per line (default: generated '
+                             'Korean/English sentences)')
+    parser.add_argument('--sentences', type=int, default=100000,
+                        help='Number of sentences to generate when no '
+                             '--input is given (default 100000)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Report the best of N runs (default 3)')
+
+    args = parser.parse_args()
+
+    if args.input:
+        sentences = load_sentences(args.input)
+    else:
+        sentences = generate_sentences(args.sentences)
+
+    failed = False
+    for name in args.benchmark:
+        if BENCHMARKS[name](sentences, args.repeat):
+            failed = True
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+import h5py
+import numpy as np
+from typing import List
+from multiprocessing import Queue
+
+"""
+Single HDF5 output of preprocess.py: tagged documents of every input file as
+chunked, compressed numeric datasets
+
+    input_files             names of the input json files
+    doc_file                input file index of each document
+    doc_entry               entry index of each document in its input file
+    doc_summary_sentences   number of summary sentences of each document
+                            (they come first, followed by the body)
+    doc_sentence_offsets    sentences of document d are
+                            [doc_sentence_offsets[d], doc_sentence_offsets[d+1])
+    sentences               sentence texts
+    sentence_morph_offsets  morphemes of sentence s are
+                            [sentence_morph_offsets[s],
+                             sentence_morph_offsets[s+1])
+    morphs                  vocabulary id of each morpheme
+    tags                    tag code of each morpheme
+    vocab                   morpheme string of each vocabulary id
+    tag_names               POS tag of each tag code
+
+Documents are appended in the order they are written, which may interleave
+input files; doc_file/doc_entry give their origin.
+
+Every flush also appends the new vocabulary and tag names and records a
+checkpoint (attributes checkpoint_counts, checkpoint_entries,
+checkpoint_complete and checkpoint_stage0_offsets: the length of every
+dataset, and per input file the entries written, whether the file is
+finished and the end of those entries in its .stage0 output), so that an
+interrupted run can be resumed: HDF5Stage0Writer(..., resume=True) drops
+whatever was written after the last checkpoint, and read_checkpoint() tells
+which entries of which input files are already in the file. A new file
+starts with an empty checkpoint, so a run killed before its first flush
+resumes from the beginning.
+"""
+
+_STR_DTYPE = h5py.special_dtype(vlen=str)
+
+# (name, dtype, initial data)
+_DATASETS = (
+    ('doc_file', 'u4', []),
+    ('doc_entry', 'u4', []),
+    ('doc_summary_sentences', 'u4', []),
+    ('doc_sentence_offsets', 'u8', [0]),
+    ('sentences', _STR_DTYPE, []),
+    ('sentence_morph_offsets', 'u8', [0]),
+    ('morphs', 'u4', []),
+    ('tags', 'u1', []),
+    ('vocab', _STR_DTYPE, []),
+    ('tag_names', _STR_DTYPE, []),
+)
+
+# dataset lengths recorded in checkpoint_counts
+_COUNTS = ('doc_count', 'sentence_count', 'morph_count', 'vocab_count',
+           'tag_count')
+
+
+def _dataset_lengths(counts: dict) -> dict:
+    doc_count = counts['doc_count']
+    sentence_count = counts['sentence_count']
+    return {'doc_file': doc_count,
+            'doc_entry': doc_count,
+            'doc_summary_sentences': doc_count,
+            'doc_sentence_offsets': doc_count + 1,
+            'sentences': sentence_count,
+            'sentence_morph_offsets': sentence_count + 1,
+            'morphs': counts['morph_count'],
+            'tags': counts['morph_count'],
+            'vocab': counts['vocab_count'],
+            'tag_names': counts['tag_count']}
+
+
+def read_checkpoint(fn: str, input_files: List[str]):
+    """
+    Entries written, completion flags and .stage0 offsets per input file at
+    the last checkpoint of the HDF5 output fn
+    """
+    with h5py.File(fn, 'r') as f:
+        if list(f['input_files'].asstr()[:]) != list(input_files):
+            raise ValueError('%s was written from different input files' % fn)
+        return ([int(n) for n in f.attrs['checkpoint_entries']],
+                [bool(c) for c in f.attrs['checkpoint_complete']],
+                [int(n) for n in f.attrs['checkpoint_stage0_offsets']])
+
+
+class HDF5Stage0Writer(object):
+    """
+    Append tagged documents to the HDF5 output, buffering them in memory and
+    writing every dataset with one resize and slice assignment per flush
+    """
+
+    def __init__(self, fn: str, input_files: List[str],
+                 flush_documents: int = 1024, chunk_rows: int = 65536,
+                 compression: str = 'gzip', compression_level: int = 4,
+                 resume: bool = False):
+        self.flush_documents = flush_documents
+
+        self.vocab = {}
+        self.tag_codes = {}
+        self.entries_done = [0] * len(input_files)
+        self.complete = [False] * len(input_files)
+        self.stage0_offsets = [0] * len(input_files)
+
+        if resume:
+            self._resume(fn, input_files)
+        else:
+            self.f = h5py.File(fn, 'w')
+            self.f.create_dataset('input_files', data=input_files,
+                                  dtype=_STR_DTYPE)
+            for name, dtype, data in _DATASETS:
+                dset = self.f.create_dataset(
+                    name, (len(data),), dtype=dtype, maxshape=(None,),
+                    chunks=(chunk_rows,), compression=compression,
+                    compression_opts=compression_level)
+                if data:
+                    dset[:] = data
+
+            self.doc_count = 0
+            self.sentence_count = 0
+            self.morph_count = 0
+            # an empty checkpoint, for a run killed before its first flush
+            self._write_checkpoint()
+
+        self._reset_buffers()
+
+    def _resume(self, fn: str, input_files: List[str]):
+        self.entries_done, self.complete, self.stage0_offsets = \
+            read_checkpoint(fn, input_files)
+        self.f = h5py.File(fn, 'a')
+
+        counts = dict(zip(_COUNTS, (int(n) for n in
+                                    self.f.attrs['checkpoint_counts'])))
+        for name, length in _dataset_lengths(counts).items():
+            self.f[name].resize((length,))
+
+        for name, table in (('vocab', self.vocab),
+                            ('tag_names', self.tag_codes)):
+            for s in self.f[name].asstr()[:]:
+                table[s] = len(table)
+
+        self.doc_count = counts['doc_count']
+        self.sentence_count = counts['sentence_count']
+        self.morph_count = counts['morph_count']
+
+    def _reset_buffers(self):
+        self.buffers = {name: [] for name, _, _ in _DATASETS}
+
+    def _intern(self, table: dict, added: list, s: str) -> int:
+        # added collects the new strings to append at the next flush
+        code = table.get(s)
+        if code is None:
+            code = table[s] = len(table)
+            added.append(s)
+        return code
+
+    def write(self, file_idx: int, entry_idx: int, doc: dict,
+              stage0_offset: int = 0):
+        buffers = self.buffers
+
+        sentences = list(doc['summary']) + list(doc['body'])
+        for text, tagged in sentences:
+            buffers['sentences'].append(text)
+            for morph, tag in tagged:
+                if tag not in self.tag_codes and len(self.tag_codes) == 256:
+                    raise ValueError('more than 256 distinct POS tags')
+                buffers['morphs'].append(
+                    self._intern(self.vocab, buffers['vocab'], morph))
+                buffers['tags'].append(
+                    self._intern(self.tag_codes, buffers['tag_names'], tag))
+            self.morph_count += len(tagged)
+            buffers['sentence_morph_offsets'].append(self.morph_count)
+
+        self.sentence_count += len(sentences)
+        buffers['doc_file'].append(file_idx)
+        buffers['doc_entry'].append(entry_idx)
+        buffers['doc_summary_sentences'].append(len(doc['summary']))
+        buffers['doc_sentence_offsets'].append(self.sentence_count)
+        self.doc_count += 1
+        self.entries_done[file_idx] = entry_idx + 1
+        self.stage0_offsets[file_idx] = stage0_offset
+
+        if len(buffers['doc_file']) >= self.flush_documents:
+            self.flush()
+
+    def mark_complete(self, file_idx: int):
+        self.complete[file_idx] = True
+
+    def flush(self):
+        for name, dtype, _ in _DATASETS:
+            values = self.buffers[name]
+            if not values:
+                continue
+            dset = self.f[name]
+            n = dset.shape[0]
+            dset.resize((n + len(values),))
+            if dtype == _STR_DTYPE:
+                dset[n:] = np.array(values, dtype=object)
+            else:
+                dset[n:] = np.array(values, dtype=dtype)
+        self._reset_buffers()
+        self._write_checkpoint()
+
+    def _write_checkpoint(self):
+        self.f.attrs['checkpoint_counts'] = np.array(
+            [self.doc_count, self.sentence_count, self.morph_count,
+             len(self.vocab), len(self.tag_codes)], dtype='u8')
+        self.f.attrs['checkpoint_entries'] = np.array(self.entries_done,
+                                                      dtype='u8')
+        self.f.attrs['checkpoint_complete'] = np.array(self.complete,
+                                                       dtype='u1')
+        self.f.attrs['checkpoint_stage0_offsets'] = np.array(
+            self.stage0_offsets, dtype='u8')
+        self.f.attrs['doc_count'] = self.doc_count
+        self.f.flush()
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+
+'''
+Writer process: append every (file_idx, first_entry_idx, docs,
+stage0_offsets, is_last) batch received on the queue to the HDF5 output,
+until None is received; stage0_offsets holds the end of each document in
+the .stage0 output of its file, or is None without one
+'''
+def write_from_queue(fn: str, input_files: List[str], queue: Queue,
+                     resume: bool = False):
+    writer = HDF5Stage0Writer(fn, input_files, resume=resume)
+    while True:
+        item = queue.get()
+        if item is None:
+            break
+        file_idx, first_entry_idx, docs, stage0_offsets, is_last = item
+        for i, doc in enumerate(docs):
+            writer.write(file_idx, first_entry_idx + i, doc,
+                         stage0_offsets[i] if stage0_offsets else 0)
+        if is_last:
+            writer.mark_complete(file_idx)
+    writer.close()
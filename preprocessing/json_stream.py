@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import re
+import json
+import codecs
+from typing import IO
+
+'''
+Incremental reading and writing of a top-level json array, so that a bucket
+file never has to be held in memory as a whole
+
+JsonArrayReader is the decoding half of JsonArrayScanner in
+utilities/json_array_scanner.py (the converters there also need the raw
+element text and resumable offsets); the scripts of each directory only
+import their siblings, so preprocessing/ keeps this copy.
+'''
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class JsonArrayReader(object):
+    """
+    Iterate over the decoded elements of the top-level json array in a
+    binary file, reading block_size bytes at a time
+
+    bytes_read is the number of input bytes consumed so far (at block
+    granularity), which is what progress reporting is based on. Anything
+    but whitespace after the closing bracket is an error.
+    """
+
+    def __init__(self, fd: IO[bytes], encoding: str = 'utf-8',
+                 block_size: int = 1 << 20):
+        self.fd = fd
+        self.encoding = encoding
+        self.block_size = block_size
+        self.bytes_read = 0
+
+    def __iter__(self):
+        decoder = json.JSONDecoder()
+        text_decoder = codecs.getincrementaldecoder(self.encoding)()
+        buf = ''
+        pos = 0
+        eof = False
+        # '[' before the array, 'value' before an element (or the closing
+        # bracket of an empty array), 'element' before an element, ',' after
+        # an element, ']' after the array
+        expect = '['
+
+        while True:
+            pos = _WHITESPACE.match(buf, pos).end()
+
+            need_more = pos == len(buf)
+            if not need_more:
+                c = buf[pos]
+                if expect == ']':
+                    raise ValueError('unexpected data after the JSON array')
+                elif expect == '[':
+                    if c != '[':
+                        raise ValueError('input is not a JSON array')
+                    pos += 1
+                    expect = 'value'
+                    continue
+                elif c == ']' and expect != 'element':
+                    pos += 1
+                    expect = ']'
+                    continue
+                elif expect == ',':
+                    if c != ',':
+                        raise ValueError('expected "," or "]" after an '
+                                         'array element')
+                    pos += 1
+                    expect = 'element'
+                    continue
+
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    need_more = True
+                else:
+                    # the element only counts as complete once the next
+                    # delimiter is buffered (a number cut short at the end
+                    # of the buffer, e.g. "-1.", still decodes)
+                    delim = _WHITESPACE.match(buf, end).end()
+                    if not eof and (delim == len(buf) or
+                                    buf[delim] not in ',]'):
+                        need_more = True
+                    else:
+                        yield obj
+                        pos = end
+                        expect = ','
+
+            if need_more:
+                if eof:
+                    if expect == ']':
+                        return
+                    raise ValueError('JSON array is truncated' if expect != '['
+                                     else 'no JSON array found')
+                # read at least as much as is pending, so a long element is
+                # decoded again only O(log n) times
+                buf = buf[pos:]
+                pos = 0
+                block = self.fd.read(max(self.block_size, len(buf)))
+                self.bytes_read += len(block)
+                eof = not block
+                buf += text_decoder.decode(block, final=eof)
+
+
+class JsonArrayWriter(object):
+    """
+    Write a json array one element at a time; the output is identical to
+    json.dump() of the whole list with default separators
+
+    offset is the number of bytes written so far (json.dump() escapes every
+    non-ASCII character, so characters and bytes are the same). Passing the
+    offset of an element boundary of an unfinished array, with fd opened for
+    appending at that point, continues the array after its elements.
+    """
+
+    def __init__(self, fd: IO[str], offset: int = 0):
+        self.fd = fd
+        self.count = 0
+        self.offset = offset
+        self.separator = ', ' if offset > len('[') else ''
+        if not offset:
+            self._write('[')
+
+    def _write(self, s: str):
+        self.fd.write(s)
+        self.offset += len(s)
+
+    def write(self, obj):
+        self._write(self.separator + json.dumps(obj))
+        self.separator = ', '
+        self.count += 1
+
+    def flush(self):
+        self.fd.flush()
+
+    def close(self):
+        self._write(']')
+        self.fd.close()
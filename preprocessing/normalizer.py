@@ -1,7 +1,91 @@
 # -*- coding: utf-8 -*-
+import re
 import unicodedata
-from jamo import h2j, j2hcj
+from typing import List
+from jamo import j2hcj
 from unicode_symbols import UnicodeSymbols
+from tokenizer import Tokenizer
+
+'''
+Replacement character for each symbol table, in the order the tables were
+originally applied with str.replace
+'''
+SYMBOL_REPLACEMENTS = (
+    (UnicodeSymbols.SYMBOLS_LEFTQUOTES, "'"),
+    (UnicodeSymbols.SYMBOLS_RIGHTQUOTES, "'"),
+    (UnicodeSymbols.SYMBOLS_GRAVE, "'"),
+    (UnicodeSymbols.SYMBOLS_LEFTPARENTHESES, '('),
+    (UnicodeSymbols.SYMBOLS_RIGHTPARENTHESES, ')'),
+    (UnicodeSymbols.SYMBOLS_LEFTSQUAREBRACKET, '['),
+    (UnicodeSymbols.SYMBOLS_RIGHTSQUAREBRACKET, ']'),
+    (UnicodeSymbols.SYMBOLS_LEFTANGLEBRACKET, '<'),
+    (UnicodeSymbols.SYMBOLS_RIGHTANGLEBRACKET, '>'),
+    (UnicodeSymbols.SYMBOLS_LEFTCURLYBRACKET, '{'),
+    (UnicodeSymbols.SYMBOLS_RIGHTCURLYBRACKET, '}'),
+    (UnicodeSymbols.SYMBOLS_WHITESPACE, ' '),
+)
+
+
+def compile_symbol_translation() -> dict:
+    """
+    Compile the symbol tables into a single {character: replacement} map
+
+    A character listed in several tables (e.g., U+2039 is both a quote and
+    an angle bracket) keeps the replacement of the first table, which is
+    what applying the tables one after another used to produce. Characters
+    that map to themselves are left out.
+    """
+    table = {}
+    for symbols, replacement in SYMBOL_REPLACEMENTS:
+        for c in symbols:
+            assert len(c) == 1, 'symbol table entry %r is not a single ' \
+                                'character' % c
+            table.setdefault(c, replacement)
+    return {c: r for c, r in table.items() if c != r}
+
+
+_SYMBOL_TRANSLATION = compile_symbol_translation()
+
+# one character class over every symbol that needs replacing, so a sentence
+# is scanned once and only the matches cost a dictionary lookup
+# (str.translate looks up every character, which is slower on Korean text)
+_SYMBOL_PATTERN = re.compile('[%s]' % ''.join(
+    re.escape(c) for c in sorted(_SYMBOL_TRANSLATION)))
+
+
+def _replace_symbol(m) -> str:
+    return _SYMBOL_TRANSLATION[m.group()]
+
+
+# HANGUL JAMO (U+1100-U+11FF) to compatibility Jamo
+_JAMO_TRANSLATION = {chr(cp): j2hcj(chr(cp)) for cp in range(0x1100, 0x1200)
+                     if j2hcj(chr(cp)) != chr(cp)}
+_JAMO_TABLE = str.maketrans(_JAMO_TRANSLATION)
+_NON_COMPATIBILITY_JAMO_PATTERN = re.compile('[\u1100-\u11ff]')
+
+# everything normalize() rewrites character by character, folded into one
+# map for normalize_and_tokenize(): symbols, jamo, and the whitespace that
+# str.split() collapses but the tokenizer does not split on (control
+# characters such as \t, \n and U+0085; all whitespace is below U+3001)
+_FUSED_TRANSLATION = dict(_JAMO_TRANSLATION)
+_FUSED_TRANSLATION.update((chr(cp), ' ') for cp in range(0x3001)
+                          if chr(cp).isspace() and not
+                          unicodedata.category(chr(cp)).startswith('Z'))
+_FUSED_TRANSLATION.update(_SYMBOL_TRANSLATION)
+
+_FUSED_PATTERN = re.compile('[%s]' % ''.join(
+    re.escape(c) for c in sorted(_FUSED_TRANSLATION)))
+
+
+def _replace_fused(m) -> str:
+    return _FUSED_TRANSLATION[m.group()]
+
+
+# joins the sentences of a batch so they can be normalized as one string:
+# it is left alone by every table, and NFKC never composes it with a
+# neighbouring character
+_BATCH_SEPARATOR = '\x00'
+
 
 '''
 Singleton class that handles normalization of Unicode input strings, and
@@ -31,6 +115,77 @@ class Normalizer(object):
 
         return n_s
 
+    """
+    Normalize and tokenize the specified string in one go, returning the
+    same tokens as Tokenizer.tokenize(Normalizer.normalize(s), ...)
+
+    Symbol, whitespace and jamo replacements are applied together, and
+    whitespace is not collapsed first since the tokenizer splits on it
+    anyway.
+    """
+
+    @staticmethod
+    def normalize_and_tokenize(s: str, keep_punctuation: bool = True,
+                               keep_symbols: bool = True) -> List[str]:
+        n_s = unicodedata.normalize('NFKC', s.strip())
+        n_s = _FUSED_PATTERN.sub(_replace_fused, n_s)
+        return Tokenizer.tokenize(n_s,
+                                  keep_punctuation=keep_punctuation,
+                                  keep_symbols=keep_symbols)
+
+    """
+    Normalize a list of sentences (e.g., a whole document) and return the
+    normalized forms, identical to calling normalize() on each one
+
+    NFKC and the symbol/jamo replacements run once over the joined batch
+    instead of once per sentence.
+    """
+
+    @staticmethod
+    def normalize_batch(sentences: List[str]) -> List[str]:
+        if not sentences:
+            return []
+
+        joined = _BATCH_SEPARATOR.join([s.strip() for s in sentences])
+        if joined.count(_BATCH_SEPARATOR) != len(sentences) - 1:
+            # separator occurs in the input itself
+            return [Normalizer.normalize(s) for s in sentences]
+
+        n_joined = unicodedata.normalize('NFKC', joined)
+        n_joined = _FUSED_PATTERN.sub(_replace_fused, n_joined)
+
+        return [' '.join(n_s.split())
+                for n_s in n_joined.split(_BATCH_SEPARATOR)]
+
+    """
+    Normalize and tokenize a list of sentences in one go, returning the
+    same token lists as calling normalize_and_tokenize() on each one
+
+    NFKC and the fused replacements run once over the joined batch, and the
+    tokenizer splits on whitespace anyway, so it is not collapsed.
+    """
+
+    @staticmethod
+    def normalize_and_tokenize_batch(sentences: List[str],
+                                     keep_punctuation: bool = True,
+                                     keep_symbols: bool = True) \
+            -> List[List[str]]:
+        if not sentences:
+            return []
+
+        joined = _BATCH_SEPARATOR.join([s.strip() for s in sentences])
+        if joined.count(_BATCH_SEPARATOR) != len(sentences) - 1:
+            # separator occurs in the input itself
+            return [Normalizer.normalize_and_tokenize(
+                        s, keep_punctuation=keep_punctuation,
+                        keep_symbols=keep_symbols) for s in sentences]
+
+        n_joined = unicodedata.normalize('NFKC', joined)
+        n_joined = _FUSED_PATTERN.sub(_replace_fused, n_joined)
+        return Tokenizer.tokenize_batch(n_joined.split(_BATCH_SEPARATOR),
+                                        keep_punctuation=keep_punctuation,
+                                        keep_symbols=keep_symbols)
+
     """
     Normalize symbols in the string and return the normalized form
     e.g., convert Asian quotes to normal quotes
@@ -42,41 +197,11 @@ class Normalizer(object):
     @staticmethod
     def normalize_symbols(s: str) -> str:
         # 1. Normalize quotes, parentheses, square brackets, angle brackets,
-        # and curly brackets
-
-        for c in UnicodeSymbols.SYMBOLS_LEFTQUOTES:
-            s = s.replace(c, "'")
-        for c in UnicodeSymbols.SYMBOLS_RIGHTQUOTES:
-            s = s.replace(c, "'")
-        for c in UnicodeSymbols.SYMBOLS_GRAVE:
-            s = s.replace(c, "'")
-
-        for c in UnicodeSymbols.SYMBOLS_LEFTPARENTHESES:
-            s = s.replace(c, '(')
-        for c in UnicodeSymbols.SYMBOLS_RIGHTPARENTHESES:
-            s = s.replace(c, ')')
-
-        for c in UnicodeSymbols.SYMBOLS_LEFTSQUAREBRACKET:
-            s = s.replace(c, '[')
-        for c in UnicodeSymbols.SYMBOLS_RIGHTSQUAREBRACKET:
-            s = s.replace(c, ']')
-
-        for c in UnicodeSymbols.SYMBOLS_LEFTANGLEBRACKET:
-            s = s.replace(c, '<')
-        for c in UnicodeSymbols.SYMBOLS_RIGHTANGLEBRACKET:
-            s = s.replace(c, '>')
-
-        for c in UnicodeSymbols.SYMBOLS_LEFTCURLYBRACKET:
-            s = s.replace(c, '{')
-        for c in UnicodeSymbols.SYMBOLS_RIGHTCURLYBRACKET:
-            s = s.replace(c, '}')
-
-        # 3. Normalize spaces
-        for c in UnicodeSymbols.SYMBOLS_WHITESPACE:
-            s = s.replace(c, ' ')
-
-        # replace double spaces with single spaces
-        s = ' '.join(s.strip().split())
+        # curly brackets and spaces in a single pass
+        s = _SYMBOL_PATTERN.sub(_replace_symbol, s)
+
+        # 2. replace double spaces with single spaces
+        s = ' '.join(s.split())
 
         return s
 
@@ -89,10 +214,7 @@ class Normalizer(object):
     def is_non_compatibility_jamo(c: str) -> bool:
         assert len(c) == 1
         # HANGUL JAMO: (U+1100-U+11FF)
-        if ord(c) >= 0x1100 and ord(c) <= 0x11FF:
-            return True
-        else:
-            return False
+        return 0x1100 <= ord(c) <= 0x11FF
 
     """
     Normalize all Korean characters in the specified string
@@ -101,14 +223,10 @@ class Normalizer(object):
 
     @staticmethod
     def normalize_to_compatibility_jamo(s: str) -> str:
-        out = ''
-        for c in s:
-            if Normalizer.is_non_compatibility_jamo(c):
-                out += j2hcj(c)
-            else:
-                out += c
-        assert len(s) == len(out)
-        return out
+        # most sentences have no conjoining Jamo left after NFKC
+        if not _NON_COMPATIBILITY_JAMO_PATTERN.search(s):
+            return s
+        return s.translate(_JAMO_TABLE)
 
     def __init__(self):
         assert None, 'singleton class should not be instantiated'
\ No newline at end of file
@@ -2,19 +2,24 @@
 import sys
 import argparse
 import logging
-import json
-import konlpy
+import threading
 #import copy
+from typing import List
+from queue import Full
 
 from konlpy.tag import Komoran
 from os import listdir
-from os.path import isfile, join
-from multiprocessing import Pool
+from os.path import isfile, join, getsize, exists
+from multiprocessing import Pool, Process, Queue
 from normalizer import Normalizer
 from tokenizer import Tokenizer
+from json_stream import JsonArrayReader, JsonArrayWriter
+from stage0 import MAGIC, Stage0Writer
+from hdf5_output import read_checkpoint, write_from_queue
 
 """
 Preprocess several files in parallel, and then write them to a single HDF5 file
+(see hdf5_output.py for its layout)
 """
 
 
@@ -37,65 +42,295 @@ sys.exit(1)
 omit_tags = set(['SF','SE','SS','SP','SO','SW','EF','EP','EC','ETM','JKS','JKC',
             'JKG','JKO','JKB', 'JKV','JKQ','JC','JX','VCP','XSA'])
 
-def get_tagged_output(komoran: Komoran, input_sentence: str) -> str:
-    # normalize punctuation, etc...
-    #print('In:', ln)
-    ln = Normalizer.normalize(input_sentence)
-    tk = Tokenizer.tokenize(ln,
-                            keep_punctuation=False,
-                            keep_symbols=False)
-    pos_tags = komoran.pos(' '.join(tk))
-    filtered_pos_tags = list(filter(lambda t: t[1] not in omit_tags,
-                                    pos_tags))
-    #print('Out:', filtered_pos_tags)
-    return filtered_pos_tags
+"""
+Tag a batch of sentences (e.g., every line of an article), normalizing and
+tokenizing the whole batch at once
+"""
+def get_tagged_outputs(komoran: Komoran, input_sentences: List[str]) -> List:
+    tokenized = Normalizer.normalize_and_tokenize_batch(
+        input_sentences, keep_punctuation=False, keep_symbols=False)
+    return [list(filter(lambda t: t[1] not in omit_tags,
+                        komoran.pos(' '.join(tk))))
+            for tk in tokenized]
+
+# batches handed to the pool but not yet written, per worker
+MAX_BATCHES_IN_FLIGHT_PER_WORKER = 4
+
+# Komoran tagger of the current worker process (see init_worker())
+komoran = None
 
 '''
-Pre-process the entries in the specified json file and output
-to same filename + .stage0
+Pool initializer: start one Komoran (JVM and dictionaries) per worker
+process and keep it for the worker's whole life
 '''
-def json_process(json_fn: str):
-    logging.info('Processing %s...' % json_fn)
-
-    file_title = json_fn.rsplit('/', 1)[-1]
+def init_worker():
+    global komoran
     komoran = Komoran()
-    json_data = None
-    with open(json_fn, 'r', encoding='utf-8') as fd:
-        json_data = json.load(fd)
-
-    cnt = len(json_data)
-    out_data = []
-    for i, json_entry in enumerate(json_data):
-        if i % 100 == 0:
-            logging.info('Progress[%s]: %d/%d (%.2f%%)' % (file_title, i, cnt,
-                                                           100.0 *
-                                                           float(i) \
-                                                           / float(cnt)))
 
+'''
+Pool task: tag a batch of articles with the worker's Komoran
+
+task is (file_idx, batch_idx, is_last, weight, json_entries); the result
+carries the same bookkeeping fields with the output entries in place of the
+input entries.
+'''
+def tag_articles(task: tuple) -> tuple:
+    file_idx, batch_idx, is_last, weight, json_entries = task
+
+    entry_lines = []
+    sentences = []
+    for json_entry in json_entries:
+        summary_lines = [ln.strip() for ln in json_entry['subtitles']]
+        summary_lines = [ln for ln in summary_lines if ln]
+        body_lines = [ln.strip() for ln in json_entry['body'].split('\n')]
+        body_lines = [ln for ln in body_lines if ln]
+
+        entry_lines.append((summary_lines, body_lines))
+        sentences.extend(summary_lines)
+        sentences.extend(body_lines)
+
+    t_os = get_tagged_outputs(komoran, sentences)
+
+    out_entries = []
+    pos = 0
+    for summary_lines, body_lines in entry_lines:
         out_entry = {}
         #out_entry = copy.deepcopy(json_entry)
 
-        summary_sentences = []
-        for ln in json_entry['subtitles']:
-            ln = ln.strip()
-            if ln:
-                t_o = get_tagged_output(komoran, ln)
-                summary_sentences.append((ln, t_o))
+        summary_end = pos + len(summary_lines)
+        body_end = summary_end + len(body_lines)
 
-        body_sentences = []
-        for ln in json_entry['body'].split('\n'):
-            ln = ln.strip()
-            if ln:
-                t_o = get_tagged_output(komoran, ln)
-                body_sentences.append((ln, t_o))
+        out_entry['body'] = list(zip(body_lines, t_os[summary_end:body_end]))
+        out_entry['summary'] = list(zip(summary_lines, t_os[pos:summary_end]))
 
-        out_entry['body'] = body_sentences
-        out_entry['summary'] = summary_sentences
+        out_entries.append(out_entry)
+        pos = body_end
 
-        out_data.append(out_entry)
+    return file_idx, batch_idx, is_last, weight, out_entries
 
-    with open(json_fn + '.stage0', 'w', encoding='utf-8') as fd:
-        json.dump(out_data, fd)
+'''
+Stream every input file and split it into tasks of batch_size articles for
+tag_articles()
+
+Entries are parsed one at a time, and each task is weighted by the input
+bytes consumed to fill it, which is what the progress report is based on.
+A file without entries still produces one (empty) task so that its output
+gets written. in_flight is acquired before each task is handed out, so only
+a bounded number of batches is ever held in memory; once stop is set, no
+more tasks are produced.
+
+When resuming, files in skip_files are left out, and the first
+skip_entries[file_idx] entries of the others are parsed but not tagged.
+'''
+def iter_article_batches(input_files: List[str], batch_size: int,
+                         in_flight: threading.Semaphore,
+                         stop: threading.Event,
+                         skip_entries: List[int] = None,
+                         skip_files: set = frozenset()):
+    for file_idx, json_fn in enumerate(input_files):
+        if file_idx in skip_files:
+            continue
+        with open(json_fn, 'rb') as fd:
+            reader = JsonArrayReader(fd)
+            bytes_yielded = 0
+            batch_idx = 0
+            skip = skip_entries[file_idx] if skip_entries else 0
+            # a full batch is held back until the next entry shows whether
+            # it is the last one of the file
+            full_batch = None
+            batch = []
+
+            for json_entry in reader:
+                if skip > 0:
+                    skip -= 1
+                    continue
+                if len(batch) == batch_size:
+                    full_batch, batch = batch, []
+                batch.append(json_entry)
+
+                if full_batch is not None:
+                    in_flight.acquire()
+                    if stop.is_set():
+                        return
+                    yield (file_idx, batch_idx, False,
+                           reader.bytes_read - bytes_yielded, full_batch)
+                    bytes_yielded = reader.bytes_read
+                    batch_idx += 1
+                    full_batch = None
+
+            in_flight.acquire()
+            if stop.is_set():
+                return
+            yield (file_idx, batch_idx, True,
+                   reader.bytes_read - bytes_yielded, batch)
+
+'''
+Open the stage-0 output of the specified input file: json (same filename +
+.stage0) or the binary format of stage0.py (same filename + .stage0.bin)
+
+A json output is continued after its first offset bytes (the entries
+recorded by a checkpoint) when offset is given, and the rest is cut off.
+'''
+def open_stage0_writer(json_fn: str, stage0_format: str, offset: int = 0):
+    if stage0_format == 'binary':
+        return Stage0Writer(json_fn + '.stage0.bin')
+    if offset:
+        with open(json_fn + '.stage0', 'r+b') as fd:
+            fd.truncate(offset)
+        return JsonArrayWriter(open(json_fn + '.stage0', 'a',
+                                    encoding='utf-8'), offset)
+    return JsonArrayWriter(open(json_fn + '.stage0', 'w', encoding='utf-8'))
+
+'''
+Whether the stage-0 output of the specified input file was completely
+written (closed) by an earlier run
+'''
+def stage0_complete(json_fn: str, stage0_format: str) -> bool:
+    if stage0_format == 'none':
+        return True
+    if stage0_format == 'binary':
+        fn = json_fn + '.stage0.bin'
+        if not exists(fn):
+            return False
+        with open(fn, 'rb') as fd:
+            return fd.read(len(MAGIC)) == MAGIC
+    fn = json_fn + '.stage0'
+    if not exists(fn) or getsize(fn) == 0:
+        return False
+    with open(fn, 'rb') as fd:
+        fd.seek(-1, 2)
+        return fd.read(1) == b']'
+
+'''
+Put item on the queue of the HDF5 writer process, raising instead of
+blocking forever once that process has died
+'''
+def put_to_writer(queue: Queue, writer: Process, item):
+    while True:
+        try:
+            queue.put(item, timeout=1.0)
+            return
+        except Full:
+            if not writer.is_alive():
+                # nobody will drain the queue: do not wait for its feeder
+                # thread at exit
+                queue.cancel_join_thread()
+                raise RuntimeError('HDF5 writer process exited with code %s'
+                                   % writer.exitcode)
+
+'''
+Pre-process the entries in the specified json files and output each one
+to same filename + .stage0 (or .stage0.bin), and/or send them in order to
+the HDF5 writer process hdf5_writer through hdf5_queue
+
+Articles of all files are tagged in batches of batch_size, dispatched to
+the pool in any order; results are put back in order per file and written
+to its .stage0 right away. A batch holds its in_flight permit until it is
+written, including while it waits in pending for an earlier batch, so
+memory use depends on the batch size and the number of workers, not on the
+size of the input files or on how far one slow batch falls behind.
+
+Each batch sent to hdf5_queue carries the end offset of every entry in the
+json .stage0 output, and the .stage0 is flushed first, so that a checkpoint
+of the HDF5 output never refers to .stage0 bytes that were not written.
+
+To resume an interrupted run, skip_files are not processed at all, the
+first skip_entries[file_idx] entries of a file are not tagged (their json
+.stage0 output, which ends at stage0_offsets[file_idx], is continued; a
+binary one is rewritten whole, so it needs skip_entries[file_idx] == 0),
+and the first hdf5_skip[file_idx] entries are not sent to hdf5_queue since
+the HDF5 output already has them.
+'''
+def json_process(input_files: List[str], pool: Pool, batch_size: int,
+                 workers: int, stage0_format: str = 'json',
+                 hdf5_queue: Queue = None, hdf5_writer: Process = None,
+                 skip_entries: List[int] = None, hdf5_skip: List[int] = None,
+                 skip_files: set = frozenset(),
+                 stage0_offsets: List[int] = None):
+    total_weight = float(sum(getsize(f) for f in input_files)) or 1.0
+    done_weight = float(sum(getsize(input_files[f]) for f in skip_files))
+
+    # per file: finished batches waiting for an earlier one, next batch
+    # index to write, entries written, index of the last batch (once known),
+    # .stage0 writer
+    pending = [{} for _ in input_files]
+    next_batch = [0] * len(input_files)
+    entries_done = list(skip_entries or [0] * len(input_files))
+    last_batch = [None] * len(input_files)
+    writers = {}
+    files_done = len(skip_files)
+
+    in_flight = threading.Semaphore(MAX_BATCHES_IN_FLIGHT_PER_WORKER *
+                                    workers)
+    stop = threading.Event()
+
+    results = pool.imap_unordered(tag_articles,
+                                  iter_article_batches(input_files,
+                                                       batch_size,
+                                                       in_flight,
+                                                       stop,
+                                                       skip_entries,
+                                                       skip_files))
+    try:
+        for i, result in enumerate(results):
+            file_idx, batch_idx, is_last, weight, out_entries = result
+
+            pending[file_idx][batch_idx] = out_entries
+            if is_last:
+                last_batch[file_idx] = batch_idx
+
+            if stage0_format != 'none' and file_idx not in writers:
+                writers[file_idx] = open_stage0_writer(
+                    input_files[file_idx], stage0_format,
+                    stage0_offsets[file_idx] if stage0_offsets else 0)
+            while next_batch[file_idx] in pending[file_idx]:
+                out_entries = pending[file_idx].pop(next_batch[file_idx])
+                offsets = None
+                if file_idx in writers:
+                    writer = writers[file_idx]
+                    if stage0_format == 'json':
+                        offsets = []
+                        for out_entry in out_entries:
+                            writer.write(out_entry)
+                            offsets.append(writer.offset)
+                        writer.flush()
+                    else:
+                        for out_entry in out_entries:
+                            writer.write(out_entry)
+                if hdf5_queue is not None:
+                    first = entries_done[file_idx]
+                    drop = max(0, hdf5_skip[file_idx] - first) \
+                        if hdf5_skip else 0
+                    is_last_batch = next_batch[file_idx] == \
+                        last_batch[file_idx]
+                    if drop < len(out_entries) or is_last_batch:
+                        put_to_writer(hdf5_queue, hdf5_writer,
+                                      (file_idx, first + drop,
+                                       out_entries[drop:],
+                                       offsets[drop:] if offsets else None,
+                                       is_last_batch))
+                entries_done[file_idx] += len(out_entries)
+                next_batch[file_idx] += 1
+                in_flight.release()
+
+            if last_batch[file_idx] is not None and \
+                    next_batch[file_idx] > last_batch[file_idx]:
+                if file_idx in writers:
+                    writers.pop(file_idx).close()
+                files_done += 1
+
+            done_weight += weight
+            if i % 10 == 0 or files_done == len(input_files):
+                logging.info('Progress: %d/%d files (%.2f%%)' %
+                             (files_done, len(input_files),
+                              100.0 * done_weight / total_weight))
+    finally:
+        # unblock the task feeder if we are bailing out early
+        stop.set()
+        for _ in range(MAX_BATCHES_IN_FLIGHT_PER_WORKER * workers):
+            in_flight.release()
+        for writer in writers.values():
+            writer.fd.close()
 
 if __name__ == '__main__':
     # necessary for seeing logs
@@ -107,7 +342,26 @@ if __name__ == '__main__':
     parser.add_argument('input_dir', type=str,
                         help='Input json bucket files directory (UTF-8)')
     parser.add_argument('output_file', type=str,
-                        help='Base output filename of word2vec/doc2vec model (gensim)')
+                        help='Output HDF5 file of all tagged documents')
+    parser.add_argument('--workers', type=int, default=5,
+                        help='Number of tagging worker processes (default 5)')
+    parser.add_argument('--batch-size', type=int, default=64,
+                        help='Articles per worker task (default 64). Batches '
+                             'are cut across all input files.')
+    parser.add_argument('--stage0-format', type=str, default='json',
+                        choices=['json', 'binary', 'none'],
+                        help='Per-file output format besides the HDF5 file '
+                             '(default "json"): json writes FILE.stage0, '
+                             'binary writes the compact memory-mappable '
+                             'FILE.stage0.bin (see stage0.py), none writes '
+                             'nothing')
+    parser.add_argument('--resume', action='store_true', default=False,
+                        help='Continue an interrupted run from the last '
+                             'checkpoint of output_file: finished files are '
+                             'skipped, entries already in output_file are '
+                             'not tagged again (except with --stage0-format '
+                             'binary, where unfinished .stage0.bin files are '
+                             'rewritten from the first entry)')
     '''
     parser.add_argument('--doc2vec', action='store_true', default=False,
                         help='Generate a doc2vec model instead of a word2vec model')
@@ -151,10 +405,57 @@ if __name__ == '__main__':
     input_files = sorted([join(args.input_dir, f) for f in listdir(args.input_dir)
                    if isfile(join(args.input_dir, f)) and f.endswith('.json')])
 
-    with Pool(5) as p:
-        p.map(json_process, input_files)
+    skip_entries = None
+    hdf5_skip = None
+    skip_files = set()
+    stage0_offsets = None
+    if args.resume:
+        hdf5_skip, complete, stage0_offsets = \
+            read_checkpoint(args.output_file, input_files)
+        skip_files = set(i for i, json_fn in enumerate(input_files)
+                         if complete[i] and
+                         stage0_complete(json_fn, args.stage0_format))
+        if args.stage0_format == 'none':
+            skip_entries = hdf5_skip
+        elif args.stage0_format == 'json':
+            # a .stage0 is continued after the entries of the checkpoint,
+            # unless it does not have them (e.g., the checkpoint was taken
+            # with another --stage0-format), in which case it is written
+            # again from the first entry
+            skip_entries = list(hdf5_skip)
+            for i, json_fn in enumerate(input_files):
+                fn = json_fn + '.stage0'
+                if stage0_offsets[i] == 0 or not exists(fn) or \
+                        getsize(fn) < stage0_offsets[i]:
+                    skip_entries[i] = 0
+                    stage0_offsets[i] = 0
+        # .stage0.bin outputs cannot be appended to, so with the binary
+        # format unfinished files are tagged again from the first entry
+        logging.info('Resuming: %d/%d files done, %d entries already written'
+                     % (len(skip_files), len(input_files), sum(hdf5_skip)))
+
+    # a single process owns the HDF5 file; bounded queue so a slow disk
+    # holds back the main process instead of filling memory
+    hdf5_queue = Queue(maxsize=MAX_BATCHES_IN_FLIGHT_PER_WORKER *
+                       args.workers)
+    hdf5_writer = Process(target=write_from_queue,
+                          args=(args.output_file, input_files, hdf5_queue,
+                                args.resume))
+    hdf5_writer.start()
+
+    try:
+        with Pool(args.workers, initializer=init_worker) as p:
+            json_process(input_files, p, args.batch_size, args.workers,
+                         args.stage0_format, hdf5_queue, hdf5_writer,
+                         skip_entries, hdf5_skip, skip_files, stage0_offsets)
+    finally:
+        if hdf5_writer.is_alive():
+            put_to_writer(hdf5_queue, hdf5_writer, None)
+        hdf5_writer.join()
+
+    if hdf5_writer.exitcode != 0:
+        hdf5_queue.cancel_join_thread()
+        raise RuntimeError('HDF5 writer process exited with code %s'
+                           % hdf5_writer.exitcode)
 
-        #for f in input_files:
-        #    logging.info('Processing %s...' % f)
-        #    json_process(f)
-        #    break
\ No newline at end of file
+    logging.info('Wrote %s' % args.output_file)
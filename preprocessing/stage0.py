@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+import sys
+import mmap
+import array
+import struct
+import logging
+import argparse
+import functools
+
+from json_stream import JsonArrayReader
+
+"""
+Compact binary stage-0 format (output of preprocess.py), with a reader that
+memory-maps the file and decodes any single document on demand
+
+Layout (little-endian, sections aligned to 8 bytes):
+
+    header      magic, version, document/tag/vocabulary counts and the
+                offsets of the sections below
+    documents   one record per document, addressed by the document index:
+                    uint32 summary sentence count, uint32 body sentence count
+                    uint32 (text byte length, morpheme count) per sentence
+                    UTF-8 sentence texts, back to back
+                    uint32 vocabulary id per morpheme
+                    uint8 tag code per morpheme
+    tags        uint32 offsets (tag count + 1), UTF-8 tag names
+    vocabulary  uint64 offsets (vocabulary count + 1), UTF-8 morphemes
+    doc index   uint64 file offset of each document record (+ end offset)
+
+Example:
+
+$ python3 stage0.py /data/news/bucket_000.json.stage0
+    (writes /data/news/bucket_000.json.stage0.bin)
+"""
+
+MAGIC = b'STAGE0\x00\x01'
+VERSION = 1
+
+# magic, version, document count, tag count, vocabulary count,
+# tags offset, vocabulary offset, document index offset
+_HEADER = struct.Struct('<8sIIIIQQQ')
+
+# sentences of a document record, in the order they are stored
+_PARTS = ('summary', 'body')
+
+
+def _align(fd, alignment: int = 8):
+    padding = -fd.tell() % alignment
+    if padding:
+        fd.write(b'\x00' * padding)
+
+
+class Stage0Writer(object):
+    """
+    Write stage-0 documents ({'body': [(sentence, [(morph, tag), ...]), ...],
+    'summary': [...]}) one at a time; morphemes and tags are interned as they
+    are seen, and the lookup tables are written by close()
+    """
+
+    def __init__(self, fn: str):
+        self.fd = open(fn, 'wb')
+        self.fd.write(b'\x00' * _HEADER.size)
+        _align(self.fd)
+
+        self.vocab = {}
+        self.tags = {}
+        self.doc_offsets = array.array('Q')
+
+    def _intern(self, table: dict, s: str) -> int:
+        code = table.get(s)
+        if code is None:
+            code = table[s] = len(table)
+        return code
+
+    def write(self, doc: dict):
+        self.doc_offsets.append(self.fd.tell())
+
+        sentences = [sentence for part in _PARTS for sentence in doc[part]]
+        texts = [text.encode('utf-8') for text, _ in sentences]
+        morph_ids = array.array('I')
+        tag_codes = bytearray()
+        for _, tagged in sentences:
+            for morph, tag in tagged:
+                morph_ids.append(self._intern(self.vocab, morph))
+                tag_code = self._intern(self.tags, tag)
+                if tag_code > 255:
+                    raise ValueError('more than 256 distinct POS tags')
+                tag_codes.append(tag_code)
+
+        sentence_table = array.array('I')
+        for text, (_, tagged) in zip(texts, sentences):
+            sentence_table.append(len(text))
+            sentence_table.append(len(tagged))
+        if sys.byteorder != 'little':
+            sentence_table.byteswap()
+            morph_ids.byteswap()
+
+        self.fd.write(struct.pack('<II', len(doc['summary']),
+                                  len(doc['body'])))
+        self.fd.write(sentence_table.tobytes())
+        self.fd.write(b''.join(texts))
+        self.fd.write(morph_ids.tobytes())
+        self.fd.write(tag_codes)
+
+    def _write_strings(self, table: dict, offset_type: str):
+        blobs = [s.encode('utf-8') for s in sorted(table, key=table.get)]
+        offsets = array.array(offset_type, [0])
+        for blob in blobs:
+            offsets.append(offsets[-1] + len(blob))
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        self.fd.write(offsets.tobytes())
+        self.fd.write(b''.join(blobs))
+
+    def close(self):
+        self.doc_offsets.append(self.fd.tell())
+
+        _align(self.fd)
+        tags_offset = self.fd.tell()
+        self._write_strings(self.tags, 'I')
+
+        _align(self.fd)
+        vocab_offset = self.fd.tell()
+        self._write_strings(self.vocab, 'Q')
+
+        _align(self.fd)
+        doc_index_offset = self.fd.tell()
+        if sys.byteorder != 'little':
+            self.doc_offsets.byteswap()
+        self.fd.write(self.doc_offsets.tobytes())
+
+        self.fd.seek(0)
+        self.fd.write(_HEADER.pack(MAGIC, VERSION, len(self.doc_offsets) - 1,
+                                   len(self.tags), len(self.vocab),
+                                   tags_offset, vocab_offset,
+                                   doc_index_offset))
+        self.fd.close()
+
+
+class Stage0Reader(object):
+    """
+    Random access to the documents of a binary stage-0 file
+
+    The file is memory-mapped: opening it only reads the header and the tag
+    names, and reader[n] decodes document n alone, in the same form as
+    json.load() of a .stage0 file gives ([sentence, [[morph, tag], ...]]).
+    """
+
+    def __init__(self, fn: str, morpheme_cache_size: int = 1 << 16):
+        self.fd = open(fn, 'rb')
+        self.mm = mmap.mmap(self.fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.doc_count, self.tag_count, self.vocab_count, \
+            self.tags_offset, self.vocab_offset, self.doc_index_offset = \
+            _HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a version %d binary stage-0 file'
+                             % (fn, VERSION))
+
+        tag_offsets = struct.unpack_from('<%dI' % (self.tag_count + 1),
+                                         self.mm, self.tags_offset)
+        tags_start = self.tags_offset + 4 * (self.tag_count + 1)
+        self.tags = [self.mm[tags_start + tag_offsets[i]:
+                             tags_start + tag_offsets[i + 1]].decode('utf-8')
+                     for i in range(self.tag_count)]
+
+        self._vocab_start = self.vocab_offset + 8 * (self.vocab_count + 1)
+        self.morpheme = functools.lru_cache(maxsize=morpheme_cache_size)(
+            self._morpheme)
+
+    def _morpheme(self, morph_id: int) -> str:
+        start, end = struct.unpack_from('<QQ', self.mm,
+                                        self.vocab_offset + 8 * morph_id)
+        return self.mm[self._vocab_start + start:
+                       self._vocab_start + end].decode('utf-8')
+
+    def __len__(self) -> int:
+        return self.doc_count
+
+    def __getitem__(self, n: int) -> dict:
+        if n < 0:
+            n += self.doc_count
+        if not 0 <= n < self.doc_count:
+            raise IndexError('document index out of range')
+
+        pos, = struct.unpack_from('<Q', self.mm, self.doc_index_offset + 8 * n)
+        n_summary, n_body = struct.unpack_from('<II', self.mm, pos)
+        n_sentences = n_summary + n_body
+        pos += 8
+
+        sentence_table = struct.unpack_from('<%dI' % (2 * n_sentences),
+                                            self.mm, pos)
+        pos += 8 * n_sentences
+
+        text_lens = sentence_table[0::2]
+        morph_counts = sentence_table[1::2]
+        total_morphs = sum(morph_counts)
+
+        texts = []
+        for text_len in text_lens:
+            texts.append(self.mm[pos:pos + text_len].decode('utf-8'))
+            pos += text_len
+
+        morph_ids = struct.unpack_from('<%dI' % total_morphs, self.mm, pos)
+        pos += 4 * total_morphs
+        tag_codes = self.mm[pos:pos + total_morphs]
+
+        sentences = []
+        m = 0
+        for text, morph_count in zip(texts, morph_counts):
+            tagged = [[self.morpheme(morph_ids[i]), self.tags[tag_codes[i]]]
+                      for i in range(m, m + morph_count)]
+            sentences.append([text, tagged])
+            m += morph_count
+
+        return {'body': sentences[n_summary:],
+                'summary': sentences[:n_summary]}
+
+    def __iter__(self):
+        for n in range(self.doc_count):
+            yield self[n]
+
+    def close(self):
+        self.mm.close()
+        self.fd.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+'''
+Convert a json .stage0 file to the binary format, streaming its documents
+'''
+def convert(json_fn: str, out_fn: str) -> int:
+    writer = Stage0Writer(out_fn)
+    with open(json_fn, 'rb') as fd:
+        for i, doc in enumerate(JsonArrayReader(fd)):
+            writer.write(doc)
+            if i % 1000 == 0:
+                logging.info('Converted %d documents of %s' % (i, json_fn))
+    writer.close()
+    return len(writer.doc_offsets) - 1
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s',
+                        level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Convert json .stage0 '
+                                                 'files to the binary '
+                                                 'stage-0 format')
+    parser.add_argument('input_files', type=str, nargs='+',
+                        help='Input .stage0 json file(s); each is written to '
+                             'the same filename + .bin')
+    args = parser.parse_args()
+
+    for json_fn in args.input_files:
+        count = convert(json_fn, json_fn + '.bin')
+        logging.info('Wrote %d documents to %s.bin' % (count, json_fn))
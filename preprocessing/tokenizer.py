@@ -1,7 +1,82 @@
 # -*- coding: utf-8 -*-
+import re
+import itertools
 import unicodedata
 from typing import List
 
+# code point classes that matter to the tokenizer
+CLASS_OTHER = 0
+CLASS_WHITESPACE = 1  # Unicode category Z*
+CLASS_PUNCTUATION = 2  # Unicode category P*
+CLASS_SYMBOL = 3  # Unicode category S*
+
+_CATEGORY_CLASSES = {'Z': CLASS_WHITESPACE, 'P': CLASS_PUNCTUATION,
+                     'S': CLASS_SYMBOL}
+
+# the BMP and the Supplementary Multilingual Plane hold every whitespace,
+# punctuation and symbol character; the planes above only contain
+# ideographs, tags, private use and unassigned code points
+CLASSIFIED_CODE_POINTS = 0x20000
+
+'''
+Class of every code point below CLASSIFIED_CODE_POINTS, indexed by code point
+'''
+CODE_POINT_CLASSES = bytes(map(
+    _CATEGORY_CLASSES.get,
+    (unicodedata.category(chr(cp))[0] for cp in range(CLASSIFIED_CODE_POINTS)),
+    itertools.repeat(CLASS_OTHER)))
+
+
+def _character_class(classes: tuple, negate: bool = False,
+                     end: int = CLASSIFIED_CODE_POINTS) -> str:
+    """
+    Build a regular expression character class matching every code point
+    below end whose class is in the specified classes, from runs of
+    CODE_POINT_CLASSES
+    """
+    ranges = []
+    cp = 0
+    for cls, run in itertools.groupby(CODE_POINT_CLASSES[:end]):
+        length = sum(1 for _ in run)
+        if cls in classes:
+            ranges.append('%s-%s' % (re.escape(chr(cp)),
+                                     re.escape(chr(cp + length - 1))))
+        cp += length
+    return '[%s%s]' % ('^' if negate else '', ''.join(ranges))
+
+
+def _compile_token_patterns(end: int = CLASSIFIED_CODE_POINTS) -> dict:
+    """
+    Compile one findall() pattern per (keep_punctuation, keep_symbols)
+    combination: a token is a run of 'other' characters, or a single
+    punctuation/symbol character when those are kept. Whitespace and
+    discarded punctuation/symbols are never matched, so they only act as
+    boundaries.
+
+    Patterns compiled with end=0x10000 are only correct for strings without
+    supplementary plane characters, but sre can match their character
+    classes with a bitmap instead of a list of ranges, which is several
+    times faster.
+    """
+    word = _character_class((CLASS_WHITESPACE, CLASS_PUNCTUATION,
+                             CLASS_SYMBOL), negate=True, end=end) + '+'
+    punctuation = _character_class((CLASS_PUNCTUATION,), end=end)
+    symbol = _character_class((CLASS_SYMBOL,), end=end)
+    punctuation_symbol = _character_class((CLASS_PUNCTUATION, CLASS_SYMBOL),
+                                          end=end)
+
+    return {
+        (False, False): re.compile(word),
+        (True, False): re.compile('%s|%s' % (word, punctuation)),
+        (False, True): re.compile('%s|%s' % (word, symbol)),
+        (True, True): re.compile('%s|%s' % (word, punctuation_symbol)),
+    }
+
+
+_TOKEN_PATTERNS = _compile_token_patterns()
+_BMP_TOKEN_PATTERNS = _compile_token_patterns(end=0x10000)
+_SUPPLEMENTARY_PATTERN = re.compile('[\U00010000-\U0010ffff]')
+
 '''
 Singleton class that handles tokenization of Unicode input strings
 (splits sentence into a series of tokens)
@@ -32,54 +107,35 @@ class Tokenizer(object):
         :param keep_symbols: whether or not to retain symbol tokens
         """
 
-        tokens = []
-        last_str = ''
-
-        def commit():
-            if last_str:
-                tokens.append(last_str)
-
-        for c in input_str:
-            cat = unicodedata.category(c)
-
-            if cat.startswith('Z'):
-                # whitespace: split at this point
-                # commit current token buffer
-                commit()
-
-                # empty token buffer
-                last_str = ''
-            elif cat.startswith('P'):
-                # punctuation: split at this point
-                # commit current token buffer
-                commit()
-
-                if keep_punctuation:
-                    last_str = c
-                    # commit punctuation token separately
-                    commit()
-
-                # empty token buffer
-                last_str = ''
-            elif cat.startswith('S'):
-                # symbol (e.g., ■): split at this point
-                commit()
-
-                if keep_symbols:
-                    last_str = c
-                    # commit symbol token separately
-                    commit()
-
-                # empty token buffer
-                last_str = ''
-            else:
-                last_str += c
-
-        # commit whatever tokens we haven't yet after
-        # reaching the end of the string
-        commit()
-
-        return tokens
+        if _SUPPLEMENTARY_PATTERN.search(input_str):
+            patterns = _TOKEN_PATTERNS
+        else:
+            patterns = _BMP_TOKEN_PATTERNS
+
+        pattern = patterns[bool(keep_punctuation), bool(keep_symbols)]
+        return pattern.findall(input_str)
+
+    """
+    Tokenize a list of strings (e.g., the normalized sentences of a whole
+    document) and return one token list per string, as tokenize() would
+    """
+
+    @staticmethod
+    def tokenize_batch(input_strs: List[str], keep_punctuation: bool = True,
+                       keep_symbols: bool = True) -> List[List[str]]:
+        """
+        :param input_strs: input strings
+        :param keep_punctuation: whether or not to retain punctuation tokens
+        :param keep_symbols: whether or not to retain symbol tokens
+        """
+
+        if any(map(_SUPPLEMENTARY_PATTERN.search, input_strs)):
+            patterns = _TOKEN_PATTERNS
+        else:
+            patterns = _BMP_TOKEN_PATTERNS
+
+        pattern = patterns[bool(keep_punctuation), bool(keep_symbols)]
+        return list(map(pattern.findall, input_strs))
 
     def __init__(self):
         assert None, 'singleton class should not be instantiated'
@@ -108,9 +108,9 @@ class UnicodeSymbols(object):
     SYMBOLS_RIGHTQUOTES = (
         # common
         '\u0022', # quotation mark
-        '\uff02'  # fullwidth quotation mark
+        '\uff02', # fullwidth quotation mark
         '\u0027', # apostrophe
-        '\uff07'  # fullwidth apostrophe
+        '\uff07', # fullwidth apostrophe
         '\U000E0022',  # tag quotation mark
         '\u301d', # reversed double prime quotation mark
         '\u301e', # double prime quotation mark
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the scripts import their siblings by bare module name
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _dir in ('preprocessing', 'utilities'):
+    sys.path.insert(0, os.path.join(_ROOT, _dir))
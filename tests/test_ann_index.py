@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from ann_index import IVFIndex
+from embedding_store import EmbeddingStore
+
+
+def write_export(tmp_path, name, num_rows, dim, seed=0):
+    base_fn = str(tmp_path / name)
+    vectors = np.random.default_rng(seed).normal(size=(num_rows, dim))
+    vectors.astype('<f4').tofile(base_fn + '_tensors.bytes')
+    with open(base_fn + '_labels.tsv', 'w', encoding='utf-8') as fd:
+        fd.write('word\tcount\n')
+        for row in range(num_rows):
+            fd.write('w%d\t%d\n' % (row, num_rows - row))
+    return base_fn + '_tensors.bytes'
+
+
+def test_save_load_and_search(tmp_path):
+    store = EmbeddingStore(write_export(tmp_path, 'a', 500, 16),
+                           block_rows=64)
+    index = IVFIndex.build(store, nlist=8)
+    index.save(str(tmp_path / 'a.ivf'))
+
+    loaded = IVFIndex.load(str(tmp_path / 'a.ivf'), store=store)
+    assert loaded.matches(store)
+    queries = store.lookup(['w1', 'w7'], normalize=True)
+    # probing every cluster is exact search
+    _, rows = loaded.search(queries, 5, nprobe=loaded.nlist)
+    _, exact_rows = store.top_k(queries, 5)
+    assert (rows == exact_rows).all()
+
+
+@pytest.mark.parametrize('name,num_rows,dim', [('b', 500, 16), ('a', 400, 16),
+                                               ('a', 250, 32)])
+def test_load_rejects_other_store(tmp_path, name, num_rows, dim):
+    store = EmbeddingStore(write_export(tmp_path, 'a', 500, 16))
+    IVFIndex.build(store, nlist=4).save(str(tmp_path / 'a.ivf'))
+
+    (tmp_path / 'other').mkdir()
+    other = EmbeddingStore(write_export(tmp_path / 'other', name, num_rows,
+                                        dim))
+    index = IVFIndex.load(str(tmp_path / 'a.ivf'))
+    assert not index.matches(other)
+    with pytest.raises(ValueError):
+        IVFIndex.load(str(tmp_path / 'a.ivf'), store=other)
@@ -0,0 +1,154 @@
+import numpy as np
+import pytest
+
+from embedding_store import EmbeddingStore, dequantize, quantize, \
+    tensors_filename, write_quantized
+
+
+def make_vectors(num_rows, dim, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(num_rows, dim))
+    vectors = vectors.astype('<f4')
+    # a null vector scores 0 against every query
+    vectors[3] = 0
+    return vectors
+
+
+def write_export(tmp_path, vectors, dtype='float32', name='e'):
+    base_fn = str(tmp_path / name)
+    quantized, scales = quantize(vectors, dtype)
+    quantized.tofile(tensors_filename(base_fn, dtype))
+    if scales is not None:
+        scales.tofile(base_fn + '_scales.bytes')
+    with open(base_fn + '_labels.tsv', 'w', encoding='utf-8') as fd:
+        fd.write('word\tcount\n')
+        for row in range(len(vectors)):
+            fd.write('단어%d\t%d\n' % (row, len(vectors) - row))
+    return tensors_filename(base_fn, dtype)
+
+
+def test_quantize_round_trip():
+    vectors = make_vectors(100, 16) * 10
+    vectors[5, 0] = 1e4
+
+    quantized, scales = quantize(vectors, 'float32')
+    assert scales is None
+    assert (dequantize(quantized) == vectors).all()
+
+    quantized, scales = quantize(vectors, 'float16')
+    assert quantized.dtype == np.dtype('<f2') and scales is None
+    restored = dequantize(quantized)
+    assert restored.dtype == np.float32
+    np.testing.assert_allclose(restored, vectors, rtol=2.0 ** -11)
+
+    quantized, scales = quantize(vectors, 'int8')
+    assert quantized.dtype == np.dtype('i1')
+    assert scales.dtype == np.dtype('<f4')
+    assert (np.abs(quantized).max(axis=1)[scales > 0] == 127).all()
+    restored = dequantize(quantized, scales)
+    # rounding moves each value by at most half a step of its row
+    assert (np.abs(restored - vectors) <=
+            scales[:, None] * 0.5 * (1 + 1e-5)).all()
+    assert scales[3] == 0 and not restored[3].any()
+
+
+def test_write_quantized(tmp_path):
+    vectors = make_vectors(250, 16)
+    blocks = [vectors[start:start + 64] for start in range(0, 250, 64)]
+    for dtype in ('float16', 'int8'):
+        base_fn = str(tmp_path / dtype)
+        with open(tensors_filename(base_fn, dtype), 'wb') as bytes_fd, \
+                open(base_fn + '_scales.bytes', 'wb') as scales_fd:
+            row_errors, pair_errors, null_rows = write_quantized(
+                bytes_fd, scales_fd, iter(blocks), dtype, pairs_per_block=100)
+        with open(base_fn + '_labels.tsv', 'w', encoding='utf-8') as fd:
+            fd.write('word\tcount\n')
+            fd.writelines('w%d\t1\n' % row for row in range(250))
+
+        quantized, scales = quantize(vectors, dtype)
+        with open(tensors_filename(base_fn, dtype), 'rb') as fd:
+            assert fd.read() == quantized.tobytes()
+        with open(base_fn + '_scales.bytes', 'rb') as fd:
+            assert fd.read() == (b'' if scales is None else scales.tobytes())
+        assert len(pair_errors) == 100 * len(blocks)
+        assert 0 <= pair_errors.max() < 0.02
+        # the null row 3 has no cosine error
+        assert null_rows == 1
+        assert len(row_errors) == 249
+        assert np.abs(row_errors).max() < 1e-3
+
+        store = EmbeddingStore(tensors_filename(base_fn, dtype))
+        assert store.dtype == dtype
+        np.testing.assert_array_equal(store.lookup(['w7', 'w200']),
+                                      dequantize(quantized, scales)[[7, 200]])
+
+
+def brute_force_top_k(vectors, queries, k):
+    vectors = vectors.astype(np.float64)
+    norms = np.linalg.norm(vectors, axis=1)
+    scores = queries.astype(np.float64) @ vectors.T / \
+        np.where(norms > 0, norms, 1.0)
+    rows = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(scores, rows, axis=1), rows
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'float16', 'int8'])
+@pytest.mark.parametrize('block_rows', [7, 64, 1000])
+@pytest.mark.parametrize('k', [1, 10, 200])
+def test_top_k_matches_brute_force(tmp_path, dtype, block_rows, k):
+    vectors = make_vectors(200, 16)
+    store = EmbeddingStore(write_export(tmp_path, vectors, dtype),
+                           block_rows=block_rows)
+    queries = np.random.default_rng(1).normal(size=(5, 16))
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    scores, rows = store.top_k(queries.astype(np.float32), k)
+    # against the vectors the store actually holds
+    expected_scores, expected_rows = brute_force_top_k(
+        store.take(np.arange(len(store))), queries, k)
+    assert scores.shape == rows.shape == (5, k)
+    assert (rows == expected_rows).all()
+    np.testing.assert_allclose(scores, expected_scores, atol=1e-5)
+
+
+def test_top_k_pads_missing_rows(tmp_path):
+    store = EmbeddingStore(write_export(tmp_path, make_vectors(5, 4)),
+                           block_rows=2)
+    queries = np.eye(4, dtype=np.float32)[:2]
+    scores, rows = store.top_k(queries, 8, exclude_rows=[1, -1])
+    assert (rows[:, 5:] == -1).all()
+    assert sorted(rows[0, :4].tolist()) == [0, 2, 3, 4]
+    assert sorted(rows[1, :5].tolist()) == [0, 1, 2, 3, 4]
+    assert rows[0, 4] == -1
+
+
+def test_lookup(tmp_path):
+    vectors = make_vectors(50, 8)
+    store = EmbeddingStore(write_export(tmp_path, vectors), block_rows=16)
+    assert len(store) == 50
+    assert '단어7' in store and 'missing' not in store
+    assert (store.rows(['단어7', 'missing', '단어0']) == [7, -1, 0]).all()
+
+    np.testing.assert_array_equal(store.lookup(['단어9', '단어2']),
+                                  vectors[[9, 2]])
+    np.testing.assert_array_equal(store['단어9'], vectors[9])
+    unit = store.lookup(['단어9', '단어3'], normalize=True)
+    np.testing.assert_allclose(unit[0],
+                               vectors[9] / np.linalg.norm(vectors[9]),
+                               rtol=1e-6)
+    assert not unit[1].any()
+
+    with pytest.raises(KeyError):
+        store.lookup(['단어1', 'missing'])
+    with pytest.raises(KeyError):
+        store.most_similar('missing')
+
+
+def test_most_similar_excludes_the_query_word(tmp_path):
+    vectors = make_vectors(100, 8)
+    vectors[10] = vectors[20] * 2
+    store = EmbeddingStore(write_export(tmp_path, vectors), block_rows=16)
+    results = store.most_similar(['단어20', '단어10'], topn=3)
+    assert results[0][0][0] == '단어10'
+    assert results[1][0][0] == '단어20'
+    assert results[0][0][1] == pytest.approx(1.0)
+    assert all(word != '단어20' for word, _ in results[0])
@@ -0,0 +1,214 @@
+import json
+import threading
+
+import h5py
+import pytest
+
+from hdf5_corpus import CorpusShard, HDF5Corpus, get_shards, shard_ranges
+from hdf5_writer import create_vlen_dataset
+
+CHUNK_ROWS = 10
+
+
+def make_records(count):
+    return ['r%04d' % i for i in range(count)]
+
+
+def write_corpus(tmp_path, records, name='corpus.hdf5'):
+    fn = str(tmp_path / name)
+    with h5py.File(fn, 'w') as f:
+        dset = create_vlen_dataset(f, 'vlen_dataset', chunk_rows=CHUNK_ROWS)
+        dset.resize((len(records), ))
+        dset[:] = records
+    return fn
+
+
+@pytest.fixture
+def corpus_fn(tmp_path):
+    return write_corpus(tmp_path, make_records(95))
+
+
+def test_cache_stays_within_limit(corpus_fn):
+    # every chunk holds 10 records of 5 characters: room for two chunks
+    with HDF5Corpus(corpus_fn, cache_mb=120 / 1048576) as corpus:
+        for chunk_idx in range(3):
+            assert corpus[chunk_idx * CHUNK_ROWS] == \
+                'r%04d' % (chunk_idx * CHUNK_ROWS)
+            assert corpus.cached_bytes <= corpus.cache_bytes
+        assert list(corpus.cache) == [1, 2]
+
+        # a hit makes chunk 1 the most recently used, so 2 is evicted next
+        assert corpus[15] == 'r0015'
+        assert corpus[35] == 'r0035'
+        assert list(corpus.cache) == [1, 3]
+        assert corpus.cached_bytes == 100
+        assert (corpus.chunk_reads, corpus.cache_hits) == (4, 1)
+
+
+def test_cache_keeps_one_chunk_larger_than_limit(corpus_fn):
+    with HDF5Corpus(corpus_fn, cache_mb=0) as corpus:
+        assert corpus[3] == 'r0003'
+        assert corpus[4] == 'r0004'
+        assert (corpus.chunk_reads, corpus.cache_hits) == (1, 1)
+        assert corpus[94] == 'r0094'
+        assert list(corpus.cache) == [9]
+
+
+@pytest.mark.parametrize('indices', [
+    [5, 90, 17, 6],
+    [94, 0, 94, 3, 3, 50, 0],
+    [-1, 12, -95],
+    [],
+    range(90, 0, -7),
+])
+def test_take_returns_request_order(corpus_fn, indices):
+    records = make_records(95)
+    with HDF5Corpus(corpus_fn, cache_mb=0) as corpus:
+        assert corpus.take(indices) == [records[i] for i in indices]
+        assert corpus[list(indices)] == [records[i] for i in indices]
+
+
+def test_take_reads_each_chunk_once(corpus_fn):
+    with HDF5Corpus(corpus_fn, cache_mb=0) as corpus:
+        corpus.take([91, 1, 92, 2, 93, 3])
+        assert corpus.chunk_reads == 2
+
+
+@pytest.mark.parametrize('key', [
+    slice(None), slice(10, 25), slice(-12, None), slice(-30, -5),
+    slice(3, 80, 7), slice(None, None, -1), slice(80, 10, -9),
+    slice(50, 20), slice(200, 300),
+])
+def test_slices(corpus_fn, key):
+    records = make_records(95)
+    with HDF5Corpus(corpus_fn) as corpus:
+        assert corpus[key] == records[key]
+
+
+def test_index_errors(corpus_fn):
+    with HDF5Corpus(corpus_fn) as corpus:
+        assert corpus[-95] == 'r0000'
+        for key in (95, -96, [0, 95], [-96]):
+            with pytest.raises(IndexError):
+                corpus[key]
+
+
+def test_iteration(corpus_fn):
+    with HDF5Corpus(corpus_fn) as corpus:
+        assert len(corpus) == 95
+        assert corpus.chunk_count() == 10
+        assert list(corpus) == make_records(95)
+
+
+def test_decode_json(tmp_path):
+    docs = [{'id': i, 'text': '본문 %d' % i} for i in range(25)]
+    fn = write_corpus(tmp_path, [json.dumps(doc, ensure_ascii=False)
+                                 for doc in docs])
+    with HDF5Corpus(fn, decode_json=True) as corpus:
+        assert corpus[7] == docs[7]
+        assert corpus[3:12] == docs[3:12]
+        assert corpus[::-4] == docs[::-4]
+        assert corpus.take([24, 0, 24]) == [docs[24], docs[0], docs[24]]
+        assert list(corpus) == docs
+
+
+@pytest.mark.parametrize('record_count,chunk_rows,shard_count', [
+    (95, 10, 4), (100, 10, 3), (25, 10, 5), (0, 10, 2), (7, 10, 3),
+    (1000, 64, 7), (95, 10, 1),
+])
+def test_shard_ranges(record_count, chunk_rows, shard_count):
+    ranges = shard_ranges(record_count, chunk_rows, shard_count)
+    assert len(ranges) == shard_count
+    # contiguous, covering every record, cut at chunk boundaries
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == record_count
+    for (_, stop), (start, _) in zip(ranges, ranges[1:]):
+        assert stop == start
+    for start, stop in ranges:
+        assert start <= stop
+        assert start % chunk_rows == 0
+        assert stop % chunk_rows == 0 or stop == record_count
+    # whole chunks are spread as evenly as possible
+    chunks = [-(-(stop - start) // chunk_rows) for start, stop in ranges]
+    assert max(chunks) - min(chunks) <= 1
+
+
+def test_shard_ranges_with_more_shards_than_chunks():
+    assert shard_ranges(25, 10, 5) == [(0, 0), (0, 10), (10, 10), (10, 20),
+                                       (20, 25)]
+
+
+@pytest.mark.parametrize('shard_count', [1, 3, 10, 12])
+def test_shards_cover_the_corpus(corpus_fn, shard_count):
+    shards = get_shards(corpus_fn, shard_count, prefetch_chunks=1)
+    assert len(shards) == shard_count
+    assert all(shard.chunk_rows == CHUNK_ROWS for shard in shards)
+    assert sum(len(shard) for shard in shards) == 95
+    assert [record for shard in shards for record in shard] == \
+        make_records(95)
+
+
+def test_shard_decode_json(tmp_path):
+    docs = [{'id': i} for i in range(25)]
+    fn = write_corpus(tmp_path, [json.dumps(doc) for doc in docs])
+    shards = get_shards(fn, 2, decode_json=True)
+    assert [doc for shard in shards for doc in shard] == docs
+
+
+class FlakyStrings(object):
+    '''
+    Stands in for dset.asstr(): records every read, and fails the
+    fail_at-th one
+    '''
+
+    def __init__(self, strings, reads, fail_at):
+        self.strings = strings
+        self.reads = reads
+        self.fail_at = fail_at
+
+    def __getitem__(self, key):
+        self.reads.append(key)
+        if len(self.reads) == self.fail_at:
+            raise OSError('cannot read chunk')
+        return self.strings[key]
+
+
+def patch_reads(monkeypatch, fail_at=None):
+    reads = []
+    asstr = h5py.Dataset.asstr
+
+    def flaky_asstr(dset, *args, **kwargs):
+        return FlakyStrings(asstr(dset, *args, **kwargs), reads, fail_at)
+
+    monkeypatch.setattr(h5py.Dataset, 'asstr', flaky_asstr)
+    return reads
+
+
+def test_shard_stops_reading_when_closed(tmp_path, monkeypatch):
+    fn = write_corpus(tmp_path, make_records(1000))
+    reads = patch_reads(monkeypatch)
+    threads = set(threading.enumerate())
+
+    records = iter(CorpusShard(fn, 0, 1000, chunk_rows=CHUNK_ROWS,
+                               prefetch_chunks=1))
+    assert [next(records) for _ in range(15)] == make_records(15)
+    assert len(set(threading.enumerate()) - threads) == 1
+    records.close()
+
+    # the reader thread has finished, well before the end of the shard
+    assert set(threading.enumerate()) == threads
+    assert len(reads) < 10
+
+
+def test_shard_passes_reader_error_to_consumer(tmp_path, monkeypatch):
+    fn = write_corpus(tmp_path, make_records(95))
+    patch_reads(monkeypatch, fail_at=3)
+    threads = set(threading.enumerate())
+
+    consumed = []
+    with pytest.raises(OSError, match='cannot read chunk'):
+        for record in CorpusShard(fn, 0, 95, chunk_rows=CHUNK_ROWS):
+            consumed.append(record)
+    # the chunks read before the failing one were delivered
+    assert consumed == make_records(20)
+    assert set(threading.enumerate()) == threads
@@ -0,0 +1,110 @@
+import h5py
+import pytest
+
+from hdf5_output import HDF5Stage0Writer, read_checkpoint
+
+INPUT_FILES = ['a.json', 'b.json']
+
+
+def make_doc(i):
+    return {'summary': [['요약 %d' % i, [['요약', 'NNG'], [str(i), 'SN']]]]
+            if i % 2 else [],
+            'body': [['문장 %d' % j, [['w%d' % (i + j), 'NNP'],
+                                      ['.', 'SF']]]
+                     for j in range(i % 3)]}
+
+
+DOCS = [(i % 2, i // 2, make_doc(i)) for i in range(20)]
+
+
+def write_docs(writer, docs):
+    for file_idx, entry_idx, doc in docs:
+        # stands in for the end of the document in the .stage0 output
+        writer.write(file_idx, entry_idx, doc, 100 * (entry_idx + 1))
+
+
+def read_datasets(fn):
+    with h5py.File(fn, 'r') as f:
+        return {name: list(dset.asstr()[:]) if dset.dtype.kind == 'O'
+                else dset[:].tolist() for name, dset in f.items()}
+
+
+def write_all(fn):
+    writer = HDF5Stage0Writer(fn, INPUT_FILES, flush_documents=4)
+    write_docs(writer, DOCS)
+    writer.mark_complete(0)
+    writer.mark_complete(1)
+    writer.close()
+    return read_datasets(fn)
+
+
+def resume_and_finish(fn):
+    entries, complete, offsets = read_checkpoint(fn, INPUT_FILES)
+    assert offsets == [100 * n for n in entries]
+    writer = HDF5Stage0Writer(fn, INPUT_FILES, flush_documents=4,
+                              resume=True)
+    write_docs(writer, [(file_idx, entry_idx, doc)
+                        for file_idx, entry_idx, doc in DOCS
+                        if entry_idx >= entries[file_idx]])
+    writer.mark_complete(0)
+    writer.mark_complete(1)
+    writer.close()
+    return entries, read_datasets(fn)
+
+
+def test_datasets(tmp_path):
+    data = write_all(str(tmp_path / 'out.h5'))
+    assert data['input_files'] == INPUT_FILES
+    assert data['doc_entry'] == [entry_idx for _, entry_idx, _ in DOCS]
+    doc = DOCS[5][2]
+    first, last = data['doc_sentence_offsets'][5:7]
+    assert data['sentences'][first:last] == \
+        [text for text, _ in doc['summary'] + doc['body']]
+    morphs = data['sentence_morph_offsets'][first]
+    assert data['vocab'][data['morphs'][morphs]] == '요약'
+    assert read_checkpoint(str(tmp_path / 'out.h5'), INPUT_FILES) == \
+        ([10, 10], [True, True], [1000, 1000])
+
+
+def test_resume_before_first_flush(tmp_path):
+    expected = write_all(str(tmp_path / 'expected.h5'))
+    fn = str(tmp_path / 'out.h5')
+    writer = HDF5Stage0Writer(fn, INPUT_FILES, flush_documents=100)
+    write_docs(writer, DOCS[:3])
+    # killed: buffered documents are lost
+    writer.f.close()
+
+    assert read_checkpoint(fn, INPUT_FILES) == \
+        ([0, 0], [False, False], [0, 0])
+    entries, data = resume_and_finish(fn)
+    assert data == expected
+
+
+@pytest.mark.parametrize('written', [4, 7, 13])
+def test_resume_after_flush(tmp_path, written):
+    expected = write_all(str(tmp_path / 'expected.h5'))
+    fn = str(tmp_path / 'out.h5')
+    writer = HDF5Stage0Writer(fn, INPUT_FILES, flush_documents=4)
+    write_docs(writer, DOCS[:written])
+    writer.f.close()
+
+    entries, data = resume_and_finish(fn)
+    assert sum(entries) == written // 4 * 4
+    assert data == expected
+
+
+def test_resume_with_other_input_files(tmp_path):
+    fn = str(tmp_path / 'out.h5')
+    write_all(fn)
+    with pytest.raises(ValueError):
+        read_checkpoint(fn, ['a.json'])
+
+
+def test_more_than_256_tags_is_rejected(tmp_path):
+    writer = HDF5Stage0Writer(str(tmp_path / 'out.h5'), INPUT_FILES)
+    writer.write(0, 0, {'summary': [], 'body': [
+        ['s', [['m', 'T%d' % i] for i in range(256)]]]})
+    with pytest.raises(ValueError):
+        writer.write(0, 1, {'summary': [], 'body': [['s', [['m', 'T256']]]]})
+    assert len(writer.tag_codes) == 256
+    writer.f.close()
@@ -0,0 +1,115 @@
+import io
+import json
+
+import pytest
+
+from json_array_scanner import JsonArrayScanner, JsonLinesScanner
+
+
+def read_all(data, block_size=7):
+    return list(JsonArrayScanner(io.BytesIO(data), block_size=block_size,
+                                 decode=True))
+
+
+DOCS = [
+    {'body': '첫 줄\n둘째 줄', 'subtitles': ['요약']},
+    [1, -2.5e-3, 12345678901234567890, True, None],
+    'string with "quotes", \\ and ] [ , characters',
+    -1.25,
+    {},
+    [],
+    '',
+]
+
+
+@pytest.mark.parametrize('block_size', [1, 2, 3, 7, 64, 1 << 20])
+def test_round_trip_across_block_sizes(block_size):
+    data = json.dumps(DOCS).encode('utf-8')
+    assert read_all(data, block_size) == DOCS
+
+
+def test_whitespace_and_empty_arrays():
+    assert read_all(b'  [ ]  ') == []
+    assert read_all(b'\n[\n 1 ,\t2\r\n]\n') == [1, 2]
+
+
+def test_number_cut_at_block_end_is_not_truncated():
+    # "-2500.75" must not be taken as "-2500" when a block ends at the dot
+    data = b'[' + b', '.join(b'-2500.75' for _ in range(50)) + b']'
+    for block_size in range(1, 12):
+        assert read_all(data, block_size) == [-2500.75] * 50
+
+
+def test_multibyte_characters_split_across_blocks():
+    docs = ['가나다라마바사' * 5, '😀' * 3]
+    data = json.dumps(docs, ensure_ascii=False).encode('utf-8')
+    assert read_all(data, 1) == docs
+
+
+def test_bytes_read_counts_the_whole_input():
+    data = json.dumps(DOCS).encode('utf-8') + b'\n'
+    reader = JsonArrayScanner(io.BytesIO(data), block_size=5, decode=True)
+    list(reader)
+    assert reader.bytes_read == len(data)
+
+
+@pytest.mark.parametrize('data', [b'', b'{}', b'[1, 2', b'[1 2]', b'[1,]',
+                                  b'[1, "abc', b'[1] x', b'[1]]', b'[][]'])
+def test_malformed_input_raises(data):
+    with pytest.raises(ValueError):
+        read_all(data)
+
+
+@pytest.mark.parametrize('block_size', [1, 3, 1 << 20])
+def test_raw_text_of_elements(block_size):
+    data = ' [ {"a": [1, 2]} ,"x\\"y",  -1.5e3\n, [ ] ] \n'.encode('utf-8')
+    scanner = JsonArrayScanner(io.BytesIO(data), block_size=block_size)
+    assert list(scanner) == ['{"a": [1, 2]}', '"x\\"y"', '-1.5e3', '[ ]']
+
+
+def test_trailing_data_after_array_raises():
+    data = json.dumps(DOCS).encode('utf-8') + b'\n  garbage'
+    with pytest.raises(ValueError):
+        read_all(data, 1 << 20)
+    # the elements before it are still yielded
+    scanner = JsonArrayScanner(io.BytesIO(data), decode=True)
+    docs = []
+    with pytest.raises(ValueError):
+        for doc in scanner:
+            docs.append(doc)
+    assert docs == DOCS
+
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'utf-8-sig', 'euc-kr'])
+@pytest.mark.parametrize('block_size', [1, 5, 1 << 20])
+def test_resume_from_every_tell(encoding, block_size):
+    docs = DOCS + ['가나다', {'키': '값 ' * 10}]
+    data = (' ' + json.dumps(docs, ensure_ascii=False, indent=1) +
+            '\n').encode(encoding)
+    scanner = JsonArrayScanner(io.BytesIO(data), encoding=encoding,
+                               block_size=block_size, decode=True)
+    assert scanner.tell() == 0
+    offsets = []
+    for doc in scanner:
+        offsets.append(scanner.tell())
+    assert data[offsets[-1]:].strip() == b']'
+
+    for i, offset in enumerate(offsets):
+        rest = JsonArrayScanner(io.BytesIO(data), encoding=encoding,
+                                block_size=block_size, decode=True,
+                                start=offset)
+        assert list(rest) == docs[i + 1:]
+
+
+def test_json_lines():
+    data = '{"a": 1}\r\n\n  [1, "가"]\n"x"'.encode('utf-8')
+    scanner = JsonLinesScanner(io.BytesIO(data))
+    records = []
+    offsets = []
+    for record in scanner:
+        records.append(record)
+        offsets.append(scanner.tell())
+    assert records == ['{"a": 1}', '[1, "가"]', '"x"']
+    assert offsets == [10, len(data) - 3, len(data)]
+    rest = JsonLinesScanner(io.BytesIO(data), start=offsets[0])
+    assert list(rest) == records[1:]
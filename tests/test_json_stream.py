@@ -0,0 +1,82 @@
+import io
+import json
+
+import pytest
+
+from json_array_scanner import JsonArrayScanner
+from json_stream import JsonArrayReader, JsonArrayWriter
+
+DOCS = [
+    {'body': '첫 줄\n둘째 줄', 'subtitles': ['요약']},
+    [1, -2.5e-3, True, None],
+    'string with "quotes", \\ and ] [ , characters',
+    {},
+    '',
+]
+
+
+def test_writer_matches_json_dump():
+    for n in range(len(DOCS) + 1):
+        docs = DOCS[:n]
+        out = io.StringIO()
+        out.close = lambda: None
+        writer = JsonArrayWriter(out)
+        for doc in docs:
+            writer.write(doc)
+        writer.close()
+        assert out.getvalue() == json.dumps(docs)
+        data = out.getvalue().encode('utf-8')
+        assert list(JsonArrayReader(io.BytesIO(data))) == docs
+
+
+def test_writer_continues_at_offset():
+    out = io.StringIO()
+    out.close = lambda: None
+    writer = JsonArrayWriter(out)
+    offsets = []
+    for doc in DOCS:
+        writer.write(doc)
+        offsets.append(writer.offset)
+    assert offsets[-1] == len(out.getvalue())
+
+    for n in range(1, len(DOCS) + 1):
+        rest = io.StringIO(out.getvalue()[:offsets[n - 1]])
+        rest.seek(0, io.SEEK_END)
+        rest.close = lambda: None
+        writer = JsonArrayWriter(rest, offsets[n - 1])
+        for doc in DOCS[n:]:
+            writer.write(doc)
+        writer.close()
+        assert rest.getvalue() == json.dumps(DOCS)
+        assert writer.offset == len(rest.getvalue())
+
+
+def scan(reader):
+    try:
+        return list(reader), reader.bytes_read
+    except ValueError as e:
+        return type(e), str(e)
+
+
+@pytest.mark.parametrize('text', [
+    json.dumps(DOCS),
+    json.dumps(DOCS, indent=2, ensure_ascii=False),
+    ' [ ] \n',
+    '[1, -1.5, 2e10, "\u00e9"]',
+    '[1, 2] x',
+    '{"a": 1}',
+    '[1 2]',
+    '[1, 2',
+    '[1,]',
+    '[,1]',
+    '',
+    '  ',
+])
+@pytest.mark.parametrize('block_size', [1, 3, 64, 1 << 20])
+def test_reader_agrees_with_scanner(text, block_size):
+    # preprocessing/ keeps its own copy of the reader, which must not drift
+    # from the one the converters in utilities/ use
+    data = text.encode('utf-8')
+    assert scan(JsonArrayReader(io.BytesIO(data), block_size=block_size)) == \
+        scan(JsonArrayScanner(io.BytesIO(data), block_size=block_size,
+                              decode=True))
@@ -0,0 +1,90 @@
+import gzip
+import json
+import sys
+
+import h5py
+import pytest
+
+import json_to_hdf5
+from hdf5_writer import read_checkpoint
+
+
+class Interrupted(Exception):
+    pass
+
+
+def make_records(file_idx, count=2500):
+    return [{'id': '%d-%d' % (file_idx, i), 'text': '본문 %d' % i}
+            for i in range(count)]
+
+
+def write_inputs(tmp_path, input_format):
+    fns = []
+    for file_idx, suffix in enumerate(['', '.gz']):
+        records = make_records(file_idx)
+        if input_format == 'jsonl':
+            data = ''.join(json.dumps(r, ensure_ascii=False) + '\n'
+                           for r in records)
+        else:
+            data = json.dumps(records, ensure_ascii=False, indent=1)
+        fn = str(tmp_path / ('in%d.json%s' % (file_idx, suffix)))
+        opener = gzip.open if suffix else open
+        with opener(fn, 'wb') as fd:
+            fd.write(data.encode('utf-8'))
+        fns.append(fn)
+    return fns
+
+
+def convert(monkeypatch, fns, input_format, *options):
+    monkeypatch.setattr(sys, 'argv', ['json_to_hdf5.py'] + fns +
+                        ['--input-format', input_format] + list(options))
+    json_to_hdf5.main()
+    with h5py.File(fns[0] + '.hdf5', 'r') as f:
+        return list(f['vlen_dataset'].asstr()[:])
+
+
+@pytest.mark.parametrize('input_format,interrupt_at', [
+    ('json', 2), ('json', 3), ('json-stream', 2), ('json-stream', 3),
+    ('json-stream', 5), ('jsonl', 3), ('jsonl', 6)])
+def test_resume_after_interruption(tmp_path, monkeypatch, input_format,
+                                   interrupt_at):
+    fns = write_inputs(tmp_path, input_format)
+    expected = convert(monkeypatch, fns, input_format)
+    assert [json.loads(r)['id'] for r in expected] == \
+        ['%d-%d' % (f, i) for f in range(2) for i in range(2500)]
+
+    # checkpoint after every item, and die when about to record the
+    # interrupt_at-th checkpoint, after writing records past the previous one
+    calls = []
+    write_checkpoint = json_to_hdf5.write_checkpoint
+
+    def interrupting_write_checkpoint(f, writer, **state):
+        calls.append(state)
+        if len(calls) == interrupt_at:
+            writer.flush()
+            f.close()
+            raise Interrupted()
+        write_checkpoint(f, writer, **state)
+
+    monkeypatch.setattr(json_to_hdf5, 'write_checkpoint',
+                        interrupting_write_checkpoint)
+    with pytest.raises(Interrupted):
+        convert(monkeypatch, fns, input_format,
+                '--checkpoint-minutes', '1e-9')
+    monkeypatch.setattr(json_to_hdf5, 'write_checkpoint', write_checkpoint)
+
+    # (files done, records done in the next file) after each item, and at
+    # the end
+    if input_format == 'json':
+        states = [(1, 0), (2, 0), (2, 0)]
+    else:
+        states = [(0, 1024), (0, 2048), (0, 2500), (1, 0), (1, 1024),
+                  (1, 2048), (1, 2500), (2, 0), (2, 0)]
+    with h5py.File(fns[0] + '.hdf5', 'r') as f:
+        checkpoint = read_checkpoint(f)
+        assert checkpoint['format'] == input_format
+        assert (checkpoint['files'], checkpoint['file_records']) == \
+            states[interrupt_at - 2]
+        assert f['vlen_dataset'].shape[0] >= checkpoint['records']
+
+    assert convert(monkeypatch, fns, input_format, '--resume') == expected
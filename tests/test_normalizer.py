@@ -0,0 +1,88 @@
+import unicodedata
+
+import pytest
+
+from benchmark import SAMPLE_FRAGMENTS, generate_sentences, \
+    reference_compatibility_jamo, reference_normalize_symbols
+from normalizer import SYMBOL_REPLACEMENTS, Normalizer
+from tokenizer import Tokenizer
+
+EDGE_CASES = [
+    '',
+    ' ',
+    ' \t\n\u3000\u2003 ',
+    '\x00',
+    'a\x00b',
+    ' \x00 \u201cx\u201d \x00 ',
+    # combining marks, alone and after a base character
+    'e\u0301 cafe\u0301 \u0301\u2018x\u2019',
+    # a syllable spelled with conjoining Jamo, and a lone trailing consonant
+    '\u1100\u1161\u11a8 \u11a8\ud55c',
+    # astral plane: mathematical letters (NFKC folds them), an emoji
+    # (symbol) and a CJK ideograph above the classified planes
+    '\U0001d400\U0001d401 \U0001f600 \u2039\U00020000\u203a',
+    '\uff08\uc804\uac01\uff09 \uff21\uff22 \u00b2 \ufb01',
+    'a\u200bb \u3000 c\x1c d\x85e',
+]
+
+SENTENCES = SAMPLE_FRAGMENTS + generate_sentences(200) + EDGE_CASES
+
+
+def reference_normalize(s):
+    s = unicodedata.normalize('NFKC', s.strip())
+    return reference_compatibility_jamo(reference_normalize_symbols(s))
+
+
+def test_normalize_symbols_matches_reference():
+    for s in SENTENCES:
+        assert Normalizer.normalize_symbols(s) == \
+            reference_normalize_symbols(s)
+
+
+def test_normalize_symbols_every_table_character():
+    for symbols, _ in SYMBOL_REPLACEMENTS:
+        for c in symbols:
+            s = 'a%sb %s' % (c, c)
+            assert Normalizer.normalize_symbols(s) == \
+                reference_normalize_symbols(s)
+
+
+def test_normalize_matches_reference():
+    for s in SENTENCES:
+        assert Normalizer.normalize(s) == reference_normalize(s)
+
+
+def test_normalize_to_compatibility_jamo():
+    inputs = [chr(cp) for cp in range(0x1100, 0x1200)]
+    # NFD spells every Hangul syllable with conjoining Jamo
+    inputs += [unicodedata.normalize('NFD', s) for s in SENTENCES]
+    inputs += SENTENCES
+    for s in inputs:
+        assert Normalizer.normalize_to_compatibility_jamo(s) == \
+            reference_compatibility_jamo(s)
+
+
+@pytest.mark.parametrize('sentences', [
+    [],
+    SENTENCES,
+    EDGE_CASES,
+    ['\x00'],
+    ['', ''],
+    [' ', 'x', '가'],
+])
+def test_normalize_batch(sentences):
+    assert Normalizer.normalize_batch(sentences) == \
+        [reference_normalize(s) for s in sentences]
+
+
+@pytest.mark.parametrize('keep_punctuation', [True, False])
+@pytest.mark.parametrize('keep_symbols', [True, False])
+@pytest.mark.parametrize('sentences', [[], SENTENCES, EDGE_CASES, ['\x00']])
+def test_normalize_and_tokenize(sentences, keep_punctuation, keep_symbols):
+    expected = [Tokenizer.tokenize(reference_normalize(s), keep_punctuation,
+                                   keep_symbols) for s in sentences]
+    assert [Normalizer.normalize_and_tokenize(s, keep_punctuation,
+                                              keep_symbols)
+            for s in sentences] == expected
+    assert Normalizer.normalize_and_tokenize_batch(
+        sentences, keep_punctuation, keep_symbols) == expected
@@ -0,0 +1,114 @@
+import bz2
+import logging
+
+import pytest
+
+from parallel_bz2 import decompress_range, find_stream_offsets, \
+    iter_records, plan_ranges, read_multistream_index
+from record_scanner import RecordScanner, decode_record
+
+START = '<doc'
+END = '</doc>'
+
+
+def make_chunks():
+    '''
+    Pieces of a dump, each compressed as its own bz2 stream; records cross
+    stream boundaries, and one stream begins with a stray end token
+    followed by a record on the same line
+    '''
+    lines = []
+    for i in range(60):
+        lines.append('junk %d\n' % i)
+        lines.append('<doc id="%d">제목 %d\n' % (i, i))
+        lines.extend('본문 %d %d\n' % (i, j) for j in range(i % 5))
+        lines.append('</doc>\n')
+    data = ''.join(lines).encode('utf-8')
+    middle = data.index(b'junk 30\n')
+
+    chunks = [data[i:min(i + 97, middle)] for i in range(0, middle, 97)]
+    chunks.append(b'</doc> <doc id="stray">x\ny\n</doc> tail\n')
+    chunks.extend(data[i:i + 97] for i in range(middle, len(data), 97))
+    chunks.append(b'<doc id="unfinished">\n')
+    return chunks
+
+
+@pytest.fixture
+def dump(tmp_path):
+    chunks = make_chunks()
+    fn = str(tmp_path / 'dump.xml.bz2')
+    offsets = []
+    with open(fn, 'wb') as fd:
+        for chunk in chunks:
+            offsets.append(fd.tell())
+            fd.write(bz2.compress(chunk, 1))
+    return fn, offsets, b''.join(chunks)
+
+
+def sequential_records(data):
+    scanner = RecordScanner(START.encode('utf-8'), END.encode('utf-8'))
+    return [decode_record(record, 'utf-8', END)
+            for record in scanner.feed(data)]
+
+
+def test_find_stream_offsets(dump):
+    fn, offsets, _ = dump
+    assert find_stream_offsets(fn) == offsets
+
+
+def test_read_multistream_index(tmp_path):
+    fn = str(tmp_path / 'index.txt.bz2')
+    with bz2.open(fn, 'wt', encoding='UTF-8') as fd:
+        fd.write('600:3:C\n0:1:A\n0:2:B: colon\n')
+    assert read_multistream_index(fn) == [0, 600]
+
+
+def test_plan_ranges():
+    offsets = [0, 10, 20, 35, 40, 90]
+    assert plan_ranges(offsets, 100, 20) == [(0, 20), (20, 40), (40, 90),
+                                             (90, 100)]
+    assert plan_ranges(offsets, 100, 1000) == [(0, 100)]
+    assert plan_ranges(offsets, 100, 20, start=35) == [(35, 90), (90, 100)]
+
+
+def test_decompress_range(dump):
+    fn, offsets, data = dump
+    assert decompress_range(fn, offsets[0], offsets[3]) == \
+        b''.join(make_chunks()[:3])
+    with pytest.raises(EOFError):
+        decompress_range(fn, offsets[0], offsets[1] - 1)
+
+
+def test_same_records_as_sequential_scan(dump, caplog):
+    fn, offsets, data = dump
+    expected = sequential_records(data)
+    assert any('stray' in record for record in expected)
+
+    caplog.set_level(logging.DEBUG, logger='ParallelBZ2')
+    for range_mb in (0, 0.001, 1.0):
+        records = []
+        for out, _, _ in iter_records(fn, START, END, 'utf-8', 2,
+                                      offsets=offsets, range_mb=range_mb):
+            records.extend(out)
+        assert records == expected
+    # the range starting with the stray end token was scanned again
+    assert 'Rescanning range' in caplog.text
+
+
+def test_resume_from_every_range(dump):
+    fn, offsets, data = dump
+    expected = sequential_records(data)
+    done = []
+    records = []
+    for out, end, state in iter_records(fn, START, END, 'utf-8', 2,
+                                        offsets=offsets, range_mb=0.001):
+        records.extend(out)
+        done.append((len(records), end, state))
+
+    for count, end, state in done:
+        rest = []
+        for out, _, _ in iter_records(fn, START, END, 'utf-8', 2,
+                                      offsets=offsets, range_mb=0.001,
+                                      resume=(end, state)):
+            rest.extend(out)
+        assert expected[:count] + rest == expected
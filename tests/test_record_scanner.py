@@ -0,0 +1,157 @@
+import mmap
+import random
+
+import pytest
+
+from record_scanner import RecordScanner, check_encoding, decode_record
+
+START = '<doc'
+END = '</doc>'
+
+
+def old_split(text):
+    '''
+    The line-by-line splitting text_to_hdf5.py did before RecordScanner,
+    over text read with universal newlines
+    '''
+    records = []
+    last = ''
+    for ln in text.splitlines(keepends=True):
+        if last == '':
+            if START in ln:
+                last = START + ln.split(START)[1].split(END)[0]
+                if END in ln:
+                    records.append(last + END)
+                    last = ''
+        elif END in ln:
+            records.append(last + ln.split(END)[0].strip() + END)
+            last = ''
+        else:
+            last += ln
+    return records
+
+
+def split(data, block_size=None, encoding='utf-8'):
+    scanner = RecordScanner(START.encode(encoding), END.encode(encoding))
+    if block_size is None:
+        block_size = len(data) or 1
+    records = []
+    for i in range(0, len(data), block_size):
+        records.extend(scanner.feed(data[i:i + block_size]))
+    return [decode_record(record, encoding, END) for record in records]
+
+
+def make_text(seed, count=30):
+    rng = random.Random(seed)
+    words = ['가나', 'abc', '123', '<p>', 'doc', '</', '<', '😀']
+    newline = rng.choice(['\n', '\r\n'])
+    parts = []
+    for i in range(count):
+        parts.append(' '.join(rng.choice(words)
+                              for _ in range(rng.randrange(4))) + newline)
+        lines = [' '.join(rng.choice(words) for _ in range(rng.randrange(6)))
+                 for _ in range(rng.randrange(4))]
+        body = newline.join(lines)
+        parts.append('<doc id="%d">%s%s  </doc> tail %d%s'
+                     % (i, newline if lines else '', body, i, newline))
+    return ''.join(parts)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_old_splitter_on_well_formed_records(seed):
+    text = make_text(seed)
+    data = text.encode('utf-8')
+    expected = old_split(text.replace('\r\n', '\n'))
+    assert len(expected) == 30
+    assert split(data) == expected
+
+
+@pytest.mark.parametrize('block_size', [1, 2, 3, 5, 6, 7, 13, 64, 4096])
+def test_block_size_does_not_change_records(block_size):
+    data = make_text(7).encode('utf-8')
+    assert split(data, block_size) == split(data)
+
+
+def test_tokens_crossing_block_boundaries():
+    data = b'x<doc a</doc>\n<doc b\n</doc>y\n'
+    for cut in range(1, len(data)):
+        scanner = RecordScanner(b'<doc', b'</doc>')
+        records = scanner.feed(data[:cut]) + scanner.feed(data[cut:])
+        assert records == [b'<doc a</doc>', b'<doc b\n</doc>']
+
+
+def test_rest_of_end_line_and_unfinished_record_are_dropped():
+    data = b'<doc 1</doc> <doc 2</doc>\n<doc 3</doc>\n<doc 4\n'
+    assert split(data) == ['<doc 1</doc>', '<doc 3</doc>']
+
+
+def test_nested_start_tokens_differ_from_old_splitter():
+    # a start token inside an open record is record content: the record
+    # runs from the first start token to the first end token, where the
+    # old splitter kept only the text between the first two start tokens
+    text = '<doc a<doc b</doc>\n<doc c\n<doc d</doc>\n'
+    assert split(text.encode('utf-8')) == ['<doc a<doc b</doc>',
+                                           '<doc c\n<doc d</doc>']
+    assert old_split(text) == ['<doc a</doc>', '<doc c\n<doc d</doc>']
+
+
+def test_resume_from_snapshot_after_every_block():
+    data = make_text(3).encode('utf-8')
+    expected = split(data)
+    block_size = 11
+    for stop in range(0, len(data), block_size):
+        scanner = RecordScanner(b'<doc', b'</doc>')
+        records = []
+        for i in range(0, stop, block_size):
+            records.extend(scanner.feed(data[i:i + block_size]))
+        state = scanner.snapshot()
+        # later feeds must not modify a snapshot
+        scanner.feed(data[stop:])
+
+        resumed = RecordScanner(b'<doc', b'</doc>')
+        resumed.set_state(state)
+        for i in range(stop, len(data), block_size):
+            records.extend(resumed.feed(data[i:i + block_size]))
+        assert [decode_record(r, 'utf-8', END) for r in records] == expected
+
+
+def test_scan_mmap_from_position(tmp_path):
+    data = make_text(4).encode('utf-8')
+    fn = tmp_path / 'in.txt'
+    fn.write_bytes(data)
+    expected = split(data)
+    with open(str(fn), 'rb') as fd:
+        with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            scanner = RecordScanner(b'<doc', b'</doc>')
+            records = []
+            for record in scanner.scan(mm):
+                records.append(record)
+                if len(records) == 10:
+                    break
+            position = scanner.position
+            assert mm[position - len(END):position] == END.encode('utf-8')
+
+            resumed = RecordScanner(b'<doc', b'</doc>')
+            resumed.set_state(scanner.snapshot())
+            records.extend(resumed.scan(mm, position))
+    assert [decode_record(r, 'utf-8', END) for r in records] == expected
+
+
+def test_decode_record_newlines_and_last_line():
+    assert decode_record(b'<doc a\r\n b\r  c </doc>', 'utf-8', END) == \
+        '<doc a\n b\nc</doc>'
+    assert decode_record(b'<doc  a  </doc>', 'utf-8', END) == \
+        '<doc  a  </doc>'
+
+
+def test_euc_kr_records():
+    text = make_text(5)
+    assert split(text.replace('😀', '한').encode('euc-kr'), 5, 'euc-kr') == \
+        split(text.replace('😀', '한').encode('utf-8'))
+
+
+def test_check_encoding():
+    assert check_encoding('utf-8')
+    assert check_encoding('euc-kr')
+    assert not check_encoding('utf-16')
+    assert not check_encoding('cp037')
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from stage0 import MAGIC, Stage0Reader, Stage0Writer, convert
+
+
+def make_doc(i):
+    summary = [['요약 %d' % i, [['요약', 'NNG'], [str(i), 'SN']]]]
+    body = [['본문 문장 %d' % j, [['본문', 'NNG'], ['문장', 'NNG'],
+                                  ['w%d' % (i * 7 + j), 'NNP']]]
+            for j in range(i % 4)]
+    if i % 5 == 0:
+        body.append(['', []])
+    return {'body': body, 'summary': summary if i % 3 else []}
+
+
+DOCS = [make_doc(i) for i in range(40)]
+
+
+def write_stage0(fn, docs):
+    writer = Stage0Writer(fn)
+    for doc in docs:
+        writer.write(doc)
+    writer.close()
+
+
+def test_round_trip(tmp_path):
+    fn = str(tmp_path / 'docs.stage0.bin')
+    write_stage0(fn, DOCS)
+    with Stage0Reader(fn, morpheme_cache_size=4) as reader:
+        assert len(reader) == len(DOCS)
+        assert list(reader) == DOCS
+        assert reader[-1] == DOCS[-1]
+        assert [reader[n] for n in (17, 3, 17)] == \
+            [DOCS[17], DOCS[3], DOCS[17]]
+        with pytest.raises(IndexError):
+            reader[len(DOCS)]
+
+
+def test_empty_file(tmp_path):
+    fn = str(tmp_path / 'empty.stage0.bin')
+    write_stage0(fn, [])
+    with Stage0Reader(fn) as reader:
+        assert len(reader) == 0
+        assert list(reader) == []
+
+
+def test_unfinished_file_is_rejected(tmp_path):
+    fn = str(tmp_path / 'unfinished.stage0.bin')
+    writer = Stage0Writer(fn)
+    writer.write(DOCS[1])
+    writer.fd.close()
+    with open(fn, 'rb') as fd:
+        assert fd.read(len(MAGIC)) != MAGIC
+    with pytest.raises(ValueError):
+        Stage0Reader(fn)
+
+
+def test_more_than_256_tags_is_rejected(tmp_path):
+    writer = Stage0Writer(str(tmp_path / 'tags.stage0.bin'))
+    writer.write({'summary': [], 'body': [
+        ['s', [['m', 'T%d' % i] for i in range(256)]]]})
+    with pytest.raises(ValueError):
+        writer.write({'summary': [], 'body': [['s', [['m', 'T256']]]]})
+    writer.fd.close()
+
+
+def test_convert_json_stage0(tmp_path):
+    json_fn = str(tmp_path / 'docs.json.stage0')
+    with open(json_fn, 'w', encoding='utf-8') as fd:
+        json.dump(DOCS, fd, ensure_ascii=False)
+    assert convert(json_fn, json_fn + '.bin') == len(DOCS)
+    with Stage0Reader(json_fn + '.bin') as reader:
+        assert list(reader) == DOCS
@@ -0,0 +1,94 @@
+import bz2
+import gc
+import gzip
+import sys
+
+import h5py
+import pytest
+
+import text_to_hdf5
+from hdf5_writer import read_checkpoint
+
+
+class Interrupted(Exception):
+    pass
+
+
+def make_text(count=3000):
+    lines = []
+    for i in range(count):
+        lines.append('junk %d\n<doc id="%d">제목 %d\n' % (i, i, i))
+        lines.extend('본문 %d\n' % j for j in range(i % 3))
+        lines.append('</doc>\n')
+    return ''.join(lines).encode('utf-8')
+
+
+def write_input(tmp_path, suffix):
+    fn = str(tmp_path / ('in.txt' + suffix))
+    data = make_text()
+    if suffix == '.bz2':
+        # several streams, for --parallel-workers
+        data = b''.join(bz2.compress(data[i:i + 20000])
+                        for i in range(0, len(data), 20000))
+    elif suffix == '.gz':
+        data = gzip.compress(data)
+    with open(fn, 'wb') as fd:
+        fd.write(data)
+    return fn
+
+
+def convert(monkeypatch, fn, *options):
+    monkeypatch.setattr(sys, 'argv', ['text_to_hdf5.py', fn, '<doc id',
+                                      '--split-token-end', '</doc>',
+                                      '--disable-progress'] + list(options))
+    text_to_hdf5.main()
+    with h5py.File(fn + '.hdf5', 'r') as f:
+        return list(f['vlen_dataset'].asstr()[:])
+
+
+@pytest.mark.parametrize('suffix,options', [
+    ('', []),
+    ('.gz', ['--block-mb', '0.01']),
+    ('.bz2', ['--parallel-workers', '2', '--range-mb', '0.001']),
+])
+@pytest.mark.parametrize('interrupt_at', [1, 2])
+def test_resume_after_interruption(tmp_path, monkeypatch, suffix, options,
+                                   interrupt_at):
+    fn = write_input(tmp_path, suffix)
+    expected = convert(monkeypatch, fn, *options)
+    assert len(expected) == 3000
+    assert expected[2] == '<doc id="2">제목 2\n본문 0\n본문 1\n</doc>'
+
+    # checkpoint as often as possible, and die when about to record the
+    # (interrupt_at + 1)-th checkpoint, after writing records past the
+    # previous one
+    calls = []
+    write_checkpoint = text_to_hdf5.write_checkpoint
+
+    def interrupting_write_checkpoint(f, writer, **state):
+        calls.append(state)
+        if len(calls) > interrupt_at:
+            writer.flush()
+            f.close()
+            raise Interrupted()
+        write_checkpoint(f, writer, **state)
+
+    monkeypatch.setattr(text_to_hdf5, 'write_checkpoint',
+                        interrupting_write_checkpoint)
+    with pytest.raises(Interrupted):
+        convert(monkeypatch, fn, '--checkpoint-minutes', '1e-9', *options)
+    monkeypatch.setattr(text_to_hdf5, 'write_checkpoint', write_checkpoint)
+    # shut down the worker pool of the interrupted run, which inherited the
+    # output file and its lock
+    gc.collect()
+
+    with h5py.File(fn + '.hdf5', 'r') as f:
+        checkpoint = read_checkpoint(f)
+        assert not checkpoint['complete']
+        assert 0 < checkpoint['records'] < len(expected)
+
+    assert convert(monkeypatch, fn, '--resume', *options) == expected
+    # only the data and the completion marker are left
+    with h5py.File(fn + '.hdf5', 'r') as f:
+        assert list(f) == ['vlen_dataset']
+        assert read_checkpoint(f) == {'complete': True}
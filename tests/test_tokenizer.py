@@ -0,0 +1,61 @@
+import pytest
+
+from benchmark import SAMPLE_FRAGMENTS, generate_sentences, \
+    reference_tokenize
+from tokenizer import CLASSIFIED_CODE_POINTS, Tokenizer
+
+EDGE_CASES = [
+    '',
+    ' ',
+    ' \t\n\u3000\u2003 ',
+    '\x00',
+    'a\x00b \x00',
+    # combining marks: category M, so part of the surrounding word
+    'e\u0301 \u0301 \u0301.\u0301',
+    '\u1100\u1161\u11a8\ud55c\u318f',
+    # astral plane: letters, an emoji (symbol), punctuation and ideographs
+    # above the classified planes
+    '\U0001d400\U0001d401 \U0001f600x\U0001f600 \U00010100\U00020000'
+    '\U000e0001 \U0010fffd',
+    '...!!?? $$ ++ a.b,c',
+    'a\u200bb \u3000 c\x1c d\x85e',
+]
+
+SENTENCES = SAMPLE_FRAGMENTS + generate_sentences(200) + EDGE_CASES
+
+# every classified code point, plus a few above them, spread over strings
+# that mix all four classes
+CODE_POINTS = [''.join(chr(cp) for cp in range(start, start + 509))
+               for start in range(0, CLASSIFIED_CODE_POINTS + 0x2000, 509)]
+
+FLAGS = [(True, True), (True, False), (False, True), (False, False)]
+
+
+@pytest.mark.parametrize('keep_punctuation,keep_symbols', FLAGS)
+def test_tokenize_matches_reference(keep_punctuation, keep_symbols):
+    for s in SENTENCES:
+        assert Tokenizer.tokenize(s, keep_punctuation, keep_symbols) == \
+            reference_tokenize(s, keep_punctuation, keep_symbols)
+
+
+@pytest.mark.parametrize('keep_punctuation,keep_symbols', FLAGS)
+def test_tokenize_every_code_point(keep_punctuation, keep_symbols):
+    for s in CODE_POINTS:
+        assert Tokenizer.tokenize(s, keep_punctuation, keep_symbols) == \
+            reference_tokenize(s, keep_punctuation, keep_symbols)
+
+
+@pytest.mark.parametrize('keep_punctuation,keep_symbols', FLAGS)
+@pytest.mark.parametrize('input_strs', [
+    [],
+    SENTENCES,
+    EDGE_CASES,
+    # one astral string switches the whole batch to the full patterns
+    SAMPLE_FRAGMENTS + ['\U0001f600'],
+    ['', '\x00'],
+])
+def test_tokenize_batch(input_strs, keep_punctuation, keep_symbols):
+    assert Tokenizer.tokenize_batch(input_strs, keep_punctuation,
+                                    keep_symbols) == \
+        [reference_tokenize(s, keep_punctuation, keep_symbols)
+         for s in input_strs]
@@ -0,0 +1,193 @@
+'''
+Approximate nearest-neighbour (cosine) index over an EmbeddingStore
+
+IVF (inverted file) index: spherical k-means splits the unit vectors into
+nlist clusters, and a query only scores the rows of the nprobe clusters
+whose centroids are closest to it. nprobe trades speed for recall at query
+time (nprobe = nlist is exact search); more clusters make each probe
+cheaper but need more probes for the same recall.
+
+Example:
+
+    from embedding_store import EmbeddingStore
+    from ann_index import IVFIndex
+
+    store = EmbeddingStore('ko_wiki.w2v_200000_100d_tensors.bytes')
+    index = IVFIndex.build(store)
+    index.save('ko_wiki.ivf')
+
+    index = IVFIndex.load('ko_wiki.ivf', store=store)
+    scores, rows = index.search(store.lookup(['서울'], normalize=True), 10)
+
+An index is saved as a directory of .npy files, which load() memory-maps,
+and a meta.json of the store it was built over (row count, dimension and
+tensors filename); load() refuses an index that does not match the store
+it is given.
+It keeps its own copy of the unit vectors, ordered by cluster, so that a
+probe reads one contiguous range. See benchmark_ann.py for recall and
+throughput against exact search.
+'''
+import os
+import json
+import numpy as np
+
+_ARRAYS = ('centroids', 'offsets', 'rows', 'vectors')
+_META = 'meta.json'
+
+
+def _store_meta(store):
+    return {'rows': len(store), 'dim': int(store.dim),
+            'tensors_file': os.path.basename(store.tensors_fn)}
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def spherical_kmeans(vectors, nlist, iterations=10, seed=0):
+    '''
+    nlist unit centroids of the unit vectors, by k-means on cosine
+    similarity; empty clusters are restarted from random vectors
+    '''
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)]
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = np.bincount(assignment, minlength=nlist) == 0
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class IVFIndex(object):
+    '''
+    centroids   (nlist, dim) unit cluster centroids
+    offsets     rows of cluster c are rows[offsets[c]:offsets[c+1]]
+    rows        store row of each indexed vector, grouped by cluster
+    vectors     unit vector of each entry of rows
+    meta        rows, dim and tensors_file (base name) of the store
+    '''
+
+    def __init__(self, centroids, offsets, rows, vectors, meta=None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.vectors = vectors
+        self.meta = meta or {}
+
+    @classmethod
+    def build(cls, store, nlist=None, train_size=None, iterations=10,
+              seed=0):
+        '''
+        Index the rows of store, training nlist centroids (default about
+        4 * sqrt(rows)) on a random sample of train_size rows (default 64
+        per centroid)
+        '''
+        num_rows = len(store)
+        nlist = min(num_rows, nlist or max(1, int(4 * np.sqrt(num_rows))))
+        train_size = min(num_rows, train_size or 64 * nlist)
+
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(num_rows, train_size, replace=False))
+        centroids = spherical_kmeans(_normalize(store.take(sample)), nlist,
+                                     iterations=iterations, seed=seed)
+
+        assignment = np.empty(num_rows, dtype=np.int64)
+        for start, block in store.iter_blocks():
+            assignment[start:start + len(block)] = np.argmax(
+                _normalize(block) @ centroids.T, axis=1)
+
+        rows = np.argsort(assignment, kind='stable')
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=nlist), out=offsets[1:])
+
+        vectors = np.empty((num_rows, store.dim), dtype=np.float32)
+        for start in range(0, num_rows, store.block_rows):
+            block_rows = rows[start:start + store.block_rows]
+            vectors[start:start + len(block_rows)] = \
+                _normalize(store.take(block_rows))
+        return cls(centroids, offsets, rows, vectors, _store_meta(store))
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+        with open(os.path.join(path, _META), 'w', encoding='utf-8') as fd:
+            json.dump(self.meta, fd)
+
+    @classmethod
+    def load(cls, path, mmap=True, store=None):
+        '''
+        Load the index saved in path; with a store, ValueError unless the
+        index was built over a store of the same shape and tensors filename
+        '''
+        meta_fn = os.path.join(path, _META)
+        meta = None
+        if os.path.exists(meta_fn):
+            with open(meta_fn, encoding='utf-8') as fd:
+                meta = json.load(fd)
+        index = cls(*(np.load(os.path.join(path, name + '.npy'),
+                              mmap_mode='r' if mmap else None)
+                      for name in _ARRAYS), meta=meta)
+        if store is not None and not index.matches(store):
+            raise ValueError('index %s was built over %s, not %s' %
+                             (path, index.meta or 'an unknown store',
+                              _store_meta(store)))
+        return index
+
+    def matches(self, store):
+        '''
+        Whether the index was built over a store like store (same row count,
+        dimension and tensors filename)
+        '''
+        return self.meta == _store_meta(store) and \
+            len(self) == len(store) and self.centroids.shape[1] == store.dim
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def search(self, query_vectors, k, nprobe=8):
+        '''
+        (scores, rows) of the k most cosine-similar rows found for each
+        unit query vector among the nprobe closest clusters, both
+        (queries, k) from the most similar; rows of -1 pad the results
+        when the probed clusters hold fewer than k rows
+        '''
+        query_vectors = np.atleast_2d(np.asarray(query_vectors,
+                                                 dtype=np.float32))
+        nprobe = min(nprobe, self.nlist)
+        scores = np.full((len(query_vectors), k), -np.inf, dtype=np.float32)
+        rows = np.full((len(query_vectors), k), -1, dtype=np.int64)
+
+        centroid_scores = query_vectors @ self.centroids.T
+        if nprobe < self.nlist:
+            probes = np.argpartition(-centroid_scores, nprobe - 1,
+                                     axis=1)[:, :nprobe]
+        else:
+            probes = np.broadcast_to(np.arange(self.nlist),
+                                     (len(query_vectors), self.nlist))
+
+        offsets = np.asarray(self.offsets)
+        for q, query in enumerate(query_vectors):
+            # each cluster is a contiguous range of the index
+            ranges = [(offsets[c], offsets[c + 1]) for c in probes[q]]
+            candidate_scores = np.concatenate(
+                [self.vectors[a:b] @ query for a, b in ranges])
+            n = min(k, len(candidate_scores))
+            if n == 0:
+                continue
+            candidate_rows = np.concatenate([self.rows[a:b]
+                                             for a, b in ranges])
+            best = np.argpartition(-candidate_scores, n - 1)[:n]
+            best = best[np.argsort(-candidate_scores[best], kind='stable')]
+            scores[q, :n] = candidate_scores[best]
+            rows[q, :n] = candidate_rows[best]
+        return scores, rows
@@ -0,0 +1,92 @@
+'''
+Measure recall@k and queries per second of an IVF index against exact search
+
+Builds (or loads, if --index-dir already holds one built over the same
+export) an IVFIndex over a w2v_tensorboard.py export, then queries it with
+the vectors of random words at every --nprobe setting and compares the
+results with exact cosine top-k search of EmbeddingStore.
+
+Example:
+
+$ python3 benchmark_ann.py ko_wiki.w2v_200000_100d_tensors.bytes
+    --index-dir ko_wiki.ivf --nprobe 1,4,16,64
+'''
+import os
+import time
+import logging
+import argparse
+import numpy as np
+from embedding_store import EmbeddingStore
+from ann_index import IVFIndex
+
+logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', \
+    level=logging.INFO)
+
+logger = logging.getLogger('BenchmarkANN')
+
+parser = argparse.ArgumentParser(description='Benchmark an approximate \
+    nearest-neighbour index against exact search')
+
+# Required positional argument
+parser.add_argument('tensors_file', type=str,
+                    help='.bytes tensors file written by w2v_tensorboard.py \
+                    (its labels file is expected next to it)')
+parser.add_argument('--index-dir', type=str, default=None,
+                    help='Directory to load the index from, or to save it \
+                    to after building it (default: build, do not save)')
+parser.add_argument('--nlist', type=int, default=0,
+                    help='Clusters of a newly built index (default: 0, \
+                    about 4 * sqrt(rows))')
+parser.add_argument('--nprobe', type=str, default='1,4,16,64',
+                    help='Comma-separated clusters probed per query \
+                    (default: "1,4,16,64")')
+parser.add_argument('--k', type=int, default=10,
+                    help='Neighbours per query (default: 10)')
+parser.add_argument('--queries', type=int, default=1000,
+                    help='Random query words (default: 1000)')
+parser.add_argument('--seed', type=int, default=0,
+                    help='Random seed of the query words (default: 0)')
+
+args = parser.parse_args()
+
+store = EmbeddingStore(args.tensors_file)
+
+index = None
+if args.index_dir and os.path.exists(os.path.join(args.index_dir, \
+        'centroids.npy')):
+    logger.info('Loading index %s' % args.index_dir)
+    index = IVFIndex.load(args.index_dir)
+    if not index.matches(store):
+        logger.warning('Index %s was built over %s, not %s: rebuilding it' % \
+            (args.index_dir, index.meta or 'an unknown store', \
+            args.tensors_file))
+        index = None
+
+if index is None:
+    start = time.perf_counter()
+    index = IVFIndex.build(store, nlist=args.nlist or None)
+    logger.info('Built index of %d clusters over %d rows in %.2fs' % \
+        (index.nlist, len(index), time.perf_counter() - start))
+    if args.index_dir:
+        index.save(args.index_dir)
+
+rng = np.random.default_rng(args.seed)
+query_rows = rng.choice(len(store), min(args.queries, len(store)), \
+    replace=False)
+queries = store.lookup([store.words[row] for row in query_rows], \
+    normalize=True)
+
+start = time.perf_counter()
+_, exact_rows = store.top_k(queries, args.k)
+elapsed = time.perf_counter() - start
+logger.info('exact: %.1f queries/s' % (len(queries) / elapsed))
+
+for nprobe in [int(n) for n in args.nprobe.split(',')]:
+    start = time.perf_counter()
+    _, rows = index.search(queries, args.k, nprobe=nprobe)
+    elapsed = time.perf_counter() - start
+    found = sum(len(np.intersect1d(a[a >= 0], b)) \
+        for a, b in zip(rows, exact_rows))
+    logger.info('nprobe=%d: recall@%d %.4f, %.1f queries/s' % \
+        (nprobe, args.k, found / float(exact_rows.size), \
+        len(queries) / elapsed))
@@ -0,0 +1,126 @@
+'''
+Measure chunking/compression settings of the converters' vlen datasets
+
+Rewrites the records of an existing converter output with every combination
+of the given settings, and reports write time, file size, and sequential
+and random read throughput for each.
+
+Example:
+
+$ python3 benchmark_hdf5.py /tmp/wikicomp-2014_arko.xml.bz2.hdf5
+    --chunk-rows 256,1024,4096 --compression gzip,lzf,none
+    --compression-levels 1,4,9
+
+Note: HDF5 keeps the bytes of variable-length strings in the file's global
+heap, and filters only compress the chunks of heap references. Expect
+compression to matter much less for file size than for bz2 sources.
+'''
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+import h5py
+from hdf5_writer import BufferedDatasetWriter, create_vlen_dataset, \
+    COMPRESSION_CHOICES
+
+logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', \
+    level=logging.INFO)
+
+logger = logging.getLogger('BenchmarkHDF5')
+
+parser = argparse.ArgumentParser(description='Benchmark chunking and \
+    compression settings of HDF5 vlen datasets')
+
+# Required positional argument
+parser.add_argument('input_file', type=str,
+                    help='HDF5 file written by text_to_hdf5.py or \
+                    json_to_hdf5.py')
+parser.add_argument('--dataset-name', type=str, default='vlen_dataset',
+                    help='HDF5 dataset name (default: "vlen_dataset")')
+parser.add_argument('--limit', type=int, default=200000,
+                    help='Use at most the first N records (default: 200000)')
+parser.add_argument('--chunk-rows', type=str, default='256,1024,4096',
+                    help='Comma-separated chunk sizes in records \
+                    (default: "256,1024,4096")')
+parser.add_argument('--compression', type=str, default='gzip,lzf,none',
+                    help='Comma-separated compression filters \
+                    (default: "gzip,lzf,none")')
+parser.add_argument('--compression-levels', type=str, default='1,4,9',
+                    help='Comma-separated gzip levels (default: "1,4,9")')
+parser.add_argument('--random-reads', type=int, default=2000,
+                    help='Random single-record reads per setting \
+                    (default: 2000)')
+parser.add_argument('--tmp-dir', type=str, default=None,
+                    help='Directory for the rewritten files (default: \
+                    system temp directory)')
+
+args = parser.parse_args()
+
+logger.info('Loading records from %s:%s' % (args.input_file, \
+    args.dataset_name))
+with h5py.File(args.input_file, 'r') as f:
+    dset = f[args.dataset_name]
+    records = list(dset.asstr()[:min(args.limit, dset.shape[0])])
+
+assert len(records) > 0, 'no records to benchmark with'
+
+data_mb = sum(len(r.encode('utf-8')) for r in records) / 1048576.0
+logger.info('Loaded %d records (%.2fMB)' % (len(records), data_mb))
+
+settings = []
+for chunk_rows in [int(c) for c in args.chunk_rows.split(',')]:
+    for compression in args.compression.split(','):
+        assert compression in COMPRESSION_CHOICES, compression
+        if compression == 'gzip':
+            for level in [int(l) for l in args.compression_levels.split(',')]:
+                settings.append((chunk_rows, compression, level))
+        else:
+            settings.append((chunk_rows, compression, None))
+
+rnd = random.Random(0)
+random_indices = [rnd.randrange(len(records)) \
+    for _ in range(args.random_reads)]
+
+print('%10s %12s %10s %10s %14s %14s' % ('chunk_rows', 'compression', \
+    'write_s', 'size_mb', 'seq_read_mb/s', 'rand_reads/s'))
+
+for chunk_rows, compression, level in settings:
+    fd, fn = tempfile.mkstemp(suffix='.hdf5', dir=args.tmp_dir)
+    os.close(fd)
+
+    try:
+        start = time.perf_counter()
+        with h5py.File(fn, 'w') as f:
+            dset = create_vlen_dataset(f, args.dataset_name, \
+                chunk_rows=chunk_rows, compression=compression, \
+                compression_level=level)
+            writer = BufferedDatasetWriter(dset)
+            for record in records:
+                writer.append(record)
+            writer.close()
+        write_time = time.perf_counter() - start
+        size_mb = os.path.getsize(fn) / 1048576.0
+
+        with h5py.File(fn, 'r') as f:
+            dset = f[args.dataset_name].asstr()
+
+            start = time.perf_counter()
+            for i in range(0, len(records), chunk_rows):
+                dset[i:i+chunk_rows]
+            seq_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for i in random_indices:
+                dset[i]
+            rand_time = time.perf_counter() - start
+    finally:
+        os.remove(fn)
+
+    print('%10d %12s %10.2f %10.2f %14.2f %14.1f' % (chunk_rows, \
+        compression + ('-%d' % level if level is not None else ''), \
+        write_time, size_mb, data_mb / seq_time, \
+        len(random_indices) / rand_time))
+    sys.stdout.flush()
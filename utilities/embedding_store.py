@@ -0,0 +1,324 @@
+'''
+Read-only word vector store over the files written by w2v_tensorboard.py
+
+Example:
+
+    from embedding_store import EmbeddingStore
+
+    with EmbeddingStore('ko_wiki.w2v_200000_100d_tensors.bytes') as store:
+        vectors = store.lookup(['서울', '부산'])
+        for word, score in store.most_similar('서울', topn=10)[0]:
+            ...
+
+The .bytes matrix is memory-mapped rather than read, so a store opens in
+the time it takes to read the labels file, and processes opening the same
+file share its pages through the OS page cache. Similarity queries are
+exact (brute-force) cosine top-k, scored a block of rows at a time against
+the row norms, which are computed once on the first query.
+
+Besides float32 (_tensors.bytes), the store reads the float16
+(_tensors.f16.bytes) and int8 (_tensors.i8.bytes, with a float32 scale per
+row in _scales.bytes) exports of w2v_tensorboard.py --dtype. Quantized
+rows stay quantized in memory and are converted to float32 a block (or a
+lookup) at a time. quantize() and write_quantized() are the writing side of
+those formats, used by w2v_tensorboard.py.
+'''
+import numpy as np
+
+# tensors file suffix -> (export dtype, matrix dtype in the file)
+TENSOR_FORMATS = {
+    '_tensors.bytes': ('float32', '<f4'),
+    '_tensors.f16.bytes': ('float16', '<f2'),
+    '_tensors.i8.bytes': ('int8', 'i1'),
+}
+
+
+def tensors_filename(base_fn, dtype='float32'):
+    '''
+    Tensors file of the given export dtype for the export base name
+    '''
+    for suffix, (format_dtype, _) in TENSOR_FORMATS.items():
+        if format_dtype == dtype:
+            return base_fn + suffix
+    raise ValueError('unknown export dtype: %s' % dtype)
+
+
+def split_tensors_filename(tensors_fn):
+    '''
+    (export base name, export dtype) of a w2v_tensorboard.py tensors file
+    '''
+    for suffix, (dtype, _) in TENSOR_FORMATS.items():
+        if tensors_fn.endswith(suffix):
+            return tensors_fn[:-len(suffix)], dtype
+    raise ValueError('not a w2v_tensorboard.py tensors file: %s' % tensors_fn)
+
+
+def labels_filename(tensors_fn):
+    '''
+    Labels file written by w2v_tensorboard.py along with tensors_fn
+    '''
+    return split_tensors_filename(tensors_fn)[0] + '_labels.tsv'
+
+
+def quantize(vectors, dtype):
+    '''
+    (quantized vectors, float32 scale of each row or None) of float32
+    vectors; int8 rows are scaled so that their largest magnitude is 127
+    '''
+    if dtype == 'float32':
+        return vectors.astype('<f4', copy=False), None
+    if dtype == 'float16':
+        return vectors.astype('<f2'), None
+    assert dtype == 'int8', 'unknown export dtype: %s' % dtype
+    scales = (np.abs(vectors).max(axis=1) / 127.0).astype('<f4')
+    quantized = np.rint(vectors / np.where(scales > 0, scales, 1.0)[:, None])
+    return np.clip(quantized, -127, 127).astype('i1'), scales
+
+
+def dequantize(vectors, scales=None):
+    '''
+    float32 vectors of quantized rows (and their scales, for int8)
+    '''
+    if scales is not None:
+        return vectors.astype(np.float32) * scales[:, None]
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def unit_rows(vectors):
+    '''
+    float64 copy of vectors scaled to unit length (null rows stay null)
+    '''
+    vectors = vectors.astype(np.float64)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def write_quantized(bytes_fd, scales_fd, blocks, dtype, pairs_per_block=1000,
+                    seed=0):
+    '''
+    Write each float32 block quantized to dtype to bytes_fd (and its row
+    scales to scales_fd, for int8); return the cosine errors of the rows
+    (1 - cosine of a row and its quantized version) and of random pairs of
+    rows of each block (difference of their cosine similarity), and the
+    number of null rows, which have no cosine and are left out of the row
+    errors
+    '''
+    rng = np.random.default_rng(seed)
+    row_errors = []
+    pair_errors = []
+    null_rows = 0
+    for block in blocks:
+        block = block.astype('<f4', copy=False)
+        quantized, scales = quantize(block, dtype)
+        quantized.tofile(bytes_fd)
+        if scales is not None:
+            scales.tofile(scales_fd)
+
+        original = unit_rows(block)
+        restored = unit_rows(dequantize(quantized, scales))
+        non_null = original.any(axis=1)
+        null_rows += len(block) - int(non_null.sum())
+        row_errors.append(1.0 - np.einsum('ij,ij->i', original[non_null],
+                                          restored[non_null]))
+        a = rng.integers(0, len(block), pairs_per_block)
+        b = rng.integers(0, len(block), pairs_per_block)
+        pair_errors.append(np.abs(
+            np.einsum('ij,ij->i', original[a], original[b]) -
+            np.einsum('ij,ij->i', restored[a], restored[b])))
+    return np.concatenate(row_errors), np.concatenate(pair_errors), \
+        null_rows
+
+
+def read_labels(labels_fn):
+    '''
+    (words, counts) of a w2v_tensorboard.py labels file
+    '''
+    words = []
+    counts = []
+    with open(labels_fn, encoding='utf-8') as fd:
+        header = fd.readline()
+        assert header.rstrip('\n') == 'word\tcount', \
+            'unexpected labels header in %s' % labels_fn
+        for ln in fd:
+            word, count = ln.rstrip('\n').rsplit('\t', 1)
+            words.append(word)
+            counts.append(int(count))
+    return words, np.array(counts, dtype=np.int64)
+
+
+class EmbeddingStore(object):
+    '''
+    Word vectors of a w2v_tensorboard.py export, looked up by word
+
+    block_rows is the number of rows scored (and dequantized) at a time by
+    most_similar().
+    '''
+
+    def __init__(self, tensors_fn, labels_fn=None, block_rows=65536):
+        self.tensors_fn = tensors_fn
+        base_fn, self.dtype = split_tensors_filename(tensors_fn)
+        self.words, self.counts = read_labels(labels_fn or
+                                              labels_filename(tensors_fn))
+        self.index = {word: row for row, word in enumerate(self.words)}
+        self.block_rows = block_rows
+
+        self.vectors = self._open_matrix(
+            tensors_fn, TENSOR_FORMATS[tensors_fn[len(base_fn):]][1],
+            len(self.words))
+        self.dim = self.vectors.shape[1]
+        self.scales = None
+        if self.dtype == 'int8':
+            self.scales = self._open_matrix(base_fn + '_scales.bytes', '<f4',
+                                            len(self.words))[:, 0]
+        self._inv_norms = None
+
+    def _open_matrix(self, fn, dtype, num_rows):
+        matrix = np.memmap(fn, dtype=dtype, mode='r')
+        assert num_rows > 0 and matrix.size % num_rows == 0, \
+            '%s does not hold %d rows' % (fn, num_rows)
+        return matrix.reshape(num_rows, matrix.size // num_rows)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.index
+
+    def rows(self, words):
+        '''
+        Row of each of words, -1 where a word is unknown
+        '''
+        return np.array([self.index.get(word, -1) for word in words],
+                        dtype=np.int64)
+
+    def row_vectors(self, start, stop):
+        '''
+        float32 vectors of rows [start, stop)
+        '''
+        return dequantize(self.vectors[start:stop],
+                          None if self.scales is None
+                          else self.scales[start:stop])
+
+    def take(self, rows):
+        '''
+        float32 vectors of the given rows, in the given order
+        '''
+        rows = np.asarray(rows, dtype=np.int64)
+        return dequantize(self.vectors[rows],
+                          None if self.scales is None else self.scales[rows])
+
+    def lookup(self, words, normalize=False):
+        '''
+        Vectors of words as a (len(words), dim) float32 matrix, unit length
+        if normalize is set; KeyError if a word is unknown
+        '''
+        rows = self.rows(words)
+        if (rows < 0).any():
+            raise KeyError(words[int(np.argmax(rows < 0))])
+        vectors = self.take(rows)
+        if normalize:
+            vectors = vectors * self.inv_norms()[rows][:, None]
+        return vectors
+
+    def __getitem__(self, word):
+        return self.lookup([word])[0]
+
+    def iter_blocks(self):
+        '''
+        (start row, float32 vectors) for every block of block_rows rows
+        '''
+        for start in range(0, len(self), self.block_rows):
+            yield start, self.row_vectors(start,
+                                          min(len(self),
+                                              start + self.block_rows))
+
+    def inv_norms(self):
+        '''
+        1 / length of every row (0 for null vectors), computed on first use
+        '''
+        if self._inv_norms is None:
+            inv_norms = np.zeros(len(self), dtype=np.float32)
+            for start, block in self.iter_blocks():
+                norms = np.sqrt(np.einsum('ij,ij->i', block, block))
+                np.divide(1.0, norms, out=inv_norms[start:start + len(block)],
+                          where=norms > 0)
+            self._inv_norms = inv_norms
+        return self._inv_norms
+
+    def _query_matrix(self, queries):
+        # (unit query vectors, row of each query word or -1)
+        if isinstance(queries, str):
+            queries = [queries]
+        if isinstance(queries, np.ndarray):
+            vectors = np.atleast_2d(queries).astype(np.float32)
+            rows = np.full(len(vectors), -1, dtype=np.int64)
+        else:
+            rows = self.rows(queries)
+            if (rows < 0).any():
+                raise KeyError(queries[int(np.argmax(rows < 0))])
+            vectors = self.take(rows)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0), rows
+
+    def most_similar(self, queries, topn=10):
+        '''
+        The topn most cosine-similar words of each query, as lists of
+        (word, similarity) from the most similar
+
+        queries is a word, a list of words (each excluded from its own
+        results), or a vector or matrix of query vectors.
+        '''
+        query_vectors, query_rows = self._query_matrix(queries)
+        scores, rows = self.top_k(query_vectors, topn,
+                                  exclude_rows=query_rows)
+        return [[(self.words[row], float(score))
+                 for score, row in zip(q_scores, q_rows) if row >= 0]
+                for q_scores, q_rows in zip(scores, rows)]
+
+    def top_k(self, query_vectors, k, exclude_rows=None):
+        '''
+        (scores, rows) of the k rows most cosine-similar to each unit query
+        vector, both (queries, k) from the most similar; rows of -1 pad
+        the results when there are fewer than k rows
+        '''
+        num_queries = len(query_vectors)
+        best_scores = np.full((num_queries, k), -np.inf, dtype=np.float32)
+        best_rows = np.full((num_queries, k), -1, dtype=np.int64)
+        query_t = np.ascontiguousarray(query_vectors.T, dtype=np.float32)
+        inv_norms = self.inv_norms()
+
+        for start, block in self.iter_blocks():
+            scores = (block @ query_t).T
+            scores *= inv_norms[start:start + len(block)]
+            if exclude_rows is not None:
+                for q, row in enumerate(exclude_rows):
+                    if start <= row < start + len(block):
+                        scores[q, row - start] = -np.inf
+
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate(
+                [best_rows, np.broadcast_to(
+                    np.arange(start, start + len(block)),
+                    (num_queries, len(block)))], axis=1)
+            if scores.shape[1] > k:
+                keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, keep, axis=1)
+                rows = np.take_along_axis(rows, keep, axis=1)
+            best_scores, best_rows = scores, rows
+
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_rows[np.isneginf(best_scores)] = -1
+        return best_scores, best_rows
+
+    def close(self):
+        self.vectors = None
+        self.scales = None
+        self._inv_norms = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,262 @@
+'''
+Random-access reader for the vlen_dataset written by text_to_hdf5.py and
+json_to_hdf5.py
+
+Example:
+
+    from hdf5_corpus import HDF5Corpus
+
+    with HDF5Corpus('/tmp/wikicomp-2014_arko.xml.bz2.hdf5') as corpus:
+        print(len(corpus), corpus[0])
+        for record in corpus[1000:1010]:
+            ...
+        batch = corpus.take([5, 900000, 17, 6])
+
+HDF5 reads and decompresses whole chunks, so single records and batches
+(take()) are served from an LRU cache of decoded chunks, and a batch is
+read chunk by chunk in file order. Contiguous slices are read directly.
+With decode_json=True (json_to_hdf5.py output), records are returned
+json.loads()-ed.
+
+For multi-process consumers, get_shards() splits a corpus into contiguous,
+chunk-aligned shards. A shard is a plain description that can be sent to a
+worker; iterating over it opens the file in the worker's own process and
+reads ahead on a background thread:
+
+    from multiprocessing import Pool
+    from hdf5_corpus import get_shards
+
+    def count_records(shard):
+        return sum(1 for record in shard)
+
+    with Pool(4) as pool:
+        counts = pool.map(count_records, get_shards(fn, 4))
+'''
+import json
+import queue
+import threading
+import collections
+import h5py
+import numpy as np
+
+
+class HDF5Corpus(object):
+    '''
+    Records of a 1-D variable-length string dataset
+
+    cache_mb limits the decoded chunks kept in memory, counted as the
+    length of their records.
+    '''
+
+    def __init__(self, fn, dataset_name='vlen_dataset', cache_mb=256.0,
+                 decode_json=False):
+        self.fn = fn
+        self.f = h5py.File(fn, 'r')
+        self.dset = self.f[dataset_name]
+        self.strings = self.dset.asstr()
+        self.decode_json = decode_json
+
+        self.chunk_rows = self.dset.chunks[0] if self.dset.chunks else 1024
+        self.cache_bytes = int(cache_mb * 1048576)
+        # chunk index -> (records, size), least recently used first
+        self.cache = collections.OrderedDict()
+        self.cached_bytes = 0
+
+        self.chunk_reads = 0
+        self.cache_hits = 0
+
+    def __len__(self):
+        return self.dset.shape[0]
+
+    def _decode(self, records):
+        if self.decode_json:
+            return [json.loads(record) for record in records]
+        return list(records)
+
+    def chunk_count(self):
+        return -(-len(self) // self.chunk_rows)
+
+    def read_chunk(self, chunk_idx):
+        '''
+        Decoded records of chunk chunk_idx, through the cache
+        '''
+        cached = self.cache.get(chunk_idx)
+        if cached is not None:
+            self.cache.move_to_end(chunk_idx)
+            self.cache_hits += 1
+            return cached[0]
+
+        start = chunk_idx * self.chunk_rows
+        records = self.strings[start:min(len(self), start + self.chunk_rows)]
+        self.chunk_reads += 1
+        size = sum(len(record) for record in records)
+        records = self._decode(records)
+
+        self.cache[chunk_idx] = (records, size)
+        self.cached_bytes += size
+        while self.cached_bytes > self.cache_bytes and len(self.cache) > 1:
+            _, (_, evicted) = self.cache.popitem(last=False)
+            self.cached_bytes -= evicted
+        return records
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return self.take(range(start, stop, step))
+            if start >= stop:
+                return []
+            return self._decode(self.strings[start:stop])
+
+        if isinstance(key, (list, tuple, np.ndarray, range)):
+            return self.take(key)
+
+        n = int(key)
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError('record index out of range')
+        return self.read_chunk(n // self.chunk_rows)[n % self.chunk_rows]
+
+    def take(self, indices):
+        '''
+        Records at indices (in the given order), reading each chunk they
+        fall into once, in file order
+        '''
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        n = len(self)
+        indices = np.where(indices < 0, indices + n, indices)
+        if indices.size and (indices.min() < 0 or indices.max() >= n):
+            raise IndexError('record index out of range')
+
+        out = [None] * len(indices)
+        chunks = indices // self.chunk_rows
+        order = np.argsort(chunks, kind='stable')
+        for i in order:
+            out[i] = self.read_chunk(int(chunks[i]))[
+                int(indices[i]) % self.chunk_rows]
+        return out
+
+    def __iter__(self):
+        for chunk_idx in range(self.chunk_count()):
+            start = chunk_idx * self.chunk_rows
+            # sequential reads bypass the cache
+            for record in self._decode(
+                    self.strings[start:min(len(self),
+                                           start + self.chunk_rows)]):
+                yield record
+
+    def close(self):
+        self.cache.clear()
+        self.cached_bytes = 0
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def shard_ranges(record_count, chunk_rows, shard_count):
+    '''
+    Split [0, record_count) into shard_count contiguous (start, stop)
+    ranges of whole chunks, as even as possible (some may be empty)
+    '''
+    chunk_count = -(-record_count // chunk_rows)
+    ranges = []
+    for i in range(shard_count):
+        start = min(record_count, chunk_count * i // shard_count * chunk_rows)
+        stop = min(record_count,
+                   chunk_count * (i + 1) // shard_count * chunk_rows)
+        ranges.append((start, stop))
+    return ranges
+
+
+class CorpusShard(object):
+    '''
+    Records [start, stop) of a corpus, read in the process that iterates
+    over it
+
+    Nothing is opened until iteration starts, so shards can be created in a
+    parent process and pickled to workers; each iteration opens its own
+    file handle, and a background thread reads up to prefetch_chunks
+    chunks ahead while records are decoded and consumed.
+    '''
+
+    def __init__(self, fn, start, stop, dataset_name='vlen_dataset',
+                 chunk_rows=1024, decode_json=False, prefetch_chunks=2):
+        self.fn = fn
+        self.start = start
+        self.stop = stop
+        self.dataset_name = dataset_name
+        self.chunk_rows = chunk_rows
+        self.decode_json = decode_json
+        self.prefetch_chunks = prefetch_chunks
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def _prefetch(self, strings, chunks, stop):
+        def put(item):
+            while not stop.is_set():
+                try:
+                    chunks.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            for start in range(self.start, self.stop, self.chunk_rows):
+                if not put(strings[start:min(self.stop,
+                                             start + self.chunk_rows)]):
+                    return
+            put(None)
+        except BaseException as e:
+            put(e)
+
+    def __iter__(self):
+        if self.start >= self.stop:
+            return
+
+        with h5py.File(self.fn, 'r') as f:
+            strings = f[self.dataset_name].asstr()
+            chunks = queue.Queue(self.prefetch_chunks)
+            stop = threading.Event()
+            reader = threading.Thread(target=self._prefetch,
+                                      args=(strings, chunks, stop),
+                                      daemon=True)
+            reader.start()
+            try:
+                while True:
+                    records = chunks.get()
+                    if records is None:
+                        break
+                    if isinstance(records, BaseException):
+                        raise records
+                    for record in records:
+                        yield json.loads(record) if self.decode_json \
+                            else record
+            finally:
+                # the consumer may stop early; let the reader finish before
+                # the file is closed
+                stop.set()
+                reader.join()
+
+
+def get_shards(fn, shard_count, dataset_name='vlen_dataset',
+               decode_json=False, prefetch_chunks=2):
+    '''
+    Split the dataset of fn into shard_count chunk-aligned CorpusShards
+    '''
+    with h5py.File(fn, 'r') as f:
+        dset = f[dataset_name]
+        record_count = dset.shape[0]
+        chunk_rows = dset.chunks[0] if dset.chunks else 1024
+
+    return [CorpusShard(fn, start, stop, dataset_name=dataset_name,
+                        chunk_rows=chunk_rows, decode_json=decode_json,
+                        prefetch_chunks=prefetch_chunks)
+            for start, stop in shard_ranges(record_count, chunk_rows,
+                                            shard_count)]
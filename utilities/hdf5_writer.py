@@ -0,0 +1,194 @@
+'''
+Buffered appends to a 1-D resizable HDF5 dataset, shared by the converters
+
+Records are collected in memory and written with one slice assignment per
+batch, and the dataset grows geometrically instead of a fixed number of
+rows at a time, so h5py pays its per-selection and chunk rewrite costs once
+per batch rather than once per record.
+'''
+import h5py
+import numpy as np
+
+# defaults of the dataset layout options, see benchmark_hdf5.py
+DEFAULT_CHUNK_ROWS = 1024
+DEFAULT_COMPRESSION = 'gzip'
+DEFAULT_COMPRESSION_LEVEL = 4
+
+COMPRESSION_CHOICES = ('gzip', 'lzf', 'none')
+
+
+class BufferedDatasetWriter(object):
+    '''
+    Append records to dset, flushing whenever max_rows records or roughly
+    max_bytes of record data (counted as len() of each record) are buffered
+
+    The dataset is grown to max(needed, size * growth, min_rows) rows when
+    it runs out of room; close() flushes and shrinks it to the number of
+    records written.
+    '''
+
+    def __init__(self, dset, max_rows=4096, max_bytes=64 * 1048576,
+                 growth=2.0, min_rows=1024, written=0):
+        assert growth > 1.0
+        self.dset = dset
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.growth = growth
+        self.min_rows = min_rows
+
+        # number of records written to the dataset (excluding the buffer);
+        # a resumed conversion starts after the records it keeps
+        self.written = written
+        self.buffer = []
+        self.buffer_bytes = 0
+
+    @property
+    def count(self):
+        '''
+        Number of records appended so far, including buffered ones
+        '''
+        return self.written + len(self.buffer)
+
+    def append(self, record):
+        self.buffer.append(record)
+        self.buffer_bytes += len(record)
+        if len(self.buffer) >= self.max_rows or \
+                self.buffer_bytes >= self.max_bytes:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+
+        needed = self.written + len(self.buffer)
+        if self.dset.shape[0] < needed:
+            size = max(needed, int(self.dset.shape[0] * self.growth),
+                       self.min_rows)
+            if self.dset.maxshape[0] is not None:
+                size = min(size, self.dset.maxshape[0])
+            self.dset.resize((size, ))
+
+        self.dset[self.written:needed] = np.array(self.buffer, dtype=object)
+        self.written = needed
+        self.buffer = []
+        self.buffer_bytes = 0
+
+    def close(self):
+        '''
+        Flush and resize the dataset down to the actual record count
+        '''
+        self.flush()
+        self.dset.resize((self.written, ))
+
+
+def add_buffer_arguments(parser):
+    '''
+    Add the --buffer-rows/--buffer-mb options of BufferedDatasetWriter to a
+    converter's argument parser
+    '''
+    parser.add_argument('--buffer-rows', type=int, default=4096,
+                        help='Records buffered in memory before each HDF5 \
+                        write (default: 4096)')
+    parser.add_argument('--buffer-mb', type=float, default=64.0,
+                        help='Record data (MB) buffered in memory before \
+                        each HDF5 write (default: 64)')
+
+
+def create_vlen_dataset(f, name, chunk_rows=DEFAULT_CHUNK_ROWS,
+                        compression=DEFAULT_COMPRESSION,
+                        compression_level=DEFAULT_COMPRESSION_LEVEL,
+                        maxshape=2**32):
+    '''
+    Create an empty, resizable variable-length string dataset with explicit
+    chunking and compression (compression_level only applies to gzip)
+    '''
+    if compression == 'none':
+        compression = None
+    return f.create_dataset(name, (0,), dtype=h5py.special_dtype(vlen=str),
+                            chunks=(chunk_rows,), maxshape=(maxshape,),
+                            compression=compression,
+                            compression_opts=compression_level
+                            if compression == 'gzip' else None)
+
+
+def add_dataset_arguments(parser):
+    '''
+    Add the chunking and compression options of create_vlen_dataset() to a
+    converter's argument parser
+    '''
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help='Records per HDF5 chunk (default: %d)' %
+                        DEFAULT_CHUNK_ROWS)
+    parser.add_argument('--compression', type=str,
+                        default=DEFAULT_COMPRESSION,
+                        choices=COMPRESSION_CHOICES,
+                        help='HDF5 compression filter (default: "%s")' %
+                        DEFAULT_COMPRESSION)
+    parser.add_argument('--compression-level', type=int,
+                        default=DEFAULT_COMPRESSION_LEVEL,
+                        help='gzip compression level 0-9 (default: %d)' %
+                        DEFAULT_COMPRESSION_LEVEL)
+
+
+CHECKPOINT_PREFIX = 'checkpoint_'
+
+
+def write_checkpoint(f, writer, **state):
+    '''
+    Flush writer and record state (plus the record count) as checkpoint_*
+    attributes of f, then flush f, so that a conversion that dies later can
+    be resumed from here
+    '''
+    writer.flush()
+    for name, value in state.items():
+        f.attrs[CHECKPOINT_PREFIX + name] = value
+    f.attrs[CHECKPOINT_PREFIX + 'records'] = writer.written
+    f.flush()
+
+
+def read_checkpoint(f):
+    '''
+    The state recorded by the last write_checkpoint() to f, or None
+    '''
+    state = {name[len(CHECKPOINT_PREFIX):]: value
+             for name, value in f.attrs.items()
+             if name.startswith(CHECKPOINT_PREFIX)}
+    return state or None
+
+
+def finish_checkpoint(f):
+    '''
+    Replace the checkpoint_* attributes and datasets of a finished conversion
+    with a single checkpoint_complete marker, leaving only the output data
+    '''
+    for name in [name for name in f if name.startswith(CHECKPOINT_PREFIX)]:
+        del f[name]
+    for name in [name for name in f.attrs
+                 if name.startswith(CHECKPOINT_PREFIX)]:
+        del f.attrs[name]
+    f.attrs[CHECKPOINT_PREFIX + 'complete'] = True
+    f.flush()
+
+
+def open_checkpointed_dataset(dset, state):
+    '''
+    Drop the records of dset written after the checkpoint state was taken
+    '''
+    records = int(state['records'])
+    assert dset.shape[0] >= records, 'output is shorter than its checkpoint'
+    dset.resize((records, ))
+    return records
+
+
+def add_checkpoint_arguments(parser):
+    '''
+    Add the --checkpoint-minutes/--resume options of a converter
+    '''
+    parser.add_argument('--checkpoint-minutes', type=float, default=5.0,
+                        help='Flush the output and record how far the input \
+                        has been converted every N minutes (default: 5, 0 \
+                        disables checkpoints)')
+    parser.add_argument('--resume', action='store_true', default=False,
+                        help='Continue an interrupted conversion from the \
+                        last checkpoint of its output file instead of \
+                        starting over')
@@ -0,0 +1,178 @@
+'''
+Streaming split of a top-level JSON array (or JSON Lines) into the raw text
+of its elements
+
+The extent of each element is found with the json module's C scanner
+(JSONDecoder.raw_decode), which is several times faster than tokenizing in
+Python and rejects malformed input; the decoded object is thrown away and
+the element's text is copied as it appears in the file, so nothing is
+serialized again. Only the element being scanned is held in memory, so
+memory use depends on record size rather than file size.
+
+JsonArrayScanner(..., decode=True) yields the decoded elements instead,
+which is how preprocess.py reads its bucket files.
+
+Both scanners tell() the input offset just past the last record they
+yielded, which a later scanner can continue from (start=...), so that a
+conversion can be checkpointed in the middle of a file.
+'''
+import re
+import json
+import codecs
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class JsonArrayScanner(object):
+    '''
+    Iterate over the raw text (or, with decode set, the decoded objects) of
+    the elements of the JSON array in the binary file object fd_binary,
+    reading block_size bytes at a time
+
+    bytes_read is the number of input bytes consumed so far (at block
+    granularity), which progress reporting can be based on. Anything but
+    whitespace after the closing bracket is an error.
+
+    A start offset (an earlier tell()) seeks fd_binary there and continues
+    after the element that ends at it.
+    '''
+
+    def __init__(self, fd_binary, encoding='UTF-8', block_size=1 << 20,
+                 decode=False, start=0):
+        self.fd = fd_binary
+        self.encoding = encoding
+        self.block_size = block_size
+        self.decode = decode
+        self.start = start
+        self.bytes_read = 0
+        # (buffer, end of the last element yielded in it, input offset of
+        # the end of the buffer), for tell()
+        self._last = None
+        if start > 0:
+            self.fd.seek(start)
+
+    def tell(self):
+        '''
+        Input offset just past the last element yielded (start before the
+        first one)
+        '''
+        if self._last is None:
+            return self.start
+        buf, end, buf_end = self._last
+        # (encode() puts a byte order mark before the text with some codecs)
+        return buf_end - len(buf[end:].encode(self.encoding)) + \
+            len(''.encode(self.encoding))
+
+    def __iter__(self):
+        decoder = json.JSONDecoder()
+        text_decoder = codecs.getincrementaldecoder(self.encoding)()
+        buf = ''
+        pos = 0
+        eof = False
+        buf_end = self.start
+        # '[' before the array, 'value' before an element (or the closing
+        # bracket of an empty array), ',' after an element, ']' after the
+        # array
+        expect = ',' if self.start > 0 else '['
+
+        while True:
+            pos = _WHITESPACE.match(buf, pos).end()
+
+            need_more = pos == len(buf)
+            if not need_more:
+                c = buf[pos]
+                if expect == ']':
+                    raise ValueError('unexpected data after the JSON array')
+                elif expect == '[':
+                    if c != '[':
+                        raise ValueError('input is not a JSON array')
+                    pos += 1
+                    expect = 'value'
+                    continue
+                elif c == ']' and expect != 'element':
+                    pos += 1
+                    expect = ']'
+                    continue
+                elif expect == ',':
+                    if c != ',':
+                        raise ValueError('expected "," or "]" after an '
+                                         'array element')
+                    pos += 1
+                    expect = 'element'
+                    continue
+
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    need_more = True
+                else:
+                    # the element only counts as complete once the next
+                    # delimiter is buffered (a number cut short at the end
+                    # of the buffer, e.g. "-1.", still decodes)
+                    delim = _WHITESPACE.match(buf, end).end()
+                    if not eof and (delim == len(buf) or
+                                    buf[delim] not in ',]'):
+                        need_more = True
+                    else:
+                        self._last = (buf, end, buf_end)
+                        yield obj if self.decode else buf[pos:end]
+                        pos = end
+                        expect = ','
+
+            if need_more:
+                if eof:
+                    if expect == ']':
+                        return
+                    raise ValueError('JSON array is truncated' if expect != '['
+                                     else 'no JSON array found')
+                # read at least as much as is pending, so a long element is
+                # decoded again only O(log n) times
+                buf = buf[pos:]
+                pos = 0
+                block = self.fd.read(max(self.block_size, len(buf)))
+                self.bytes_read += len(block)
+                eof = not block
+                buf += text_decoder.decode(block, final=eof)
+                # (bytes of an incomplete character are still undecoded)
+                buf_end = self.start + self.bytes_read - \
+                    len(text_decoder.getstate()[0])
+
+
+def dump_json_array(text):
+    '''
+    json.dumps() of each element of the JSON array text
+    '''
+    return [json.dumps(record) for record in json.loads(text)]
+
+
+class JsonLinesScanner(object):
+    '''
+    Iterate over the raw text of the records of a JSON Lines file, one per
+    non-blank line, in the binary file object fd_binary
+
+    Lines are split on b'\\n' before they are decoded, so the encoding has
+    to be ASCII-compatible. A start offset (an earlier tell()) seeks
+    fd_binary there.
+    '''
+
+    def __init__(self, fd_binary, encoding='UTF-8', start=0):
+        self.fd = fd_binary
+        self.encoding = encoding
+        self.offset = start
+        if start > 0:
+            self.fd.seek(start)
+
+    def tell(self):
+        '''
+        Input offset just past the line of the last record yielded
+        '''
+        return self.offset
+
+    def __iter__(self):
+        for ln in self.fd:
+            self.offset += len(ln)
+            ln = ln.decode(self.encoding).strip()
+            if ln:
+                yield ln
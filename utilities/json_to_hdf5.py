@@ -6,16 +6,34 @@ Example:
 $ python3 json_to_hdf5.py /tmp/jsonfile1.json.gz /tmp/jsonfile2.json.gz
     /tmp/jsonfile3.json.gz
 
+With --input-format json-stream (top-level arrays) or jsonl (JSON Lines),
+records are copied into the dataset as the raw JSON text found in the input
+instead of being parsed and serialized again, and only one record at a time
+is held in memory.
+
+The output is checkpointed every --checkpoint-minutes, after an input file
+or (with json-stream and jsonl) after a batch of records within one; an
+interrupted run continues from its last checkpoint with the same arguments
+plus --resume. Resuming in the middle of a compressed file still
+decompresses it from the start.
+
 '''
 import os
-import json
 import psutil
 import sys
+import time
 import h5py
 import gzip
 import bz2
 import logging
 import argparse
+from json_array_scanner import JsonArrayScanner, JsonLinesScanner, \
+    dump_json_array
+from record_scanner import check_encoding
+from pipeline import Pipeline, add_pipeline_arguments, iter_batches
+from hdf5_writer import BufferedDatasetWriter, add_buffer_arguments, \
+    add_checkpoint_arguments, add_dataset_arguments, create_vlen_dataset, \
+    open_checkpointed_dataset, read_checkpoint, write_checkpoint
 
 process = psutil.Process(os.getpid())
 
@@ -35,78 +53,212 @@ parser.add_argument('--encoding', type=str, default='UTF-8',
                     help='Input text file encoding (default: "UTF-8")')
 parser.add_argument('--dataset-name', type=str, default='vlen_dataset',
                     help='HDF5 dataset output name (default: "vlen_dataset")')
+parser.add_argument('--input-format', type=str, default='json',
+                    choices=('json', 'json-stream', 'jsonl'),
+                    help='"json": load each array whole and store json.dumps() \
+                    of each record; "json-stream": stream each array and \
+                    store the raw text of each record; "jsonl": one raw \
+                    record per line (default: "json")')
+
+parser.add_argument('--processes', type=int, default=0,
+                    help='Parse and serialize input files in this many \
+                    processes with --input-format json (default: 0, in the \
+                    main process)')
+
+add_buffer_arguments(parser)
+add_dataset_arguments(parser)
+add_pipeline_arguments(parser)
+add_checkpoint_arguments(parser)
 
 #parser.add_argument('output_file', type=str,
 #                    help='Output filename for hdf5 file')
 
-args = parser.parse_args()
-
-assert len(args.input_files) > 0
+# transform stage: parse and serialize the records of a whole json file
+# (possibly in a process pool, so this has to be a module-level function);
+# batches of raw records and end-of-file items pass through
+def transformInput(item):
+    file_idx, data, resume = item
+    if isinstance(data, str):
+        return file_idx, dump_json_array(data), resume
+    return item
 
-outputFn = args.input_files[0] + '.hdf5'
+def main():
+    args = parser.parse_args()
 
-lastData = ''
-lastPrintedProgress = 0
-dataCount = 0
+    assert len(args.input_files) > 0
 
-# nothing special: just return the data string as-is for now
-processData = lambda doc: doc
+    outputFn = args.input_files[0] + '.hdf5'
 
-logger.info('Creating HDF5 file %s' % (outputFn))
-f = h5py.File(outputFn, 'w')
-logger.info('Creating HDF5 dataset %s:%s' % (outputFn, args.dataset_name))
-dset = f.create_dataset(args.dataset_name, (0,), \
-    dtype=h5py.special_dtype(vlen=str), chunks=True, maxshape=(2**32,))
+    lastData = ''
+    lastPrintedProgress = 0
+    dataCount = 0
 
-file_count = len(args.input_files)
+    # nothing special: just return the data string as-is for now
+    processData = lambda doc: doc
 
-logger.info('Beginning input file iteration...')
+    if args.input_format == 'jsonl':
+        assert check_encoding(args.encoding), \
+            'jsonl input encoding must be ASCII-compatible'
 
-for file_idx, input_file in enumerate(args.input_files):
-    #logger.info('Open input file: %s' % input_file)
+    # number of input files already converted, and the input offset and
+    # records done in the next one
+    filesDone = 0
+    resumeOffset = 0
+    resumeRecords = 0
 
-    if input_file.lower().endswith('.bz2'):
-        infile = bz2.open(input_file, 'rt', encoding=args.encoding)
-    elif input_file.lower().endswith('.gz'):
-        infile = gzip.open(input_file, 'rt', encoding=args.encoding)
+    if args.resume:
+        logger.info('Resuming HDF5 file %s' % (outputFn))
+        f = h5py.File(outputFn, 'a')
+        dset = f[args.dataset_name]
+        checkpoint = read_checkpoint(f)
+        assert checkpoint is not None, 'no checkpoint to resume from'
+        assert checkpoint['format'] == args.input_format, \
+            'checkpoint was written with --input-format %s' % \
+            checkpoint['format']
+        dataCount = open_checkpointed_dataset(dset, checkpoint)
+        filesDone = int(checkpoint['files'])
+        resumeOffset = int(checkpoint['offset'])
+        resumeRecords = int(checkpoint['file_records'])
+        logger.info('Continuing after %d records of %d files, and %d records \
+(input offset %d) of the next one' % (dataCount, filesDone, \
+            resumeRecords, resumeOffset))
     else:
-        infile = open(input_file, 'r', encoding=args.encoding)
+        logger.info('Creating HDF5 file %s' % (outputFn))
+        f = h5py.File(outputFn, 'w')
+        logger.info('Creating HDF5 dataset %s:%s' % (outputFn, args.dataset_name))
+        dset = create_vlen_dataset(f, args.dataset_name, \
+            chunk_rows=args.chunk_rows, compression=args.compression, \
+            compression_level=args.compression_level)
+
+    writer = BufferedDatasetWriter(dset, max_rows=args.buffer_rows, \
+        max_bytes=int(args.buffer_mb * 1048576), written=dataCount)
+
+    lastCheckpoint = time.time()
+
+    file_count = len(args.input_files)
+
+    logger.info('Beginning input file iteration...')
+
+    # whether the reader should hand over a checkpoint state with its next
+    # item
+    def checkpointDue():
+        nonlocal lastCheckpoint
+        if args.checkpoint_minutes <= 0 or \
+                time.time() - lastCheckpoint < args.checkpoint_minutes * 60:
+            return False
+        lastCheckpoint = time.time()
+        return True
+
+    # reader stage: decompress each input file, handing over its whole text
+    # (json) or batches of its raw records (json-stream, jsonl), followed by an
+    # end-of-file item; each item carries the checkpoint state (files done,
+    # input offset and records done in the next file) to record once it is
+    # written, if one is due
+    def readInputs():
+        for file_idx, input_file in enumerate(args.input_files):
+            if file_idx < filesDone:
+                continue
+            start = resumeOffset if file_idx == filesDone else 0
+            fileRecords = resumeRecords if file_idx == filesDone else 0
+
+            #logger.info('Open input file: %s' % input_file)
+
+            # the scanners decode the binary stream themselves
+            mode = 'rt' if args.input_format == 'json' else 'rb'
+            encoding = args.encoding if mode == 'rt' else None
+
+            if input_file.lower().endswith('.bz2'):
+                infile = bz2.open(input_file, mode, encoding=encoding)
+            elif input_file.lower().endswith('.gz'):
+                infile = gzip.open(input_file, mode, encoding=encoding)
+            else:
+                infile = open(input_file, mode, encoding=encoding)
+
+            if start > 0:
+                logger.info('Skipping %d input bytes of %s' % (start, \
+                    input_file))
+            if args.input_format == 'json-stream':
+                records = JsonArrayScanner(infile, encoding=args.encoding, \
+                    start=start)
+            elif args.input_format == 'jsonl':
+                records = JsonLinesScanner(infile, encoding=args.encoding, \
+                    start=start)
+            else:
+                records = None
+                yield file_idx, infile.read(), None
+
+            if records is not None:
+                for batch in iter_batches(records, 1024):
+                    fileRecords += len(batch)
+                    yield file_idx, batch, (file_idx, records.tell(), \
+                        fileRecords) if checkpointDue() else None
+
+            infile.close()
+            yield file_idx, None, (file_idx + 1, 0, 0) \
+                if checkpointDue() else None
+
+    def saveCheckpoint(resume):
+        files, offset, fileRecords = resume
+        write_checkpoint(f, writer, format=args.input_format, files=files, \
+            offset=offset, file_records=fileRecords)
+
+    # writer stage
+    def writeRecords(item):
+        nonlocal dataCount
+        file_idx, records, resume = item
+        if records is None:
+            if resume is not None:
+                saveCheckpoint(resume)
+            return
+
+        input_file = args.input_files[file_idx]
+
+        try:
+            infilename = input_file.split('/')[-1]
+        except:
+            infilename = input_file.split('\\')[-1]
+
+        rss = process.memory_info().rss / 1048576.0
+        sys.stderr.write( \
+            '\rDump data: FILE=%s, IDX=%d, COUNT=%d/%d (%.2f%%), ' \
+            'MEM=%.2fMB' % \
+            (infilename, dataCount+1, file_idx+1, \
+            file_count, 100.0 * (file_idx+1)/file_count, rss))
+
+        for record_idx, record in enumerate(records):
+            #if dataCount % 100 == 0:
+                writer.append(record)
+                dataCount += 1
 
-    try:
-        infilename = input_file.split('/')[-1]
-    except:
-        infilename = input_file.split('\\')[-1]
+            #if dataCount >= 100: # stop early for testing
+            #    break
 
-    #logger.info('Decoding JSON...')
-    jsondata = json.loads(infile.read())
+        if resume is not None:
+            saveCheckpoint(resume)
 
-    rss = process.memory_info().rss / 1048576.0
-    sys.stderr.write( \
-        '\rDump data: FILE=%s, IDX=%d, COUNT=%d/%d (%.2f%%), ' \
-        'MEM=%.2fMB' % \
-        (infilename, dataCount+1, file_idx+1, \
-        file_count, 100.0 * (file_idx+1)/file_count, rss))
+    if args.processes > 0:
+        assert args.input_format == 'json', \
+            '--processes only applies to --input-format json'
 
-    for record_idx, record in enumerate(jsondata):
-        #if dataCount % 100 == 0:
-            if dset.size <= dataCount:
-                dset.resize((dataCount+128, ))
+    Pipeline(readInputs(), transformInput, writeRecords, \
+        queue_size=args.queue_size, processes=args.processes, \
+        report_seconds=args.report_seconds, logger=logger).run()
 
-            dset[dataCount] = json.dumps(record)
-            dataCount += 1
+    sys.stderr.write('\n')
+    sys.stderr.flush()
 
-        #if dataCount >= 100: # stop early for testing
-        #    break
+    logger.info('File iteration complete.')
 
-sys.stderr.write('\n')
-sys.stderr.flush()
+    # flush and eventually resize down to actual data count
+    writer.close()
+    if args.checkpoint_minutes > 0 or args.resume:
+        saveCheckpoint((file_count, 0, 0))
 
-logger.info('File iteration complete.')
+    f.close()
 
-# eventually resize down to actual data count
-dset.resize((dataCount, ))
+    logger.info('Output %d objects to %s:%s' % (dataCount, outputFn, \
+        args.dataset_name))
 
-f.close()
 
-logger.info('Output %d objects to %s:%s' % (dataCount, outputFn, \
-    args.dataset_name))
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+'''
+Parallel decompression and record splitting of multistream bz2 files
+
+bz2 dumps written by pbzip2/lbzip2, and the Wikipedia "multistream" dumps,
+are a concatenation of independent bz2 streams. Their boundaries are found
+by scanning the compressed file for stream headers (or taken from the dump's
+index file), consecutive streams are grouped into byte ranges, and a process
+pool decompresses and splits each range with a RecordScanner.
+
+A worker cannot know whether its range begins inside a record, so it only
+splits the data following the first line that ends a record (after that
+point the scanner is between records either way) and returns the bytes
+before it. The main process scans those with the real state carried over
+from the previous range, then adopts the worker's records and end state.
+The rare range where that assumption does not hold (a record starting on
+the same line as a stray end token) is decompressed again and scanned in
+the main process, so the output is always the same as a sequential scan.
+'''
+import re
+import bz2
+import mmap
+import logging
+import threading
+from multiprocessing import Pool
+from record_scanner import RecordScanner, decode_record
+
+logger = logging.getLogger('ParallelBZ2')
+
+# decompressed ranges waiting to be written, per worker process
+MAX_RANGES_IN_FLIGHT_PER_WORKER = 2
+
+# "BZh" + block size digit, followed by either the first block's magic
+# (pi) or the end-of-stream magic (sqrt(pi)) of an empty stream
+_STREAM_HEADER = re.compile(
+    rb'BZh[1-9](?=1AY&SY|\x17rE8P\x90)')
+
+
+def find_stream_offsets(fn):
+    '''
+    Candidate offsets of the bz2 streams of fn, found by searching the
+    compressed bytes for stream headers
+
+    Block headers inside a stream are not byte-aligned after the first
+    one, so a byte-aligned match of these 10 bytes is a stream start unless
+    the compressed data happens to contain it; decompress_range() fails
+    loudly if that ever splits a stream.
+    '''
+    with open(fn, 'rb') as fd:
+        with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return [m.start() for m in _STREAM_HEADER.finditer(mm)]
+
+
+def read_multistream_index(fn):
+    '''
+    Stream offsets from the index of a Wikipedia multistream dump
+    (lines of "offset:page_id:title", optionally bz2 compressed)
+    '''
+    opener = bz2.open if fn.lower().endswith('.bz2') else open
+    offsets = set()
+    with opener(fn, 'rt', encoding='UTF-8') as fd:
+        for ln in fd:
+            offset = ln.split(':', 1)[0]
+            if offset:
+                offsets.add(int(offset))
+    return sorted(offsets)
+
+
+def plan_ranges(offsets, file_size, target, start=0):
+    '''
+    Group the consecutive streams from offset start on into byte ranges of
+    at least target compressed bytes (except the last one)
+    '''
+    offsets = sorted(set([start] + [o for o in offsets if o > start]))
+    planned = []
+    for offset in offsets[1:] + [file_size]:
+        if offset - start >= target or offset == file_size:
+            if offset > start:
+                planned.append((start, offset))
+            start = offset
+    return planned
+
+
+def decompress_range(fn, start, end):
+    '''
+    Decompress the concatenated bz2 streams in fn[start:end]
+    '''
+    with open(fn, 'rb') as fd:
+        fd.seek(start)
+        data = fd.read(end - start)
+
+    out = []
+    while data:
+        decompressor = bz2.BZ2Decompressor()
+        out.append(decompressor.decompress(data))
+        if not decompressor.eof:
+            raise EOFError('bz2 stream at %d..%d of %s is truncated' %
+                           (start, end, fn))
+        data = decompressor.unused_data
+    return b''.join(out)
+
+
+def _split_range(task):
+    fn, start, end, start_token, end_token, encoding, end_str = task
+    data = decompress_range(fn, start, end)
+
+    # the line holding the first end token finishes a record if the range
+    # begins inside one; past it the scanner is between records either way
+    i = data.find(end_token)
+    if i < 0:
+        return data, None, None
+    nl = data.find(b'\n', i + len(end_token))
+    if nl < 0:
+        return data, None, None
+    head_end = nl + 1
+
+    scanner = RecordScanner(start_token, end_token)
+    records = [decode_record(record, encoding, end_str) \
+        for record in scanner.feed(data[head_end:])]
+    return data[:head_end], records, scanner.get_state()
+
+
+def _iter_tasks(tasks, in_flight, stop):
+    for task in tasks:
+        in_flight.acquire()
+        if stop.is_set():
+            return
+        yield task
+
+
+def iter_records(fn, start_token, end_token, encoding, workers,
+                 offsets=None, range_mb=16.0, resume=None):
+    '''
+    Decompress and split fn in a pool of `workers` processes, yielding
+    (records, compressed bytes done, scanner state) for each range of about
+    range_mb compressed megabytes, in file order
+
+    offsets are stream offsets (e.g. from read_multistream_index()); by
+    default they are found by find_stream_offsets(). Passing a yielded
+    (compressed bytes done, scanner state) as resume continues from there.
+    '''
+    start_bytes = start_token.encode(encoding)
+    end_bytes = end_token.encode(encoding)
+    assert b'\n' not in start_bytes and b'\n' not in end_bytes, \
+        'split tokens must not contain newlines'
+
+    with open(fn, 'rb') as fd:
+        fd.seek(0, 2)
+        file_size = fd.tell()
+
+    if offsets is None:
+        logger.info('Searching %s for bz2 stream headers' % fn)
+        offsets = find_stream_offsets(fn)
+    if len(offsets) < 2:
+        logger.warning('%s is a single bz2 stream; it cannot be decompressed '
+                       'in parallel' % fn)
+    start = 0
+    scanner = RecordScanner(start_bytes, end_bytes)
+    if resume is not None:
+        start, state = resume
+        scanner.set_state(state)
+    ranges = plan_ranges(offsets, file_size, int(range_mb * 1048576),
+                         start=start)
+    logger.info('Found %d bz2 streams, decompressing them in %d ranges with '
+                '%d processes' % (len(offsets), len(ranges), workers))
+
+    tasks = [(fn, start, end, start_bytes, end_bytes, encoding, end_token) \
+        for start, end in ranges]
+    in_flight = threading.Semaphore(MAX_RANGES_IN_FLIGHT_PER_WORKER * workers)
+    stop = threading.Event()
+
+    with Pool(workers) as pool:
+        try:
+            results = pool.imap(_split_range,
+                                _iter_tasks(tasks, in_flight, stop))
+            for (start, end), (head, records, state) in zip(ranges, results):
+                in_flight.release()
+                out = [decode_record(record, encoding, end_token) \
+                    for record in scanner.feed(head)]
+
+                if state is not None:
+                    if scanner.is_outside():
+                        out.extend(records)
+                        scanner.set_state(state)
+                    else:
+                        logger.debug('Rescanning range %d..%d sequentially' %
+                                     (start, end))
+                        data = decompress_range(fn, start, end)
+                        out.extend(decode_record(record, encoding, \
+                            end_token) for record in \
+                            scanner.feed(data[len(head):]))
+
+                yield out, end, scanner.snapshot()
+        finally:
+            # unblock the task feeder thread so the pool can shut down
+            stop.set()
+            in_flight.release()
@@ -0,0 +1,236 @@
+'''
+Three-stage reader -> transform -> writer pipeline joined by bounded queues,
+shared by the converters
+
+The reader (an iterable: file reads and decompression, which release the
+GIL) and the writer (a callable: HDF5 writes) run in threads of their own,
+so decompression, splitting and writing overlap. The transform (splitting
+and serializing records) runs in the calling thread, or in a process pool
+when it holds the GIL for long and does not keep state between items.
+
+Per-stage throughput and busy time, and the average occupancy of both
+queues, are logged every report_seconds and at the end: the busiest stage
+is the bottleneck, and a full queue points at the stage after it.
+'''
+import time
+import queue
+import logging
+import threading
+from multiprocessing import Pool
+
+_END = object()
+
+
+class StageStats(object):
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.size = 0
+        # seconds spent doing work (not waiting on a queue)
+        self.busy = 0.0
+
+    def report(self, elapsed, size_unit):
+        s = '%s %d items' % (self.name, self.items)
+        if size_unit:
+            s += ', %.2f%s/s' % (self.size / elapsed, size_unit)
+        if self.busy:
+            s += ', busy %.0f%%' % (100.0 * self.busy / elapsed)
+        return s
+
+
+class QueueStats(object):
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.maxsize = maxsize
+        self.samples = 0
+        self.total = 0
+
+    def sample(self, q):
+        self.samples += 1
+        self.total += q.qsize()
+
+    def report(self):
+        return '%s queue %.1f/%d' % (self.name,
+                                     self.total / max(1, self.samples),
+                                     self.maxsize)
+
+
+class Pipeline(object):
+    '''
+    Run read -> transform -> write until read is exhausted
+
+    read        iterable of items, iterated in the reader thread
+    transform   item -> result, called in the calling thread, or in a pool
+                of `processes` processes (it must then be picklable)
+    write       called with each result, in order, in the writer thread
+    read_size   optional item -> size (in MB, say) for the reader throughput
+    '''
+
+    def __init__(self, read, transform, write, queue_size=16, processes=0,
+                 read_size=None, size_unit='MB', report_seconds=30.0,
+                 logger=None):
+        self.read = read
+        self.transform = transform
+        self.write = write
+        self.processes = processes
+        self.read_size = read_size
+        self.size_unit = size_unit if read_size else None
+        self.report_seconds = report_seconds
+        self.logger = logger or logging.getLogger('Pipeline')
+
+        self.in_queue = queue.Queue(queue_size)
+        self.out_queue = queue.Queue(queue_size)
+        self.stop = threading.Event()
+        self.error = None
+
+        self.reader_stats = StageStats('read')
+        self.transform_stats = StageStats('transform')
+        self.writer_stats = StageStats('write')
+        self.in_queue_stats = QueueStats('in', queue_size)
+        self.out_queue_stats = QueueStats('out', queue_size)
+
+    def _fail(self, e):
+        if self.error is None:
+            self.error = e
+        self.stop.set()
+
+    def _put(self, q, item):
+        while True:
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if self.stop.is_set():
+                    return False
+
+    def _get(self, q, stats):
+        while True:
+            try:
+                item = q.get(timeout=0.1)
+                stats.sample(q)
+                return item
+            except queue.Empty:
+                if self.stop.is_set():
+                    return _END
+
+    def _read_loop(self):
+        try:
+            it = iter(self.read)
+            while not self.stop.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    break
+                self.reader_stats.busy += time.perf_counter() - start
+                self.reader_stats.items += 1
+                if self.read_size:
+                    self.reader_stats.size += self.read_size(item)
+                if not self._put(self.in_queue, item):
+                    return
+        except BaseException as e:
+            self._fail(e)
+        self._put(self.in_queue, _END)
+
+    def _write_loop(self):
+        try:
+            while True:
+                result = self._get(self.out_queue, self.out_queue_stats)
+                if result is _END:
+                    return
+                start = time.perf_counter()
+                self.write(result)
+                self.writer_stats.busy += time.perf_counter() - start
+                self.writer_stats.items += 1
+        except BaseException as e:
+            self._fail(e)
+
+    def _iter_input(self):
+        while True:
+            item = self._get(self.in_queue, self.in_queue_stats)
+            if item is _END:
+                return
+            yield item
+
+    def _transformed(self):
+        if self.processes > 0:
+            with Pool(self.processes) as pool:
+                for result in pool.imap(self.transform, self._iter_input()):
+                    yield result
+        else:
+            for item in self._iter_input():
+                start = time.perf_counter()
+                result = self.transform(item)
+                self.transform_stats.busy += time.perf_counter() - start
+                yield result
+
+    def report(self):
+        elapsed = max(1e-9, time.perf_counter() - self.start_time)
+        self.logger.info('Pipeline: %s | %s | %s%s | %s | %s' % (
+            self.reader_stats.report(elapsed, self.size_unit),
+            self.in_queue_stats.report(),
+            self.transform_stats.report(elapsed, None),
+            ' (%d processes)' % self.processes if self.processes > 0 else '',
+            self.out_queue_stats.report(),
+            self.writer_stats.report(elapsed, None)))
+
+    def run(self):
+        self.start_time = time.perf_counter()
+        last_report = self.start_time
+
+        reader = threading.Thread(target=self._read_loop, daemon=True)
+        writer = threading.Thread(target=self._write_loop, daemon=True)
+        reader.start()
+        writer.start()
+
+        try:
+            for result in self._transformed():
+                self.transform_stats.items += 1
+                if not self._put(self.out_queue, result):
+                    break
+                if time.perf_counter() - last_report >= self.report_seconds:
+                    self.report()
+                    last_report = time.perf_counter()
+            self._put(self.out_queue, _END)
+
+            while writer.is_alive():
+                writer.join(self.report_seconds)
+                if writer.is_alive():
+                    self.report()
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self.stop.set()
+            reader.join()
+            writer.join()
+
+        self.report()
+        if self.error is not None:
+            raise self.error
+
+
+def add_pipeline_arguments(parser):
+    '''
+    Add the queue size and reporting options of Pipeline to a converter's
+    argument parser
+    '''
+    parser.add_argument('--queue-size', type=int, default=16,
+                        help='Items buffered between pipeline stages \
+                        (default: 16)')
+    parser.add_argument('--report-seconds', type=float, default=30.0,
+                        help='Seconds between pipeline throughput reports \
+                        (default: 30)')
+
+
+def iter_batches(iterable, size):
+    '''
+    Group the items of iterable into lists of up to size items
+    '''
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
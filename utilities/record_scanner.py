@@ -0,0 +1,159 @@
+'''
+Byte-level splitting of a text stream into records delimited by start and
+end tokens, fed in blocks of any size
+
+A record runs from a start token to the first end token after it (both
+included). The rest of the line holding the end token is skipped, and
+anything outside records is ignored; a record still open at the end of the
+input is dropped. This matches the line-by-line splitting text_to_hdf5.py
+used to do, including decode_record() stripping the whitespace around the
+last line of multi-line records.
+
+Tokens are searched for as encoded bytes, so the input encoding has to be
+ASCII-compatible (UTF-8, EUC-KR, ...); see check_encoding().
+'''
+import codecs
+
+OUTSIDE = 0
+INSIDE = 1
+SKIP_LINE = 2
+
+
+class RecordScanner(object):
+    '''
+    Feed blocks of the stream with feed() (or scan()), which returns the raw
+    bytes of every record completed by that block
+
+    Only the bytes of the current unfinished record are kept between blocks
+    (as a list of pieces, joined once when its end token shows up), plus up
+    to a token length of bytes at the end of a block so that tokens crossing
+    block boundaries are found.
+    '''
+
+    def __init__(self, start_token, end_token):
+        assert start_token and end_token
+        self.start_token = start_token
+        self.end_token = end_token
+
+        self.state = OUTSIDE
+        # bytes carried over to be scanned again with the next block
+        self.carry = b''
+        # bytes of the unfinished record that are already scanned
+        self.pieces = []
+        self.position = 0
+
+    def get_state(self):
+        return self.state, self.carry, self.pieces
+
+    def snapshot(self):
+        '''
+        Copy of the state that later feeds do not modify, with the pieces of
+        the unfinished record joined (see set_state())
+        '''
+        return self.state, self.carry, [b''.join(self.pieces)] \
+            if self.pieces else []
+
+    def set_state(self, state):
+        self.state, self.carry, self.pieces = state
+
+    def feed(self, data):
+        return list(self.scan(data))
+
+    def scan(self, data, start=0):
+        '''
+        Yield the records completed by data[start:] as they are found;
+        position is the offset in data just past the last record yielded
+
+        data can be any object with bytes-like find() and slicing, such as
+        an mmap of a whole uncompressed file, which is then scanned with
+        one slice per record and nothing else copied.
+        '''
+        start_token = self.start_token
+        end_token = self.end_token
+
+        if self.carry:
+            data = self.carry + data[start:]
+            self.carry = b''
+            start = 0
+        n = len(data)
+
+        pos = start
+        self.position = start
+        # start of the unfinished record in data, and where its end token
+        # may begin
+        record_pos = start
+        search_pos = start
+
+        while True:
+            if self.state == SKIP_LINE:
+                i = data.find(b'\n', pos)
+                if i < 0:
+                    return
+                pos = i + 1
+                self.state = OUTSIDE
+
+            elif self.state == OUTSIDE:
+                i = data.find(start_token, pos)
+                if i < 0:
+                    keep = max(pos, n - len(start_token) + 1)
+                    self.carry = data[keep:]
+                    return
+                record_pos = i
+                search_pos = i + len(start_token)
+                self.pieces = []
+                self.state = INSIDE
+
+            else:
+                i = data.find(end_token, search_pos)
+                if i < 0:
+                    keep = max(search_pos, n - len(end_token) + 1)
+                    self.pieces.append(data[record_pos:keep])
+                    self.carry = data[keep:]
+                    return
+                pos = i + len(end_token)
+                self.state = SKIP_LINE
+                self.position = pos
+                if self.pieces:
+                    self.pieces.append(data[record_pos:pos])
+                    record = b''.join(self.pieces)
+                    self.pieces = []
+                    yield record
+                else:
+                    yield data[record_pos:pos]
+
+    def is_outside(self):
+        '''
+        Whether the scanner is between records (not in one, and not skipping
+        the rest of a line)
+        '''
+        return self.state == OUTSIDE
+
+
+def decode_record(record, encoding, end_token):
+    '''
+    Decode the raw bytes of a record the way reading the input in text mode
+    would (universal newlines), and strip the whitespace around the last
+    line of a multi-line record
+    '''
+    text = record.decode(encoding)
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+
+    body_end = len(text) - len(end_token)
+    last_nl = text.rfind('\n', 0, body_end)
+    if last_nl >= 0:
+        text = text[:last_nl+1] + text[last_nl+1:body_end].strip() + \
+            end_token
+    return text
+
+
+def check_encoding(encoding):
+    '''
+    Whether text in encoding can be split on encoded tokens and newlines,
+    i.e. it encodes ASCII as itself
+    '''
+    ascii = bytes(range(128))
+    try:
+        return codecs.encode(ascii.decode('ascii'), encoding) == ascii
+    except UnicodeError:
+        return False
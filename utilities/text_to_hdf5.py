@@ -8,15 +8,34 @@ Example:
 $ python3 text_to_hdf5.py /tmp/wikicomp-2014_arko.xml.bz2 "<articlePair id"
     --split-token-end "</articlePair>"
 
+Multistream bz2 files (pbzip2/lbzip2 output, Wikipedia multistream dumps) can
+be decompressed and split by several processes with --parallel-workers; see
+parallel_bz2.py.
+
+The output is checkpointed every --checkpoint-minutes; an interrupted run
+continues from its last checkpoint with the same arguments plus --resume.
+Resuming a compressed input without --parallel-workers still decompresses
+(but does not split or write) the part converted before.
+
 '''
 import os
 import psutil
 import sys
+import time
 import h5py
 import gzip
+import numpy as np
 import bz2
 import logging
+import mmap
 import argparse
+import parallel_bz2
+from pipeline import Pipeline, add_pipeline_arguments, iter_batches
+from record_scanner import RecordScanner, check_encoding, decode_record
+from hdf5_writer import BufferedDatasetWriter, add_buffer_arguments, \
+    add_checkpoint_arguments, add_dataset_arguments, create_vlen_dataset, \
+    finish_checkpoint, open_checkpointed_dataset, read_checkpoint, \
+    write_checkpoint
 
 process = psutil.Process(os.getpid())
 
@@ -46,112 +65,246 @@ parser.add_argument('--split-token-end', type=str, default=None,
                      or nothing if only splitting by start token). Example: \
                      "</articlePair>"')
 parser.add_argument('--disable-progress', action='store_true', default=False,
-                    help='Disable progress bar (helps when reading large \
-                    compressed file where file needs to be decompressed \
-                    to determine progress bar denominator)')
+                    help='Disable progress bar (progress is measured in \
+                    bytes of the input file as stored, compressed or not)')
+
+parser.add_argument('--block-mb', type=float, default=4.0,
+                    help='Size (MB) of the blocks a compressed input file is \
+                    read and scanned in (default: 4)')
+parser.add_argument('--parallel-workers', type=int, default=0,
+                    help='Decompress and split a multistream bz2 input file \
+                    with this many processes (default: 0, sequential)')
+parser.add_argument('--multistream-index', type=str, default=None,
+                    help='Index of a Wikipedia multistream dump \
+                    ("offset:id:title" lines, may be bz2 compressed) to take \
+                    the bz2 stream offsets from instead of searching the \
+                    input file for them')
+parser.add_argument('--range-mb', type=float, default=16.0,
+                    help='Compressed data (MB) decompressed by a worker at a \
+                    time with --parallel-workers (default: 16)')
+
+add_buffer_arguments(parser)
+add_dataset_arguments(parser)
+add_pipeline_arguments(parser)
+add_checkpoint_arguments(parser)
 
 #parser.add_argument('output_file', type=str,
 #                    help='Output filename for hdf5 file')
 
-args = parser.parse_args()
-
-outputFn = args.input_file + '.hdf5'
-
-assert args.split_token_end != None, 'blank end token not implemented'
+def main():
+    args = parser.parse_args()
 
-lastData = ''
-lastPrintedProgress = 0
-dataCount = 0
+    outputFn = args.input_file + '.hdf5'
 
-# nothing special: just return the data string as-is for now
-processData = lambda doc: doc
+    assert args.split_token_end != None, 'blank end token not implemented'
 
-if args.input_file.lower().endswith('.bz2'):
-    infile = bz2.open(args.input_file, 'rt', encoding=args.encoding)
-elif args.input_file.lower().endswith('.gz'):
-    infile = gzip.open(args.input_file, 'rt', encoding=args.encoding)
-else:
-    infile = open(args.input_file, 'r', encoding=args.encoding)
+    if args.parallel_workers > 0:
+        assert args.input_file.lower().endswith('.bz2'), \
+            '--parallel-workers requires a bz2 input file'
 
-logger.info('Creating HDF5 file %s' % (outputFn))
-f = h5py.File(outputFn, 'w')
-logger.info('Creating HDF5 dataset %s:%s' % (outputFn, args.dataset_name))
-dset = f.create_dataset(args.dataset_name, (0,), \
-    dtype=h5py.special_dtype(vlen=str), chunks=True, maxshape=(2**32,))
+    lastPrintedProgress = 0
+    dataCount = 0
 
-if not args.disable_progress:
-    logger.info('Computing input file length. If this takes too long or causes \
-issues (in the case of a compressed input file), use \
---disable-progress')
+    # nothing special: just return the data string as-is for now
+    processData = lambda doc: doc
 
-    infile.seek(0, os.SEEK_END)
-    file_len = infile.tell()
-    infile.seek(0, os.SEEK_SET)
+    assert check_encoding(args.encoding), \
+        'input encoding must be ASCII-compatible'
+    splitTokenStart = args.split_token_start.encode(args.encoding)
+    splitTokenEnd = args.split_token_end.encode(args.encoding)
 
-logger.info('Beginning input file iteration...')
+    # progress is the position in the input file as stored, which for
+    # compressed input is the decompressor's position in the compressed file
+    file_len = max(1, os.path.getsize(args.input_file))
 
-#for ln in infile: (breaks .tell())
-
-ln = infile.readline()
-while ln:
-    if dataCount % 100 == 0:
-        rss = process.memory_info().rss / 1048576.0
-        if not args.disable_progress:
-            sys.stderr.write( \
-                '\rDump data: IDX=%d, POS=%d/%d (%.2f%%), MEM=%.2fMB' % \
-                (dataCount+1, infile.tell(), \
-                file_len, 100.0 * infile.tell()/file_len, rss))
-        else:
-            sys.stderr.write('\rDump data: IDX=%d, MEM=%.2fMB' % \
-                (dataCount+1, rss))
-
-    if lastData=='':
-        if args.split_token_start in ln:
-            lastData = args.split_token_start + \
-                ln.split(args.split_token_start)[1].split( \
-                    args.split_token_end)[0]
-            if args.split_token_end in ln:
-                lastData += args.split_token_end
-                results = processData(lastData)
-                if results:
-                    if dset.size <= dataCount:
-                        dset.resize((dataCount+128, ))
-
-                    dset[dataCount] = results
-                    dataCount += 1
-                lastData = ''
+    mm = None
+    rawfile = None
+    infile = None
+    # (--parallel-workers opens the input file in each worker)
+    if args.parallel_workers == 0:
+        rawfile = open(args.input_file, 'rb')
+        if args.input_file.lower().endswith('.bz2'):
+            infile = bz2.open(rawfile, 'rb')
+        elif args.input_file.lower().endswith('.gz'):
+            infile = gzip.open(rawfile, 'rb')
         else:
-            if lastData!='':
-                lastData += ln
+            infile = rawfile
+            # uncompressed input is scanned in place
+            if os.path.getsize(args.input_file) > 0:
+                mm = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # how the input is read; checkpoint offsets are only meaningful to the
+    # same mode: mmap and parallel offsets are in the file as stored, stream
+    # offsets in the decompressed stream
+    if args.parallel_workers > 0:
+        mode = 'parallel'
+    elif mm is not None:
+        mode = 'mmap'
+    else:
+        mode = 'stream'
+
+    # (input offset, scanner state) to continue from
+    resume = None
+
+    if args.resume:
+        logger.info('Resuming HDF5 file %s' % (outputFn))
+        f = h5py.File(outputFn, 'a')
+        dset = f[args.dataset_name]
+        checkpoint = read_checkpoint(f)
+        assert checkpoint is not None, 'no checkpoint to resume from'
+        assert not checkpoint['complete'], 'conversion is already complete'
+        assert checkpoint['mode'] == mode, \
+            'checkpoint was written in %s mode, not %s' % \
+            (checkpoint['mode'], mode)
+        dataCount = open_checkpointed_dataset(dset, checkpoint)
+
+        pending = f[checkpoint['pending']][:].tobytes()
+        piecesBytes = int(checkpoint['pieces_bytes'])
+        resume = (int(checkpoint['offset']), (int(checkpoint['state']), \
+            pending[piecesBytes:], [pending[:piecesBytes]] if piecesBytes else []))
+        logger.info('Continuing after %d records at input offset %d' % \
+            (dataCount, resume[0]))
+    else:
+        logger.info('Creating HDF5 file %s' % (outputFn))
+        f = h5py.File(outputFn, 'w')
+        logger.info('Creating HDF5 dataset %s:%s' % (outputFn, args.dataset_name))
+        dset = create_vlen_dataset(f, args.dataset_name, \
+            chunk_rows=args.chunk_rows, compression=args.compression, \
+            compression_level=args.compression_level)
+
+    writer = BufferedDatasetWriter(dset, max_rows=args.buffer_rows, \
+        max_bytes=int(args.buffer_mb * 1048576), written=dataCount)
+
+    lastCheckpoint = time.time()
+
+    # whether the transform stage should hand over a resume point with its
+    # records (the scanner state is only copied when one is due)
+    def checkpointDue():
+        nonlocal lastCheckpoint
+        if args.checkpoint_minutes <= 0 or \
+                time.time() - lastCheckpoint < args.checkpoint_minutes * 60:
+            return False
+        lastCheckpoint = time.time()
+        return True
+
+    def saveCheckpoint(resume):
+        offset, (state, carry, pieces) = resume
+        pending = b''.join(pieces)
+        # the bytes the scanner holds go to the dataset the last checkpoint
+        # does not refer to, which a run that dies before this checkpoint is
+        # recorded leaves intact
+        name = 'checkpoint_pending_0'
+        if f.attrs.get('checkpoint_pending') == name:
+            name = 'checkpoint_pending_1'
+        if name in f:
+            del f[name]
+        f.create_dataset(name, data=np.frombuffer(pending + carry, dtype='u1'))
+        write_checkpoint(f, writer, mode=mode, offset=offset, state=state, \
+            pending=name, pieces_bytes=len(pending), complete=False)
+
+    logger.info('Beginning input file iteration...')
+
+    # writer stage: append (records, input position, resume point or None)
+    # items to the dataset
+    def writeRecords(item):
+        nonlocal dataCount
+        records, pos, resume = item
+        for results in records:
+            if dataCount % 100 == 0:
+                rss = process.memory_info().rss / 1048576.0
+                if not args.disable_progress:
+                    sys.stderr.write( \
+                        '\rDump data: IDX=%d, POS=%d/%d (%.2f%%), MEM=%.2fMB' % \
+                        (dataCount+1, pos, file_len, 100.0 * pos/file_len, rss))
+                else:
+                    sys.stderr.write('\rDump data: IDX=%d, MEM=%.2fMB' % \
+                        (dataCount+1, rss))
+
+            writer.append(results)
+            dataCount += 1
+
+            #if dataCount >= 100: # stop early for testing
+            #    break
+
+        if resume is not None:
+            saveCheckpoint(resume)
+
+    # transform stage: decode (unless already decoded) and process records
+    def processRecords(records, decode=True):
+        if decode:
+            records = (decode_record(record, args.encoding, \
+                args.split_token_end) for record in records)
+        return [results for results in map(processData, records) if results]
+
+    if args.parallel_workers > 0:
+        offsets = None
+        if args.multistream_index:
+            offsets = parallel_bz2.read_multistream_index(args.multistream_index)
+
+        # records come decompressed, split and decoded from the worker pool
+        read = parallel_bz2.iter_records(args.input_file, \
+            args.split_token_start, args.split_token_end, args.encoding, \
+            args.parallel_workers, offsets=offsets, range_mb=args.range_mb, \
+            resume=resume)
+        transform = lambda item: (processRecords(item[0], decode=False), \
+            item[1], (item[1], item[2]) if checkpointDue() else None)
+        readSize = lambda item: sum(len(record) for record in item[0]) / 1048576.0
     else:
-        if args.split_token_end in ln:
-            lastData += ln.split(args.split_token_end)[0].strip() + \
-                args.split_token_end
-            results = processData(lastData)
-            if results:
-                if dset.size <= dataCount:
-                    dset.resize((dataCount+128, ))
-
-                dset[dataCount] = results
-                dataCount += 1
-            lastData = ''
+        scanner = RecordScanner(splitTokenStart, splitTokenEnd)
+        start = 0
+        if resume is not None:
+            start, state = resume
+            scanner.set_state(state)
+
+        if mm is not None:
+            # scan in place, handing over batches of raw records
+            read = ((batch, scanner.position, \
+                (scanner.position, scanner.snapshot()) \
+                if checkpointDue() else None) for batch in \
+                iter_batches(scanner.scan(mm, start), 1024))
+            transform = lambda item: (processRecords(item[0]), item[1], item[2])
+            readSize = lambda item: sum(len(record) for record in item[0]) / \
+                1048576.0
         else:
-            lastData += ln
-
-    #if dataCount >= 100: # stop early for testing
-    #    break
-
-    ln = infile.readline()
-
-sys.stderr.write('\n')
-sys.stderr.flush()
-
-logger.info('File iteration complete.')
-
-# eventually resize down to actual data count
-dset.resize((dataCount, ))
-
-f.close()
-
-logger.info('Output %d objects to %s:%s' % (dataCount, outputFn, \
-    args.dataset_name))
+            # decompress blocks in the reader thread; records crossing blocks
+            # are kept as pieces by the scanner
+            blockSize = int(args.block_mb * 1048576)
+            if start > 0:
+                logger.info('Skipping %d decompressed bytes' % start)
+                infile.seek(start)
+            read = ((block, rawfile.tell(), infile.tell()) for block in \
+                iter(lambda: infile.read(blockSize), b''))
+            transform = lambda item: (processRecords(scanner.scan(item[0])), \
+                item[1], (item[2], scanner.snapshot()) \
+                if checkpointDue() else None)
+            readSize = lambda item: len(item[0]) / 1048576.0
+
+    Pipeline(read, transform, writeRecords, queue_size=args.queue_size, \
+        read_size=readSize, report_seconds=args.report_seconds, \
+        logger=logger).run()
+
+    sys.stderr.write('\n')
+    sys.stderr.flush()
+
+    logger.info('File iteration complete.')
+
+    # flush and eventually resize down to actual data count
+    writer.close()
+    if args.checkpoint_minutes > 0 or args.resume:
+        finish_checkpoint(f)
+
+    f.close()
+
+    if mm is not None:
+        mm.close()
+    if infile is not None:
+        infile.close()
+    if rawfile is not None:
+        rawfile.close()
+
+    logger.info('Output %d objects to %s:%s' % (dataCount, outputFn, \
+        args.dataset_name))
+
+
+if __name__ == '__main__':
+    main()
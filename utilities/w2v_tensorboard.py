@@ -2,14 +2,37 @@
 Output Little-Endian bytes and labels file from gensim model
 Also outputs necessary json config file portion
 For use with TensorBoard
+
+The vectors are taken from the model as one matrix: the .bytes file is a
+single float32 dump of it, and the .tsv is formatted a block of rows at a
+time, so exporting a large model takes seconds rather than hours. Rows are
+in the model's index order (most frequent words first). embedding_store.py
+reads the .bytes and labels files back for lookups and similarity queries.
+
+TensorBoard's projector slows down above a few hundred thousand points:
+--min-count, --top-n and --sample (applied in this order) export a subset
+of the words, and --pca-dims projects the vectors onto their first
+principal components. Both run on the vector matrix a block of rows at a
+time, so the memory used beyond the model itself stays within --memory-mb.
+
+--dtype float16 or int8 (one float32 scale per row, in _scales.bytes)
+writes a smaller quantized matrix instead of the .bytes and .tsv files, for
+embedding_store.py rather than TensorBoard, and reports how far cosine
+similarities move: between each row and its quantized version, and between
+random pairs of rows before and after quantization.
+
+Example:
+
+$ python3 w2v_tensorboard.py /tmp/ko_wiki.w2v --top-n 200000 --pca-dims 50
 '''
 
 import os
 import sys
-import struct
 import logging
 import argparse
+import numpy as np
 from gensim.models import Word2Vec, Doc2Vec
+from embedding_store import tensors_filename, write_quantized
 # necessary for seeing logs
 
 logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', \
@@ -23,80 +46,222 @@ parser.add_argument('input_file', type=str,
                     help='Input word2vec model file')
 #parser.add_argument('output_file', type=str,
 #                    help='Base output filename of TensorBoard data files')
+parser.add_argument('--min-count', type=int, default=0,
+                    help='Only export words occurring at least this often \
+                    (default: 0, all)')
+parser.add_argument('--top-n', type=int, default=0,
+                    help='Only export the N most frequent words \
+                    (default: 0, all)')
+parser.add_argument('--sample', type=int, default=0,
+                    help='Export a random sample of N of the remaining words \
+                    (default: 0, all)')
+parser.add_argument('--seed', type=int, default=0,
+                    help='Random seed of --sample (default: 0)')
+parser.add_argument('--pca-dims', type=int, default=0,
+                    help='Project the vectors onto this many principal \
+                    components (default: 0, keep all dimensions)')
+parser.add_argument('--dtype', type=str, default='float32',
+                    choices=('float32', 'float16', 'int8'),
+                    help='Vector format: "float32" writes the TensorBoard \
+                    .bytes and .tsv files, "float16" and "int8" (scaled per \
+                    row) a quantized matrix only (default: "float32")')
+parser.add_argument('--memory-mb', type=float, default=256.0,
+                    help='Memory (MB) for the blocks of rows processed at a \
+                    time, besides the model itself (default: 256)')
 
 args = parser.parse_args()
 
-w2vmodel = Word2Vec.load(args.input_file)
+def get_vectors(model):
+    '''
+    (words in row order, word counts, vector matrix) of a gensim model,
+    for gensim 4 (index_to_key) as well as earlier versions (vocab)
+    '''
+    wv = getattr(model, 'wv', model)
+    if hasattr(wv, 'index_to_key'):
+        words = list(wv.index_to_key)
+        counts = np.array([wv.get_vecattr(wd, 'count') for wd in words], \
+            dtype=np.int64)
+    else:
+        vocab = wv.vocab
+        words = [None] * len(vocab)
+        counts = np.zeros(len(vocab), dtype=np.int64)
+        for wd, v in vocab.items():
+            words[v.index] = wd
+            counts[v.index] = v.count
+    vectors = wv.vectors if hasattr(wv, 'vectors') else wv.syn0
+    return words, counts, vectors
 
-try:
-    vocab = w2vmodel.vocab
-except:
-    vocab = w2vmodel.wv.vocab
+def select_rows(counts, min_count=0, top_n=0, sample=0, seed=0):
+    '''
+    Sorted indices of the rows to export, or None for all of them
+    '''
+    if min_count <= 0 and top_n <= 0 and sample <= 0:
+        return None
+    rows = np.arange(len(counts))
+    if min_count > 0:
+        rows = rows[counts >= min_count]
+    if 0 < top_n < len(rows):
+        rows = np.sort(rows[np.argsort(-counts[rows], kind='stable')[:top_n]])
+    if 0 < sample < len(rows):
+        rows = np.sort(np.random.default_rng(seed).choice(rows, sample, \
+            replace=False))
+    return rows
 
-num_rows = len(vocab)
+def iter_blocks(vectors, rows, block_rows, mean=None, components=None):
+    '''
+    Blocks of up to block_rows of the selected rows (all rows if rows is
+    None), projected onto the principal components if given
+    '''
+    num_rows = vectors.shape[0] if rows is None else len(rows)
+    for start in range(0, num_rows, block_rows):
+        if rows is None:
+            block = vectors[start:start + block_rows]
+        else:
+            block = vectors[rows[start:start + block_rows]]
+        if components is not None:
+            block = (block - mean) @ components
+        yield block
 
-dim = w2vmodel.vector_size
+def fit_pca(vectors, rows, block_rows, pca_dims):
+    '''
+    (mean, components, explained variance ratio) of the first pca_dims
+    principal components of the selected rows, from the covariance matrix
+    accumulated a block at a time
+    '''
+    dim = vectors.shape[1]
+    total = np.zeros(dim)
+    scatter = np.zeros((dim, dim))
+    n = 0
+    for block in iter_blocks(vectors, rows, block_rows):
+        block = block.astype(np.float64)
+        total += block.sum(axis=0)
+        scatter += block.T @ block
+        n += len(block)
 
-try:
-    base_fn = args.input_file.split('/')[-1]
-except:
-    base_fn = args.input_file.split('\\')[-1]
+    mean = total / n
+    covariance = (scatter - n * np.outer(mean, mean)) / max(1, n - 1)
+    eigvals, eigvecs = np.linalg.eigh(covariance)
+    order = np.argsort(eigvals)[::-1][:pca_dims]
+    components = eigvecs[:, order]
+    # eigenvector signs are arbitrary: make the largest loading positive
+    largest = components[np.abs(components).argmax(axis=0), \
+        np.arange(components.shape[1])]
+    components *= np.where(largest < 0, -1.0, 1.0)
+    return mean, components, eigvals[order].sum() / max(eigvals.sum(), 1e-30)
 
-assert len(base_fn) > 0
+def write_tensors(bytes_fd, tsv_fd, blocks, num_rows, dim):
+    '''
+    Write each block as little-endian float32 to bytes_fd, and as
+    tab-separated '%.8f' values to tsv_fd, one line per row (no newline
+    after the last one)
+    '''
+    row_fmt = '\t'.join(['%.8f'] * dim)
+    done = 0
+    for block in blocks:
+        block = block.astype('<f4', copy=False)
+        block.tofile(bytes_fd)
+        if done > 0:
+            tsv_fd.write('\n')
+        tsv_fd.write('\n'.join([row_fmt] * len(block)) % \
+            tuple(block.astype(np.float64).ravel().tolist()))
+        done += len(block)
+        sys.stderr.write('\rDump vectors: %d/%d (%.2f%%)' % \
+            (done, num_rows, 100.0 * done / num_rows))
 
-tensor_bytes_out_fn = '%s_%d_%dd_tensors.bytes' % (base_fn, num_rows, dim)
-tensor_tsv_out_fn = '%s_%d_%dd_tensors.tsv' % (base_fn, num_rows, dim)
-labels_out_fn = '%s_%d_%dd_labels.tsv' % (base_fn, num_rows, dim)
+def iter_progress(blocks, num_rows):
+    '''
+    Pass blocks through, reporting the rows done after each one
+    '''
+    done = 0
+    for block in blocks:
+        yield block
+        done += len(block)
+        sys.stderr.write('\rDump vectors: %d/%d (%.2f%%)' % \
+            (done, num_rows, 100.0 * done / num_rows))
 
-tensor_bytes_out = open(tensor_bytes_out_fn, 'wb')
+w2vmodel = Word2Vec.load(args.input_file)
 
-try:
-    labels_out = open(labels_out_fn, 'w', encoding='utf-8')
-except:
-    labels_out = open(labels_out_fn, 'w')
+words, counts, vectors = get_vectors(w2vmodel)
+
+assert vectors.shape[0] == len(words)
+assert not any('\t' in wd for wd in words)
+
+rows = select_rows(counts, min_count=args.min_count, top_n=args.top_n, \
+    sample=args.sample, seed=args.seed)
+if rows is not None:
+    words = [words[i] for i in rows.tolist()]
+    counts = counts[rows]
+    logging.info('Exporting %d of %d words' % (len(rows), vectors.shape[0]))
+
+num_rows = len(words)
+dim = vectors.shape[1]
+assert num_rows > 0, 'no words selected'
+
+# a formatted .tsv value costs about 64 bytes while its block is written
+block_rows = max(1, int(args.memory_mb * 1048576) // (64 * dim))
+
+mean = None
+components = None
+if 0 < args.pca_dims < dim:
+    mean, components, explained = fit_pca(vectors, rows, block_rows, \
+        args.pca_dims)
+    dim = args.pca_dims
+    logging.info('%d principal components explain %.2f%% of the variance' % \
+        (dim, 100.0 * explained))
 
 try:
-    tensor_tsv_out = open(tensor_tsv_out_fn, 'w', encoding='utf-8')
+    base_fn = args.input_file.split('/')[-1]
 except:
-    tensor_tsv_out = open(tensor_tsv_out_fn, 'w')
-
-labels_out.write('word\tcount\n')
+    base_fn = args.input_file.split('\\')[-1]
 
-for i, wd in enumerate(vocab):
-    if i % 100 == 0:
-        sys.stderr.write('\rDump vocabulary: %d/%d (%.2f%%)' % \
-            (i+1, num_rows, 100.0 * (i+1) / num_rows))
+assert len(base_fn) > 0
 
-    floatvals = w2vmodel[wd].tolist()
-    assert dim == len(floatvals)
-    assert '\t' not in wd
+out_base_fn = '%s_%d_%dd' % (base_fn, num_rows, dim)
+tensor_bytes_out_fn = tensors_filename(out_base_fn, args.dtype)
+tensor_tsv_out_fn = out_base_fn + '_tensors.tsv'
+scales_out_fn = out_base_fn + '_scales.bytes'
+labels_out_fn = out_base_fn + '_labels.tsv'
 
-    if i > 0:
-        tensor_tsv_out.write('\n')
+with open(labels_out_fn, 'w', encoding='utf-8') as labels_out:
+    labels_out.write('word\tcount\n')
+    labels_out.writelines('%s\t%d\n' % (wd, count) \
+        for wd, count in zip(words, counts.tolist()))
 
-    for f_i, f in enumerate(floatvals):
-        tensor_bytes_out.write(struct.pack('<f', f))
-        
-        if f_i > 0:
-            tensor_tsv_out.write('\t%.8f' % f)
-        else:
-            tensor_tsv_out.write('%.8f' % f)
+blocks = iter_blocks(vectors, rows, block_rows, mean, components)
 
-    try:
-        labels_out.write('%s\t%s\n' % (wd, vocab[wd].count))
-    except:
-        labels_out.write(('%s\t%s\n' % (wd, vocab[wd].count)).encode('utf-8'))
+if args.dtype == 'float32':
+    with open(tensor_bytes_out_fn, 'wb') as tensor_bytes_out, \
+            open(tensor_tsv_out_fn, 'w', encoding='utf-8') as tensor_tsv_out:
+        write_tensors(tensor_bytes_out, tensor_tsv_out, blocks, num_rows, dim)
+else:
+    with open(tensor_bytes_out_fn, 'wb') as tensor_bytes_out, \
+            open(scales_out_fn if args.dtype == 'int8' else os.devnull, \
+            'wb') as scales_out:
+        row_errors, pair_errors, null_rows = write_quantized( \
+            tensor_bytes_out, scales_out, iter_progress(blocks, num_rows), \
+            args.dtype, seed=args.seed)
 
 sys.stderr.write('\n')
 sys.stderr.flush()
 
-tensor_bytes_out.close()
-tensor_tsv_out.close()
-labels_out.close()
+if args.dtype != 'float32':
+    # against the exported float32 vectors (after --pca-dims, if given)
+    if len(row_errors) > 0:
+        logging.info('%s cosine error of rows: mean %.3e, max %.3e' % \
+            (args.dtype, row_errors.mean(), row_errors.max()))
+    if null_rows > 0:
+        logging.info('%d null rows left out of the cosine error of rows' % \
+            null_rows)
+    logging.info('%s cosine similarity error of %d random pairs: ' \
+        'mean %.3e, max %.3e' % (args.dtype, len(pair_errors), \
+        pair_errors.mean(), pair_errors.max()))
+    logging.info('Wrote %s (%.2fMB)' % (tensor_bytes_out_fn, \
+        os.path.getsize(tensor_bytes_out_fn) / 1048576.0))
 
-# projector file
+# projector file (TensorBoard only reads float32 tensors)
 
-print('''{
+if args.dtype == 'float32':
+    print('''{
   "embeddings": [
     {
       "tensorName": "%s",